@@ -1,7 +1,7 @@
 import json
 import pickle
 import sys
-from collections import Iterator
+from collections.abc import Iterator
 from typing import List, Dict, Any
 
 import gym
@@ -10,17 +10,20 @@ import torch
 import torch.nn as nn
 
 from dialogue_config import map_index_to_action, AGENT_ACTIONS
-from error_model_controller import ErrorModelController
+from error_model_controller import ErrorModelController, ErrorNoiseEngine
+from rng_registry import RNGRegistry, init_linear_layers
 from rulebased_agent import RuleBasedAgent
 from state_tracker import StateTracker
 from user_simulator import UserSimulator, UserGoal
 from utils import remove_empty_slots
 
 
-def mix_in_some_random_actions(policy_actions, eps, num_actions):
+def mix_in_some_random_actions(policy_actions, eps, num_actions, generator=None):
     if eps > 0.0:
-        random_actions = torch.randint_like(policy_actions, num_actions)
-        selector = torch.rand_like(random_actions, dtype=torch.float32)
+        random_actions = torch.randint(
+            num_actions, policy_actions.shape, generator=generator
+        )
+        selector = torch.rand(policy_actions.shape, generator=generator)
         actions = torch.where(selector > eps, policy_actions, random_actions)
     else:
         actions = policy_actions
@@ -28,10 +31,11 @@ def mix_in_some_random_actions(policy_actions, eps, num_actions):
 
 
 class DialogManagerAgent(nn.Module):
-    def __init__(self, obs_space, action_space):
+    def __init__(self, obs_space, action_space, init_generator=None):
         super().__init__()
         self.num_actions = action_space.n
         self.exploration_rate = 1.0
+        self.generator = None
         n_hid = 32
         self.nn = nn.Sequential(
             *[
@@ -42,6 +46,8 @@ class DialogManagerAgent(nn.Module):
                 nn.Linear(n_hid, self.num_actions),
             ]
         )
+        if init_generator is not None:
+            init_linear_layers(self, init_generator)
 
     def calc_q_values(self, obs_batch):
         observation_tensor = torch.tensor(obs_batch, dtype=torch.float)
@@ -52,7 +58,7 @@ class DialogManagerAgent(nn.Module):
         q_values = self.calc_q_values(obs_batch)
         policy_actions = q_values.argmax(dim=1)
         actions = mix_in_some_random_actions(
-            policy_actions, self.exploration_rate, self.num_actions
+            policy_actions, self.exploration_rate, self.num_actions, self.generator
         )
         return actions
 
@@ -76,13 +82,38 @@ class DialogEnv(gym.Env):
     ) -> None:
 
         self.user = UserSimulator(user_goals, max_round_num)
-        self.emc = ErrorModelController(slot2values, emc_params)
+        # "batched" switches to the numpy-based noise engine, whose stream differs from the controller's
+        if emc_params.get("batched", False):
+            self.emc = ErrorNoiseEngine(slot2values, emc_params)
+        else:
+            self.emc = ErrorModelController(slot2values, emc_params)
         self.state_tracker = StateTracker(database, max_round_num)
 
         self.action_space = gym.spaces.Discrete(len(AGENT_ACTIONS))
         self.observation_space = gym.spaces.multi_binary.MultiBinary(
             self.state_tracker.get_state_size()
         )
+        self.rng_registry = None
+        self.episode = 0
+
+    def seed(self, seed=None, worker_id=0):
+        """
+        Gives the user simulator and the error model their own random streams.
+
+        After seeding, every reset re-derives the streams from (seed, worker_id, episode), so any episode can be
+        replayed exactly with reset(episode=...).
+        """
+        self.rng_registry = RNGRegistry(seed, worker_id)
+        self.episode = 0
+        return [self.rng_registry.seed]
+
+    def _seed_episode(self, episode: int):
+        self.user.rng = self.rng_registry.random("user", episode)
+        self.user.goal_pool.rng = self.rng_registry.generator("user_goals", episode)
+        if isinstance(self.emc, ErrorNoiseEngine):
+            self.emc.rng = self.rng_registry.generator("emc", episode)
+        else:
+            self.emc.rng = self.rng_registry.random("emc", episode)
 
     def step(self, agent_action_index: int):
         agent_action = map_index_to_action(agent_action_index)
@@ -94,7 +125,13 @@ class DialogEnv(gym.Env):
         next_state = self.state_tracker.get_state(done)
         return next_state, reward, done, success
 
-    def reset(self):
+    def reset(self, episode: int = None):
+        if episode is not None:
+            self.episode = episode
+        if self.rng_registry is not None:
+            self._seed_episode(self.episode)
+        self.episode += 1
+
         self.state_tracker.reset()
         init_user_action = self.user.reset()
         self.emc.infuse_error(init_user_action)
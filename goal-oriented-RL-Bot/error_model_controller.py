@@ -1,13 +1,17 @@
 import random
 from typing import Dict, List
 
+import numpy as np
+
 from dialogue_config import usersim_intents, DialogAction
+from utils import convert_list_to_dict
 
 
 class ErrorModelController:
-    def __init__(self, slot2values: Dict[str, List[str]], emc_params):
+    def __init__(self, slot2values: Dict[str, List[str]], emc_params, rng=None):
 
         self.slot2values = slot2values
+        self.rng = rng if rng is not None else random
         self.slot_error_prob = emc_params["slot_error_prob"]
         self.slot_error_mode = emc_params["slot_error_mode"]  # [0, 3]
         self.intent_error_prob = emc_params["intent_error_prob"]
@@ -28,7 +32,7 @@ class ErrorModelController:
         informs_dict = action.inform_slots
         for key in list(action.inform_slots.keys()):
             assert key in self.slot2values
-            if random.random() < self.slot_error_prob:
+            if self.rng.random() < self.slot_error_prob:
                 if self.slot_error_mode == 0:  # replace the slot_value only
                     self._slot_value_noise(key, informs_dict)
                 elif self.slot_error_mode == 1:  # replace slot and its values
@@ -36,15 +40,15 @@ class ErrorModelController:
                 elif self.slot_error_mode == 2:  # delete the slot
                     self._slot_remove(key, informs_dict)
                 else:  # Combine all three
-                    rand_choice = random.random()
+                    rand_choice = self.rng.random()
                     if rand_choice <= 0.33:
                         self._slot_value_noise(key, informs_dict)
                     elif rand_choice > 0.33 and rand_choice <= 0.66:
                         self._slot_noise(key, informs_dict)
                     else:
                         self._slot_remove(key, informs_dict)
-        if random.random() < self.intent_error_prob:  # add noise for intent level
-            action.intent = random.choice(self.intents)
+        if self.rng.random() < self.intent_error_prob:  # add noise for intent level
+            action.intent = self.rng.choice(self.intents)
 
     def _slot_value_noise(self, key, informs_dict):
         """
@@ -55,7 +59,7 @@ class ErrorModelController:
             informs_dict (dict)
         """
 
-        informs_dict[key] = random.choice(self.slot2values[key])
+        informs_dict[key] = self.rng.choice(self.slot2values[key])
 
     def _slot_noise(self, key, informs_dict):
         """
@@ -67,8 +71,8 @@ class ErrorModelController:
         """
 
         informs_dict.pop(key)
-        random_slot = random.choice(list(self.slot2values.keys()))
-        informs_dict[random_slot] = random.choice(self.slot2values[random_slot])
+        random_slot = self.rng.choice(list(self.slot2values.keys()))
+        informs_dict[random_slot] = self.rng.choice(self.slot2values[random_slot])
 
     def _slot_remove(self, key, informs_dict):
         """
@@ -80,3 +84,87 @@ class ErrorModelController:
         """
 
         informs_dict.pop(key)
+
+
+class ErrorNoiseEngine:
+    """
+    Batched counterpart of the ErrorModelController.
+
+    Slot names and per-slot values are precomputed into arrays once. All random decisions for a batch of user actions
+    are drawn from a numpy Generator in a single call, so the injected noise is bit-reproducible given the seed and
+    the sequence of batches.
+    """
+
+    # columns of the per-slot draws
+    _ERROR, _MODE, _SLOT, _VALUE = range(4)
+
+    def __init__(
+        self,
+        slot2values: Dict[str, List[str]],
+        emc_params,
+        seed=None,
+        rng: np.random.Generator = None,
+    ):
+        self.slot_names = np.array(list(slot2values.keys()), dtype=object)
+        self.slot2id = convert_list_to_dict(list(slot2values.keys()))
+        self.slot_values = [
+            np.array(values, dtype=object) for values in slot2values.values()
+        ]
+        self.num_values = np.array([len(values) for values in self.slot_values])
+        self.slot_error_prob = emc_params["slot_error_prob"]
+        self.slot_error_mode = emc_params["slot_error_mode"]  # [0, 3]
+        self.intent_error_prob = emc_params["intent_error_prob"]
+        self.intents = np.array(usersim_intents, dtype=object)
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+
+    def infuse_error(self, action: DialogAction):
+        self.infuse_error_batch([action])
+
+    def infuse_error_batch(self, actions: List[DialogAction]):
+        """
+        Adds value, slot or delete noise to the inform slots and intent noise to every action, in place.
+
+        Parameters:
+            actions (list): DialogActions of the user, one per dialogue
+        """
+
+        action_idx = [i for i, a in enumerate(actions) for _ in a.inform_slots]
+        keys = [key for a in actions for key in a.inform_slots]
+        assert all(key in self.slot2id for key in keys)
+
+        draws = self.rng.random((len(keys) + len(actions), 4))
+        slot_draws, intent_draws = draws[: len(keys)], draws[len(keys) :]
+
+        slot_ids = np.array([self.slot2id[key] for key in keys], dtype=np.int64)
+        modes = self._error_modes(slot_draws[:, self._MODE])
+        random_slots = (slot_draws[:, self._SLOT] * len(self.slot_names)).astype(
+            np.int64
+        )
+        value_slots = np.where(modes == 1, random_slots, slot_ids)
+        value_ids = (slot_draws[:, self._VALUE] * self.num_values[value_slots]).astype(
+            np.int64
+        )
+
+        for k in np.flatnonzero(slot_draws[:, self._ERROR] < self.slot_error_prob):
+            informs_dict = actions[action_idx[k]].inform_slots
+            if modes[k] == 0:  # replace the slot_value only
+                informs_dict[keys[k]] = self.slot_values[slot_ids[k]][value_ids[k]]
+            elif modes[k] == 1:  # replace slot and its values
+                informs_dict.pop(keys[k])
+                random_slot = random_slots[k]
+                informs_dict[self.slot_names[random_slot]] = self.slot_values[
+                    random_slot
+                ][value_ids[k]]
+            else:  # delete the slot
+                informs_dict.pop(keys[k])
+
+        flip = intent_draws[:, self._ERROR] < self.intent_error_prob
+        new_intents = (intent_draws[:, self._MODE] * len(self.intents)).astype(np.int64)
+        for i in np.flatnonzero(flip):
+            actions[i].intent = self.intents[new_intents[i]]
+
+    def _error_modes(self, mode_draws: np.ndarray) -> np.ndarray:
+        if self.slot_error_mode in (0, 1, 2):
+            return np.full(len(mode_draws), self.slot_error_mode)
+        # Combine all three
+        return np.digitize(mode_draws, [0.33, 0.66], right=True)
@@ -0,0 +1,68 @@
+import math
+import random
+import zlib
+
+import numpy as np
+
+
+class RNGRegistry:
+    """
+    Hands out independent random streams, one per (worker, component, episode).
+
+    Streams are derived from the root seed with numpy SeedSequence spawn keys, so a stream only depends on its key and
+    never on how many other streams were requested before it. numpy streams use the counter-based Philox bit
+    generator, components written against the `random` module get a `random.Random` seeded from the same key.
+    Re-creating the streams of an episode replays it exactly.
+
+    Parameters:
+        seed (int): Root seed, fresh OS entropy if None
+        worker_id (int): Id of the env or worker this registry belongs to
+    """
+
+    def __init__(self, seed=None, worker_id: int = 0):
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.worker_id = worker_id
+
+    def spawn(self, worker_id: int) -> "RNGRegistry":
+        return RNGRegistry(self.seed, worker_id)
+
+    def seed_sequence(self, name: str, episode: int = None) -> np.random.SeedSequence:
+        spawn_key = (self.worker_id, zlib.crc32(name.encode()))
+        if episode is not None:
+            spawn_key += (episode,)
+        return np.random.SeedSequence(self.seed, spawn_key=spawn_key)
+
+    def generator(self, name: str, episode: int = None) -> np.random.Generator:
+        return np.random.Generator(np.random.Philox(self.seed_sequence(name, episode)))
+
+    def random(self, name: str, episode: int = None) -> random.Random:
+        state = self.seed_sequence(name, episode).generate_state(4)
+        return random.Random(int.from_bytes(state.tobytes(), "little"))
+
+    def torch_generator(self, name: str, episode: int = None):
+        import torch
+
+        state = self.seed_sequence(name, episode).generate_state(2)
+        seed = int.from_bytes(state.tobytes(), "little") & ((1 << 63) - 1)
+        return torch.Generator().manual_seed(seed)
+
+
+def init_linear_layers(module, generator):
+    """
+    Re-initializes the nn.Linear layers of a module like their default init does, but draws from the given
+    torch.Generator instead of torch's global stream, so that seeded agents start from the same weights.
+
+    Parameters:
+        module (torch.nn.Module)
+        generator (torch.Generator): e.g. RNGRegistry.torch_generator("agent_init")
+    """
+    import torch
+
+    for layer in module.modules():
+        if isinstance(layer, torch.nn.Linear):
+            torch.nn.init.kaiming_uniform_(
+                layer.weight, a=math.sqrt(5), generator=generator
+            )
+            if layer.bias is not None:
+                bound = 1 / math.sqrt(layer.in_features) if layer.in_features else 0
+                torch.nn.init.uniform_(layer.bias, -bound, bound, generator=generator)
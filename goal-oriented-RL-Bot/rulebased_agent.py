@@ -3,9 +3,10 @@ from dialogue_config import RULE_REQUESTS, AGENT_ACTIONS, DialogAction
 
 
 class RuleBasedAgent:
-    def __init__(self, eps):
+    def __init__(self, eps, rng=None):
 
         self.eps = eps
+        self.rng = rng if rng is not None else random
         self.possible_actions = AGENT_ACTIONS
         self.num_actions = len(self.possible_actions)
         self.reset()
@@ -15,8 +16,8 @@ class RuleBasedAgent:
         self.rule_phase = "not done"
 
     def step(self, _):
-        if self.eps > random.random():
-            action = random.randint(0, self.num_actions - 1)
+        if self.eps > self.rng.random():
+            action = self.rng.randint(0, self.num_actions - 1)
         else:
             action = self._rule_action()
         return action
@@ -40,7 +41,7 @@ class RuleBasedAgent:
 
 
 def map_action_to_index(response):
-    for (i, action) in enumerate(AGENT_ACTIONS):
+    for i, action in enumerate(AGENT_ACTIONS):
         if response == action:
             return i
     raise ValueError("Response: {} not found in possible actions".format(response))
@@ -1,7 +1,7 @@
 import json
 import pickle
 import sys
-from collections import Iterator
+from collections.abc import Iterator
 from typing import List, Dict, Any
 
 import gym
@@ -11,16 +11,19 @@ import torch.nn as nn
 
 from dialogue_config import map_index_to_action, AGENT_ACTIONS
 from error_model_controller import ErrorModelController
+from rng_registry import init_linear_layers
 from rulebased_agent import RuleBasedAgent
 from state_tracker import StateTracker
 from user_simulator import UserSimulator, UserGoal
 from utils import remove_empty_slots
 
 
-def mix_in_some_random_actions(policy_actions, eps, num_actions):
+def mix_in_some_random_actions(policy_actions, eps, num_actions, generator=None):
     if eps > 0.0:
-        random_actions = torch.randint_like(policy_actions, num_actions)
-        selector = torch.rand_like(random_actions, dtype=torch.float32)
+        random_actions = torch.randint(
+            num_actions, policy_actions.shape, generator=generator
+        )
+        selector = torch.rand(policy_actions.shape, generator=generator)
         actions = torch.where(selector > eps, policy_actions, random_actions)
     else:
         actions = policy_actions
@@ -28,14 +31,17 @@ def mix_in_some_random_actions(policy_actions, eps, num_actions):
 
 
 class DialogAgent(nn.Module):
-    def __init__(self, obs_dim, num_actions, n_hid=32):
+    def __init__(self, obs_dim, num_actions, n_hid=32, init_generator=None):
         # obs_space.shape[0]
         super().__init__()
         self.num_actions = num_actions
         self.exploration_rate = 1.0
+        self.generator = None
         self.nn = nn.Sequential(
             *[nn.Linear(obs_dim, n_hid), nn.ReLU(), nn.Linear(n_hid, self.num_actions)]
         )
+        if init_generator is not None:
+            init_linear_layers(self, init_generator)
 
     def calc_q_values(self, obs_batch):
         observation_tensor = torch.tensor(obs_batch, dtype=torch.float)
@@ -46,7 +52,7 @@ class DialogAgent(nn.Module):
         q_values = self.calc_q_values(obs_batch)
         policy_actions = q_values.argmax(dim=1)
         actions = mix_in_some_random_actions(
-            policy_actions, self.exploration_rate, self.num_actions
+            policy_actions, self.exploration_rate, self.num_actions, self.generator
         )
         return actions
 
@@ -1,22 +1,29 @@
+import random
 from dataclasses import dataclass
-from typing import Dict, NamedTuple, Union
+from typing import Dict, List
 
 import gym
 import numpy as np
 from db_query import DBQuery
-from dialogue_config import map_index_to_action, AGENT_ACTIONS
+from dialogue_config import FAIL, SUCCESS, NO_OUTCOME
+from rng_registry import RNGRegistry
+from user_goal_pool import UserGoal, UserGoalPool
+from utils import convert_list_to_dict, reward_function
 
 BOT = "BOT"
 USER = "USER"
+ROLES = [BOT, USER]
 # intents
 BYE = "BYE"
-DBREQUEST='DBREQUEST'
-OFFER='OFFER'
+DBREQUEST = "DBREQUEST"
+OFFER = "OFFER"
 REQUEST = "REQUEST"
 INFORM = "INFORM"
 
 all_intents = [BYE, REQUEST, INFORM]
 
+ANYTHING = "anything"
+
 
 @dataclass
 class DialogAction:
@@ -27,187 +34,240 @@ class DialogAction:
     speaker: str = None
 
 
-class DialogEnv(gym.Env):
-    def __init__(self, max_round_num: int, database: Dict, slot2values: Dict) -> None:
+def one_hot(indices: np.ndarray, size: int) -> np.ndarray:
+    """One-hot encodes an int array of any shape along a new last axis, index -1 gives all zeros."""
+    return np.eye(size + 1, dtype=np.float32)[indices + 1][..., 1:]
 
-        inform_actions = [DialogAction(INFORM, slot) for slot in slot2values.keys()]
-        request_actions = [DialogAction(REQUEST, slot) for slot in slot2values.keys()]
 
-        ACTIONS = [DialogAction(BYE)] + inform_actions + request_actions
+class DialogEnv(gym.Env):
+    """
+    Self-play environment in which a BOT and a USER policy talk to each other in N parallel dialogues.
+
+    Every dialogue starts with the USER and then alternates. step takes one action array per role, each dialogue only
+    uses the action of the role whose turn it is (see `speakers`), so both policies can simply act on their whole
+    observation batch. Finished dialogues are reset right away with a fresh user goal.
+
+    The USER knows its goal (inform slots and values, request slots), the BOT only sees what was said and how many
+    database entries match the constraints the user informed so far. A dialogue is successful if it is ended with BYE
+    after the user informed all goal constraints and the bot informed all requested slots. Both roles get the same
+    reward.
+    """
+
+    def __init__(
+        self,
+        user_goals: List[UserGoal],
+        max_round_num: int,
+        database: Dict,
+        slot2values: Dict,
+        num_dialogues: int = 1,
+    ) -> None:
+
+        self.slots = list(slot2values.keys())
+        self.num_slots = len(self.slots)
+        self.slots_dict = convert_list_to_dict(self.slots)
+        self.intents_dict = convert_list_to_dict(all_intents)
+        self.num_intents = len(all_intents)
 
-        self.state_tracker = StateTracker(database, max_round_num,list(slot2values.keys()))
-        self.action_space = gym.spaces.Discrete(len(ACTIONS))
-        self.observation_space = gym.spaces.multi_binary.MultiBinary(
-            self.state_tracker.get_state_size()
+        self.actions = (
+            [DialogAction(BYE)]
+            + [DialogAction(INFORM, slot) for slot in self.slots]
+            + [DialogAction(REQUEST, slot) for slot in self.slots]
+        )
+        self.action_intents = np.array(
+            [self.intents_dict[a.intent] for a in self.actions]
+        )
+        self.action_slots = np.array(
+            [self.slots_dict[a.slot] if a.slot else -1 for a in self.actions]
         )
 
-    def step(self, action: DialogAction):
-        if action.speaker == BOT:
-            self.state_tracker.update_state_agent(action)
-        else:
-            self.state_tracker.update_state_user(action)
-
-        done = action.intent == BYE
-        next_state = self.state_tracker.get_state(done)
-        return next_state, reward, done, success
-
-    def reset(self):
-        self.state_tracker.reset()
-        return self.state_tracker.get_state()
-
-
-class StateTracker:
-    def __init__(self, database, max_round_num,all_slots):
-
-        self.db_helper = DBQuery(database)
-        self.intents_dict = {i:intent for i,intent in enumerate(all_intents)}
-        self.num_intents = len(all_intents)
-        self.slots_dict = {i:x for i,x in enumerate(all_slots)}
-        self.num_slots = len(all_slots)
+        self.num_dialogues = num_dialogues
         self.max_round_num = max_round_num
-        self.none_state = np.zeros(self.get_state_size())
-        self.reset()
-
-    def get_state_size(self):
-        return 2 * self.num_intents + 7 * self.num_slots + 3 + self.max_round_num
-
-    def reset(self):
-        self.current_informs = {}
-        self.history = []
-        self.round_num = 0
-
-    def print_history(self):
-        for action in self.history:
-            print(action)
-
-    def get_state(self, done=False) -> np.ndarray:
-
-        if done:
-            return self.none_state
-
-        user_action: DialogAction = self.history[-1]
-        db_results_dict = self.db_helper.get_db_results_for_slots(self.current_informs)
-        last_agent_action: Union[DialogAction, None] = self.history[-2] if len(
-            self.history
-        ) > 1 else None
-
-        # Create one-hot of intents to represent the current user action
-        user_act_rep = np.zeros((self.num_intents,))
-        user_act_rep[self.intents_dict[user_action.intent]] = 1.0
-
-        # Create bag of inform slots representation to represent the current user action
-        user_inform_slots_rep = np.zeros((self.num_slots,))
-        for key in user_action.inform_slots.keys():
-            user_inform_slots_rep[self.slots_dict[key]] = 1.0
-
-        # Create bag of request slots representation to represent the current user action
-        user_request_slots_rep = np.zeros((self.num_slots,))
-        for key in user_action.request_slots.keys():
-            user_request_slots_rep[self.slots_dict[key]] = 1.0
-
-        # Create bag of filled_in slots based on the current_slots
-        current_slots_rep = np.zeros((self.num_slots,))
-        for key in self.current_informs:
-            current_slots_rep[self.slots_dict[key]] = 1.0
-
-        # Encode last agent intent
-        agent_act_rep = np.zeros((self.num_intents,))
-        if last_agent_action:
-            agent_act_rep[self.intents_dict[last_agent_action.intent]] = 1.0
-
-        # Encode last agent inform slots
-        agent_inform_slots_rep = np.zeros((self.num_slots,))
-        if last_agent_action and last_agent_action.inform_slots is not None:
-            for key in last_agent_action.inform_slots.keys():
-                agent_inform_slots_rep[self.slots_dict[key]] = 1.0
-
-        # Encode last agent request slots
-        agent_request_slots_rep = np.zeros((self.num_slots,))
-        if last_agent_action and last_agent_action.request_slots is not None:
-            for key in last_agent_action.request_slots.keys():
-                agent_request_slots_rep[self.slots_dict[key]] = 1.0
-
-        # Value representation of the round num
-        turn_rep = np.zeros((1,)) + self.round_num / 5.0
-
-        # One-hot representation of the round num
-        turn_onehot_rep = np.zeros((self.max_round_num,))
-        turn_onehot_rep[self.round_num - 1] = 1.0
-
-        # Representation of DB query results (scaled counts)
-        kb_count_rep = (
-            np.zeros((self.num_slots + 1,))
-            + db_results_dict["matching_all_constraints"] / 100.0
+        self.db_helper = DBQuery(database)
+        # seed() replaces this stream with one from the RNGRegistry
+        self.goal_pool = UserGoalPool(
+            user_goals,
+            slots=self.slots,
+            rng=np.random.default_rng(random.getrandbits(64)),
         )
-        for key in db_results_dict.keys():
-            if key in self.slots_dict:
-                kb_count_rep[self.slots_dict[key]] = db_results_dict[key] / 100.0
-
-        # Representation of DB query results (binary)
-        kb_binary_rep = np.zeros((self.num_slots + 1,)) + np.sum(
-            db_results_dict["matching_all_constraints"] > 0.0
+        self._compile_goal_masks()
+
+        self.obs_dims = {
+            BOT: 2 * (self.num_intents + self.num_slots)
+            + 2 * self.num_slots
+            + self.max_round_num
+            + 2,
+        }
+        self.obs_dims[USER] = self.obs_dims[BOT] + 2 * self.num_slots
+
+        self.action_space = gym.spaces.Discrete(len(self.actions))
+        self.observation_space = gym.spaces.Dict(
+            {
+                role: gym.spaces.Box(0.0, np.inf, (dim,), dtype=np.float32)
+                for role, dim in self.obs_dims.items()
+            }
+        )
+        self.rng_registry = None
+
+    def _compile_goal_masks(self):
+        pool = self.goal_pool
+        num_goals = len(pool)
+        self.goal_inform_masks = np.zeros((num_goals, self.num_slots), dtype=np.bool_)
+        rows, cols = np.nonzero(pool.inform_slot_ids >= 0)
+        slot_ids = pool.inform_slot_ids[rows, cols]
+        in_vocab = slot_ids < self.num_slots
+        self.goal_inform_masks[rows[in_vocab], slot_ids[in_vocab]] = True
+        self.goal_request_masks = pool.request_mask[:, : self.num_slots].copy()
+        # the user does not need to ask for what it already knows
+        self.goal_request_masks &= ~self.goal_inform_masks
+
+    def seed(self, seed=None, worker_id=0):
+        self.rng_registry = RNGRegistry(seed, worker_id)
+        self.goal_pool.rng = self.rng_registry.generator("user_goals")
+        return [self.rng_registry.seed]
+
+    def reset(self) -> Dict[str, np.ndarray]:
+        n = self.num_dialogues
+        self.goal_ids = np.zeros(n, dtype=np.int64)
+        self.goal_informs = np.zeros((n, self.num_slots), dtype=np.bool_)
+        self.goal_requests = np.zeros((n, self.num_slots), dtype=np.bool_)
+        self.informed = np.zeros((n, self.num_slots), dtype=np.bool_)
+        self.answered = np.zeros((n, self.num_slots), dtype=np.bool_)
+        # last intent and slot per dialogue, indexed by role (0: BOT, 1: USER)
+        self.last_intent = np.full((n, 2), -1, dtype=np.int64)
+        self.last_slot = np.full((n, 2), -1, dtype=np.int64)
+        self.round_num = np.zeros(n, dtype=np.int64)
+        self.speakers = np.zeros(n, dtype=np.int64)
+        self.current_informs = [{} for _ in range(n)]
+        self.bot_informs = [{} for _ in range(n)]
+        self.num_matches = np.zeros(n, dtype=np.float32)
+        self._reset_dialogues(np.arange(n))
+        return self._encode_observations()
+
+    def _reset_dialogues(self, idx: np.ndarray):
+        goal_ids = self.goal_pool.sample_batch(len(idx))
+        self.goal_ids[idx] = goal_ids
+        self.goal_informs[idx] = self.goal_inform_masks[goal_ids]
+        self.goal_requests[idx] = self.goal_request_masks[goal_ids]
+        self.informed[idx] = False
+        self.answered[idx] = False
+        self.last_intent[idx] = -1
+        self.last_slot[idx] = -1
+        self.round_num[idx] = 0
+        self.speakers[idx] = ROLES.index(USER)
+        for i in idx:
+            self.current_informs[i] = {}
+            self.bot_informs[i] = {}
+        self.num_matches[idx] = len(self.db_helper.database)
+
+    def step(self, actions: Dict[str, np.ndarray]):
+        """
+        Parameters:
+            actions (dict): role -> int array of action indices, one per dialogue
+
+        Returns:
+            tuple: observations (dict role -> array), rewards, dones, info with "success" and the "speaker" of the
+                   actions that were applied
+        """
+        idx = np.arange(self.num_dialogues)
+        speakers = self.speakers.copy()
+        is_user = speakers == ROLES.index(USER)
+        acts = np.where(is_user, np.asarray(actions[USER]), np.asarray(actions[BOT]))
+        intents = self.action_intents[acts]
+        slots = self.action_slots[acts]
+
+        self.last_intent[idx, speakers] = intents
+        self.last_slot[idx, speakers] = slots
+
+        informs = intents == self.intents_dict[INFORM]
+        for i in np.flatnonzero(informs & is_user):
+            self._user_inform(i, slots[i])
+        for i in np.flatnonzero(informs & ~is_user):
+            self._bot_inform(i, slots[i])
+
+        self.round_num += ~is_user
+        said_bye = intents == self.intents_dict[BYE]
+        dones = said_bye | (self.round_num >= self.max_round_num)
+
+        goal_reached = np.all(self.informed >= self.goal_informs, axis=1) & np.all(
+            self.answered >= self.goal_requests, axis=1
+        )
+        success = said_bye & goal_reached
+        rewards = np.where(
+            dones,
+            np.where(
+                success,
+                reward_function(SUCCESS, self.max_round_num),
+                reward_function(FAIL, self.max_round_num),
+            ),
+            reward_function(NO_OUTCOME, self.max_round_num),
         )
-        for key in db_results_dict.keys():
-            if key in self.slots_dict:
-                kb_binary_rep[self.slots_dict[key]] = np.sum(db_results_dict[key] > 0.0)
 
-        state_representation = np.hstack(
+        self.speakers = 1 - speakers
+        done_idx = np.flatnonzero(dones)
+        if len(done_idx) > 0:
+            self._reset_dialogues(done_idx)
+
+        info = {"success": success, "speaker": speakers}
+        return self._encode_observations(), rewards, dones, info
+
+    def _user_inform(self, i: int, slot_id: int):
+        slot = self.slots[slot_id]
+        goal = self.goal_pool.goals[self.goal_ids[i]]
+        self.current_informs[i][slot] = goal.inform_slots.get(slot, ANYTHING)
+        self.informed[i, slot_id] = True
+        self.num_matches[i] = self.db_helper.get_db_results_for_slots(
+            self.current_informs[i]
+        )["matching_all_constraints"]
+
+    def _bot_inform(self, i: int, slot_id: int):
+        slot = self.slots[slot_id]
+        self.bot_informs[i][slot] = self.db_helper.get_inform_value(
+            slot, self.current_informs[i]
+        )
+        self.answered[i, slot_id] = True
+
+    def _encode_observations(self) -> Dict[str, np.ndarray]:
+        """
+        Encodes the observations of both roles for all dialogues in one pass.
+
+        Layout: own last intent, own last slot, other's last intent, other's last slot, slots informed by the user,
+        slots informed by the bot, one-hot round, scaled and binary db match count; the USER additionally sees its goal
+        inform and request slots.
+        """
+        own = np.stack([self.last_intent[:, 0], self.last_intent[:, 1]])
+        other = own[::-1]
+        own_slot = np.stack([self.last_slot[:, 0], self.last_slot[:, 1]])
+        other_slot = own_slot[::-1]
+
+        num_matches = self.num_matches
+        shared = np.concatenate(
+            [
+                self.informed,
+                self.answered,
+                one_hot(
+                    np.minimum(self.round_num, self.max_round_num - 1),
+                    self.max_round_num,
+                ),
+                num_matches[:, None] / 100.0,
+                (num_matches[:, None] > 0.0),
+            ],
+            axis=1,
+        ).astype(np.float32)
+        goal = np.concatenate([self.goal_informs, self.goal_requests], axis=1)
+
+        obs = np.concatenate(
             [
-                user_act_rep,
-                user_inform_slots_rep,
-                user_request_slots_rep,
-                agent_act_rep,
-                agent_inform_slots_rep,
-                agent_request_slots_rep,
-                current_slots_rep,
-                turn_rep,
-                turn_onehot_rep,
-                kb_binary_rep,
-                kb_count_rep,
-            ]
-        ).flatten()
-
-        return state_representation
-
-    def update_state_agent(self, action: DialogAction):
-
-        if action.intent == INFORM:
-            self.handle_inform_with_db_query(action)
-        elif action.intent == "match_found":
-            self.handle_match_found(action)
-
-        action.turn = self.round_num
-        self.history.append(action)
-
-    def handle_match_found(self, agent_action: DialogAction):
-        # If intent is match_found then fill the action informs with the matches informs (if there is a match)
-        assert agent_action.inform_slots is None
-        db_results = self.db_helper.get_db_results(self.current_informs)
-        if db_results:
-            item_idx, item = list(db_results.items())[0]
-            agent_action.inform_slots = copy.deepcopy(item)
-            agent_action.inform_slots[self.match_key] = str(item_idx)
-        else:
-            agent_action.inform_slots = {self.match_key: "no match available"}
-
-        value = agent_action.inform_slots[self.match_key]
-        self.current_informs[self.match_key] = value
-
-    def handle_inform_with_db_query(self, agent_action: DialogAction):
-        assert agent_action.inform_slots
-        slot_name = list(agent_action.inform_slots.keys())[0]
-        value = self.db_helper.get_inform_value(slot_name, self.current_informs)
-        agent_action.inform_slots = {slot_name: value}
-        key, value = list(agent_action.inform_slots.items())[0]  # Only one
-        assert key != "match_found"
-        assert value != "PLACEHOLDER", "KEY: {}".format(key)
-        self.current_informs[key] = value
-
-    def update_state_user(self, user_action: DialogAction):
-
-        for key, value in user_action.inform_slots.items():
-            self.current_informs[key] = value
-
-        user_action.turn = self.round_num
-        self.history.append(user_action)
-        self.round_num += 1
+                one_hot(own, self.num_intents),
+                one_hot(own_slot, self.num_slots),
+                one_hot(other, self.num_intents),
+                one_hot(other_slot, self.num_slots),
+                np.broadcast_to(shared, (2,) + shared.shape),
+                np.stack([np.zeros_like(goal), goal]).astype(np.float32),
+            ],
+            axis=2,
+        )
+        return {BOT: obs[0, :, : self.obs_dims[BOT]], USER: obs[1]}
+
+    def decode(self, action_index: int, speaker: str) -> DialogAction:
+        action = self.actions[action_index]
+        return DialogAction(action.intent, action.slot, speaker=speaker)
@@ -1,7 +1,401 @@
+import copy
+import csv
 import json
+import os
+import time
+from multiprocessing import Pool
+from typing import Dict, List
+
+import numpy as np
+import torch
+from torch.optim.rmsprop import RMSprop
 
 from dialog_agent_env import load_data
+from rng_registry import RNGRegistry
+from selfplay.dialog_agents import DialogAgent
+from selfplay.dialog_env import DialogEnv, BOT, USER, ROLES
+from train_dialog_manager import calc_estimated_return, calc_loss
+
+EXPERIENCE_KEYS = ["obs", "action", "next_obs", "next_reward", "next_done"]
+
+
+class ReplayBuffer:
+    """
+    Fixed size numpy ring buffer of (obs, action, next_obs, next_reward, next_done) transitions of one role.
+
+    Parameters:
+        obs_dim (int): Observation size of the role
+        capacity (int): Number of transitions kept, the oldest ones are overwritten
+        rng (np.random.Generator)
+    """
+
+    def __init__(self, obs_dim: int, capacity: int, rng: np.random.Generator = None):
+        self.capacity = capacity
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.data = {
+            "obs": np.zeros((capacity, obs_dim), dtype=np.float32),
+            "action": np.zeros(capacity, dtype=np.int64),
+            "next_obs": np.zeros((capacity, obs_dim), dtype=np.float32),
+            "next_reward": np.zeros(capacity, dtype=np.float32),
+            "next_done": np.zeros(capacity, dtype=np.float32),
+        }
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add_batch(self, experience: Dict[str, np.ndarray]):
+        n = len(experience["action"])
+        if n > self.capacity:
+            experience = {k: v[-self.capacity :] for k, v in experience.items()}
+            n = self.capacity
+        idx = (self.position + np.arange(n)) % self.capacity
+        for k in EXPERIENCE_KEYS:
+            self.data[k][idx] = experience[k]
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, batch_size: int) -> Dict[str, np.ndarray]:
+        idx = self.rng.integers(self.size, size=batch_size)
+        return {k: v[idx] for k, v in self.data.items()}
+
+
+class Population:
+    """
+    Checkpoints (state dicts) of DialogAgents for one role, the oldest ones are dropped once max_size is reached.
+    Every checkpoint keeps the id it got when added, so win-rate tables stay comparable over generations.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.checkpoints: Dict[int, Dict] = {}
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.checkpoints)
+
+    def add(self, agent: DialogAgent) -> int:
+        checkpoint_id = self.next_id
+        self.checkpoints[checkpoint_id] = copy.deepcopy(agent.state_dict())
+        self.next_id += 1
+        if len(self.checkpoints) > self.max_size:
+            del self.checkpoints[min(self.checkpoints)]
+        return checkpoint_id
+
+    @property
+    def latest(self) -> int:
+        return max(self.checkpoints)
+
+    def sample(self, rng: np.random.Generator) -> int:
+        return int(rng.choice(list(self.checkpoints)))
+
+
+def schedule_matchups(
+    populations: Dict[str, Population],
+    num_matchups: int,
+    rng: np.random.Generator,
+):
+    """
+    Each role's latest checkpoint plays against checkpoints sampled from the other role's population, half of the
+    matchups for each side.
+    """
+    matchups = []
+    for k in range(num_matchups):
+        if k % 2 == 0:
+            matchups.append((populations[BOT].latest, populations[USER].sample(rng)))
+        else:
+            matchups.append((populations[BOT].sample(rng), populations[USER].latest))
+    return matchups
+
+
+_worker_env: DialogEnv = None
+
+
+def init_worker(user_goals, max_round_num, database, slot2values, num_dialogues):
+    global _worker_env
+    # one process per core, so every process only uses a single torch thread
+    torch.set_num_threads(1)
+    _worker_env = DialogEnv(
+        user_goals, max_round_num, database, slot2values, num_dialogues
+    )
+
+
+def play_matchup(job: Dict) -> Dict:
+    """
+    Runs the env with the given bot and user checkpoints for job["num_steps"] steps and splits the experience into
+    per-role transitions. A transition of a role goes from its observation at its turn to its observation at its
+    next turn (or the end of the dialogue) and is rewarded with the shared rewards of both steps in between.
+    """
+    env = _worker_env
+    start = time.time()
+    env.seed(job["seed"], job["worker_id"])
+    n = env.num_dialogues
+
+    agents = {}
+    for role in ROLES:
+        agent = DialogAgent(env.obs_dims[role], env.action_space.n)
+        agent.load_state_dict(job["checkpoints"][role])
+        agent.exploration_rate = job["exploration_rate"]
+        agent.generator = env.rng_registry.torch_generator(role)
+        agent.eval()
+        agents[role] = agent
+
+    pending = {
+        role: {
+            "obs": np.zeros((n, env.obs_dims[role]), dtype=np.float32),
+            "action": np.zeros(n, dtype=np.int64),
+            "reward": np.zeros(n, dtype=np.float32),
+            "active": np.zeros(n, dtype=np.bool_),
+        }
+        for role in ROLES
+    }
+    transitions = {role: {k: [] for k in EXPERIENCE_KEYS} for role in ROLES}
+
+    def finish(role, idx, next_obs, done):
+        p = pending[role]
+        t = transitions[role]
+        t["obs"].append(p["obs"][idx])
+        t["action"].append(p["action"][idx])
+        t["next_obs"].append(next_obs)
+        t["next_reward"].append(p["reward"][idx])
+        t["next_done"].append(np.full(len(idx), float(done), dtype=np.float32))
+        p["active"][idx] = False
+
+    obs = env.reset()
+    num_dialogues = num_successes = 0
+    with torch.no_grad():
+        for _ in range(job["num_steps"]):
+            actions = {
+                role: agents[role].step_batch(obs[role]).numpy() for role in ROLES
+            }
+            speakers = env.speakers.copy()
+            for role_index, role in enumerate(ROLES):
+                p = pending[role]
+                turn = speakers == role_index
+                idx = np.flatnonzero(turn & p["active"])
+                finish(role, idx, obs[role][idx], done=False)
+                p["obs"][turn] = obs[role][turn]
+                p["action"][turn] = actions[role][turn]
+                p["reward"][turn] = 0.0
+                p["active"][turn] = True
+
+            obs, rewards, dones, info = env.step(actions)
+            num_dialogues += int(dones.sum())
+            num_successes += int(info["success"].sum())
+            for role in ROLES:
+                p = pending[role]
+                p["reward"][p["active"]] += rewards[p["active"]]
+                idx = np.flatnonzero(dones & p["active"])
+                finish(role, idx, obs[role][idx], done=True)
+
+    experience = {
+        role: {k: np.concatenate(v) for k, v in transitions[role].items()}
+        for role in ROLES
+    }
+    return {
+        "matchup": (job["bot"], job["user"]),
+        "experience": experience,
+        "dialogues": num_dialogues,
+        "successes": num_successes,
+        "steps": job["num_steps"] * n,
+        "seconds": time.time() - start,
+    }
+
+
+def train_role(
+    agent: DialogAgent,
+    optimizer,
+    buffer: ReplayBuffer,
+    train_steps: int,
+    batch_size: int,
+):
+    losses = []
+    for _ in range(train_steps):
+        exp = buffer.sample(batch_size)
+        with torch.no_grad():
+            agent.eval()
+            estimated_return = calc_estimated_return(agent, exp)
+        agent.train()
+        loss_value = calc_loss(agent, estimated_return, exp["obs"], exp["action"])
+        optimizer.zero_grad()
+        loss_value.backward()
+        optimizer.step()
+        losses.append(loss_value.item())
+    return float(np.mean(losses)) if losses else 0.0
+
+
+def write_rows(file_path: str, rows: List[Dict]):
+    write_header = not os.path.isfile(file_path)
+    with open(file_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]), delimiter="\t")
+        if write_header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def win_rate_rows(generation: int, results: List[Dict]) -> List[Dict]:
+    table = {}
+    for result in results:
+        dialogues, successes = table.get(result["matchup"], (0, 0))
+        table[result["matchup"]] = (
+            dialogues + result["dialogues"],
+            successes + result["successes"],
+        )
+    return [
+        {
+            "generation": generation,
+            "bot": bot,
+            "user": user,
+            "dialogues": dialogues,
+            "successes": successes,
+            "win_rate": round(successes / max(dialogues, 1), 4),
+        }
+        for (bot, user), (dialogues, successes) in sorted(table.items())
+    ]
+
+
+def make_learners(
+    obs_dims: Dict[str, int], num_actions: int, registry: RNGRegistry
+) -> Dict[str, DialogAgent]:
+    """
+    Builds the bot and user learners with initial weights drawn from the registry's agent_init stream (in ROLES
+    order), so that seeded runs start from the same weights.
+    """
+    init_generator = registry.torch_generator("agent_init")
+    return {
+        role: DialogAgent(obs_dims[role], num_actions, init_generator=init_generator)
+        for role in ROLES
+    }
+
+
+def train_selfplay(
+    user_goals,
+    database,
+    slot2values,
+    params: Dict,
+):
+    """
+    League training of a bot and a user DialogAgent.
+
+    Every generation the latest checkpoint of each role plays matchups against the population of the other role in
+    a process pool (one process per core by default). The transitions are added to one replay buffer per role, the
+    learner runs DQN updates for both roles and adds the new weights to the populations. Win rates per matchup and
+    throughput are appended to win_rates.tsv and throughput.tsv in params["out_dir"].
+    """
+    registry = RNGRegistry(params.get("seed"))
+    rng = registry.generator("league")
+    os.makedirs(params["out_dir"], exist_ok=True)
+
+    env = DialogEnv(user_goals, params["max_round_num"], database, slot2values)
+    learners = make_learners(env.obs_dims, env.action_space.n, registry)
+    optimizers = {
+        role: RMSprop(learners[role].parameters(), lr=params["learning_rate"])
+        for role in ROLES
+    }
+    buffers = {
+        role: ReplayBuffer(
+            env.obs_dims[role], params["buffer_size"], registry.generator(role)
+        )
+        for role in ROLES
+    }
+    populations = {role: Population(params["population_size"]) for role in ROLES}
+    for role in ROLES:
+        populations[role].add(learners[role])
+
+    exploration_rate = 1.0
+    min_eps = params["min_exploration_rate"]
+    exploration_decay = np.exp(np.log(min_eps) / params["num_generations"])
+
+    num_workers = params.get("num_workers") or os.cpu_count()
+    init_args = (
+        user_goals,
+        params["max_round_num"],
+        database,
+        slot2values,
+        params["num_dialogues"],
+    )
+    with Pool(num_workers, initializer=init_worker, initargs=init_args) as pool:
+        for generation in range(params["num_generations"]):
+            start = time.time()
+            matchups = schedule_matchups(
+                populations, params["matchups_per_generation"], rng
+            )
+            jobs = [
+                {
+                    "bot": bot,
+                    "user": user,
+                    "checkpoints": {
+                        BOT: populations[BOT].checkpoints[bot],
+                        USER: populations[USER].checkpoints[user],
+                    },
+                    "exploration_rate": exploration_rate,
+                    "num_steps": params["steps_per_matchup"],
+                    "seed": registry.seed,
+                    "worker_id": generation * len(matchups) + k,
+                }
+                for k, (bot, user) in enumerate(matchups)
+            ]
+            results = pool.map(play_matchup, jobs)
+            rollout_seconds = time.time() - start
+
+            start = time.time()
+            losses = {}
+            for role in ROLES:
+                for result in results:
+                    buffers[role].add_batch(result["experience"][role])
+                losses[role] = train_role(
+                    learners[role],
+                    optimizers[role],
+                    buffers[role],
+                    params["train_steps"],
+                    params["batch_size"],
+                )
+                populations[role].add(learners[role])
+            learn_seconds = time.time() - start
+            exploration_rate = max(exploration_rate * exploration_decay, min_eps)
+
+            win_rates = win_rate_rows(generation, results)
+            steps = sum(result["steps"] for result in results)
+            throughput = {
+                "generation": generation,
+                "workers": num_workers,
+                "matchups": len(results),
+                "env_steps": steps,
+                "dialogues": sum(result["dialogues"] for result in results),
+                "transitions": sum(
+                    len(result["experience"][role]["action"])
+                    for result in results
+                    for role in ROLES
+                ),
+                "rollout_seconds": round(rollout_seconds, 3),
+                "env_steps_per_second": round(steps / rollout_seconds, 1),
+                "learn_seconds": round(learn_seconds, 3),
+                "bot_loss": round(losses[BOT], 4),
+                "user_loss": round(losses[USER], 4),
+            }
+            write_rows(os.path.join(params["out_dir"], "win_rates.tsv"), win_rates)
+            write_rows(os.path.join(params["out_dir"], "throughput.tsv"), [throughput])
+
+            win_rate = sum(row["successes"] for row in win_rates) / max(
+                throughput["dialogues"], 1
+            )
+            print(
+                "generation %d: win-rate %.3f, %.0f env-steps/s, eps %.3f"
+                % (
+                    generation,
+                    win_rate,
+                    throughput["env_steps_per_second"],
+                    exploration_rate,
+                )
+            )
 
+    for role in ROLES:
+        torch.save(
+            learners[role].state_dict(),
+            os.path.join(params["out_dir"], "%s.pt" % role.lower()),
+        )
+    return learners
 
 
 if __name__ == "__main__":
@@ -11,13 +405,25 @@ if __name__ == "__main__":
     USER_GOALS_FILE_PATH = "../data/movie_user_goals.pkl"
 
     train_params = {
-        "num_ep_run": 40000,
-        "train_freq": 100,
         "max_round_num": 20,
+        "num_generations": 100,
+        "matchups_per_generation": 16,
+        "steps_per_matchup": 200,
+        "num_dialogues": 32,
+        "population_size": 8,
+        "buffer_size": 200_000,
+        "train_steps": 200,
+        "batch_size": 64,
+        "learning_rate": 1e-2,
+        "min_exploration_rate": 0.01,
+        "num_workers": None,
+        "seed": 0,
+        "out_dir": "selfplay_results",
     }
 
     slot2values, database, user_goals = load_data(
         DATABASE_FILE_PATH, DICT_FILE_PATH, USER_GOALS_FILE_PATH
     )
 
-    print()
+    print(json.dumps(train_params, indent=2))
+    train_selfplay(user_goals, database, slot2values, train_params)
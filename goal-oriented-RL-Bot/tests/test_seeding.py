@@ -0,0 +1,31 @@
+import gym
+import torch
+
+from dialog_agent_env import DialogManagerAgent
+from rng_registry import RNGRegistry
+
+
+def build_agent(seed):
+    registry = RNGRegistry(seed)
+    return DialogManagerAgent(
+        gym.spaces.MultiBinary(20),
+        gym.spaces.Discrete(5),
+        registry.torch_generator("agent_init"),
+    )
+
+
+def assert_same_weights(a, b):
+    for (name, x), (_, y) in zip(a.state_dict().items(), b.state_dict().items()):
+        assert torch.equal(x, y), name
+
+
+def test_seeded_agents_start_from_the_same_weights():
+    # Draws from the global stream in between must not matter
+    first = build_agent(7)
+    torch.rand(100)
+    assert_same_weights(first, build_agent(7))
+
+
+def test_different_seeds_give_different_weights():
+    first, second = build_agent(7), build_agent(8)
+    assert not torch.equal(first.nn[0].weight, second.nn[0].weight)
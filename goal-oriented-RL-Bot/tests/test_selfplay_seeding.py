@@ -0,0 +1,59 @@
+import os
+
+import torch
+
+from dialog_agent_env import load_data
+from rng_registry import RNGRegistry
+from selfplay.dialog_env import ROLES
+from selfplay.train_selfplay import make_learners, train_selfplay
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+def params(out_dir, seed):
+    return {
+        "max_round_num": 10,
+        "num_generations": 2,
+        "matchups_per_generation": 2,
+        "steps_per_matchup": 20,
+        "num_dialogues": 4,
+        "population_size": 2,
+        "buffer_size": 1000,
+        "train_steps": 3,
+        "batch_size": 8,
+        "learning_rate": 1e-2,
+        "min_exploration_rate": 0.1,
+        "num_workers": 2,
+        "seed": seed,
+        "out_dir": str(out_dir),
+    }
+
+
+def assert_same_weights(a, b):
+    for role in ROLES:
+        for (name, x), (_, y) in zip(
+            a[role].state_dict().items(), b[role].state_dict().items()
+        ):
+            assert torch.equal(x, y), (role, name)
+
+
+def test_learners_start_from_the_same_weights():
+    first = make_learners({role: 12 for role in ROLES}, 5, RNGRegistry(3))
+    torch.rand(100)
+    second = make_learners({role: 12 for role in ROLES}, 5, RNGRegistry(3))
+    assert_same_weights(first, second)
+
+
+def test_seeded_selfplay_runs_are_reproducible(tmp_path):
+    slot2values, database, user_goals = load_data(
+        os.path.join(DATA_DIR, "movie_db.pkl"),
+        os.path.join(DATA_DIR, "movie_dict.pkl"),
+        os.path.join(DATA_DIR, "movie_user_goals.pkl"),
+    )
+    runs = [
+        train_selfplay(
+            user_goals, database, slot2values, params(tmp_path / str(run), seed=5)
+        )
+        for run in range(2)
+    ]
+    assert_same_weights(*runs)
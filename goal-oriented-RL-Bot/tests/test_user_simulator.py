@@ -0,0 +1,51 @@
+import random
+
+from user_goal_pool import UserGoal
+from user_simulator import UserSimulator
+
+GOALS = [
+    UserGoal(
+        request_slots={"starttime": "UNK"},
+        diaact="request",
+        inform_slots={"moviename": "zootopia", "city": "seattle"},
+    ),
+    UserGoal(
+        request_slots={"theater": "UNK", "ticket": "UNK"},
+        diaact="request",
+        inform_slots={"numberofpeople": "2"},
+    ),
+]
+
+
+def test_reset_reuses_the_state():
+    user = UserSimulator(GOALS, max_round=20, rng=random.Random(0))
+    state = user.state
+    dicts = [
+        state.history_slots,
+        state.inform_slots,
+        state.request_slots,
+        state.rest_slots,
+    ]
+
+    for _ in range(10):
+        user.reset()
+        assert user.state is state
+        assert all(
+            new is old
+            for new, old in zip(
+                [
+                    state.history_slots,
+                    state.inform_slots,
+                    state.request_slots,
+                    state.rest_slots,
+                ],
+                dicts,
+            )
+        )
+        # The informed slots moved from the rest slots to the history
+        goal_slots = {**user.goal.inform_slots, **user.goal.request_slots}
+        assert {**state.rest_slots, **state.history_slots}.keys() == goal_slots.keys()
+
+    # The pool's own copies are left as they are
+    for goal, pool_rest_slots in zip(user.goal_pool.goals, user.goal_pool.rest_slots):
+        assert pool_rest_slots == {**goal.inform_slots, **goal.request_slots}
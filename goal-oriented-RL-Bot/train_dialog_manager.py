@@ -108,9 +108,18 @@ if __name__ == "__main__":
     dialog_env = DialogEnv(
         user_goals, params["emc"], params["run"]["max_round_num"], database, slot2values
     )
+    init_generator = None
+    if "seed" in train_params:
+        dialog_env.seed(train_params["seed"])
+        init_generator = dialog_env.rng_registry.torch_generator("agent_init")
 
-    agent = DialogManagerAgent(dialog_env.observation_space, dialog_env.action_space)
+    agent = DialogManagerAgent(
+        dialog_env.observation_space, dialog_env.action_space, init_generator
+    )
     rule_agent = RuleBasedAgent(params["agent"]["epsilon_init"])
+    if dialog_env.rng_registry is not None:
+        agent.generator = dialog_env.rng_registry.torch_generator("agent")
+        rule_agent.rng = dialog_env.rng_registry.random("rule_agent")
 
     # experience_iterator = iter(experience_generator(agent, dialog_env))
     # batch = gather_experience(experience_iterator)
@@ -0,0 +1,166 @@
+from types import MappingProxyType
+from typing import List, NamedTuple
+
+import numpy as np
+
+from dialogue_config import all_slots, usersim_default_key, UNK
+from utils import convert_list_to_dict
+
+
+class UserGoal(NamedTuple):
+    request_slots: dict
+    diaact: str
+    inform_slots: dict
+
+
+class UserGoalPool:
+    """
+    Integer-encoded pool of user goals, compiled once from the raw goal list.
+
+    Each goal is stored as padded arrays of inform slot ids and value ids plus a boolean mask over request slots
+    (the default key is already part of every request mask). The request slot ids are also kept in the goal's own
+    order, so decoded goals list their request slots exactly as the raw goal did. The decoded goals handed out to the
+    user simulator are read-only views built at load time, so drawing a goal neither mutates shared state nor builds
+    new dicts.
+
+    The pool has no random stream of its own: sampling needs either the generator passed to the sample method or one
+    set as rng, e.g. by the user simulator or from an RNGRegistry.
+
+    Parameters:
+        goal_list (list): UserGoals as loaded from movie_user_goals
+        slots (list): Slot vocabulary, slots only seen in goals are appended
+        default_key (str): Request slot the agent always has to inform
+        weights (list): Optional per-goal sampling weights
+        stratify (bool): Sample every difficulty level (number of goal slots) with equal probability
+        rng (np.random.Generator): Default generator to sample with
+    """
+
+    def __init__(
+        self,
+        goal_list: List[UserGoal],
+        slots: List[str] = all_slots,
+        default_key: str = usersim_default_key,
+        weights=None,
+        stratify=False,
+        rng: np.random.Generator = None,
+    ):
+        self.default_key = default_key
+        self.rng = rng
+
+        self.slots = list(slots)
+        for goal in goal_list:
+            for key in (
+                [default_key] + list(goal.inform_slots) + list(goal.request_slots)
+            ):
+                if key not in self.slots:
+                    self.slots.append(key)
+        self.slot2id = convert_list_to_dict(self.slots)
+
+        self.values = []
+        self.value2id = {}
+
+        self.num_goals = len(goal_list)
+        max_informs = max([len(goal.inform_slots) for goal in goal_list], default=0)
+        self.inform_slot_ids = np.full(
+            (self.num_goals, max_informs), -1, dtype=np.int32
+        )
+        self.inform_value_ids = np.full(
+            (self.num_goals, max_informs), -1, dtype=np.int32
+        )
+        self.num_informs = np.zeros(self.num_goals, dtype=np.int32)
+        self.request_mask = np.zeros((self.num_goals, len(self.slots)), dtype=np.bool_)
+        self.request_orders = []
+        self.diaacts = []
+
+        for i, goal in enumerate(goal_list):
+            for k, (key, value) in enumerate(goal.inform_slots.items()):
+                self.inform_slot_ids[i, k] = self.slot2id[key]
+                self.inform_value_ids[i, k] = self._value_id(value)
+            self.num_informs[i] = len(goal.inform_slots)
+            order = [self.slot2id[key] for key in goal.request_slots]
+            if self.default_key not in goal.request_slots:
+                order.append(self.slot2id[self.default_key])
+            self.request_orders.append(tuple(order))
+            self.request_mask[i, order] = True
+            self.diaacts.append(goal.diaact)
+
+        self.difficulty = self.num_informs + self.request_mask.sum(axis=1)
+
+        self.goals = [self.decode(i) for i in range(self.num_goals)]
+        self.rest_slots = [
+            {**goal.inform_slots, **goal.request_slots} for goal in self.goals
+        ]
+
+        self._cdf = None
+        self.set_sampling_weights(weights, stratify)
+
+    def __len__(self):
+        return self.num_goals
+
+    def _value_id(self, value):
+        if value not in self.value2id:
+            self.value2id[value] = len(self.values)
+            self.values.append(value)
+        return self.value2id[value]
+
+    def decode(self, index: int):
+        """
+        Build the read-only UserGoal for the goal at index from the integer arrays.
+
+        The request slots keep the order of the raw goal, the default key is appended if the goal did not request it.
+        """
+        n = self.num_informs[index]
+        inform_slots = {
+            self.slots[s]: self.values[v]
+            for s, v in zip(
+                self.inform_slot_ids[index, :n], self.inform_value_ids[index, :n]
+            )
+        }
+        request_slots = {self.slots[s]: UNK for s in self.request_orders[index]}
+        return UserGoal(
+            request_slots=MappingProxyType(request_slots),
+            diaact=self.diaacts[index],
+            inform_slots=MappingProxyType(inform_slots),
+        )
+
+    def set_sampling_weights(self, weights=None, stratify=False):
+        """
+        Configure the sampling distribution over goals.
+
+        Parameters:
+            weights (list): Per-goal weights, uniform if None
+            stratify (bool): Re-weight so that every difficulty level is drawn equally often
+        """
+        if weights is None and not stratify:
+            self._cdf = None
+            return
+
+        p = np.ones(self.num_goals) if weights is None else np.asarray(weights, float)
+        if len(p) != self.num_goals:
+            raise ValueError("Need one weight per goal!")
+        if stratify:
+            levels, level_idx = np.unique(self.difficulty, return_inverse=True)
+            level_mass = np.bincount(level_idx, weights=p)
+            p = p / (level_mass[level_idx] * len(levels))
+        self._cdf = np.cumsum(p / p.sum())
+        self._cdf[-1] = 1.0
+
+    def _generator(self, rng: np.random.Generator = None) -> np.random.Generator:
+        rng = rng if rng is not None else self.rng
+        if rng is None:
+            raise ValueError("UserGoalPool needs a random generator to sample goals!")
+        return rng
+
+    def sample_index(self, rng: np.random.Generator = None) -> int:
+        rng = self._generator(rng)
+        if self._cdf is None:
+            return int(rng.integers(self.num_goals))
+        return int(np.searchsorted(self._cdf, rng.random(), side="right"))
+
+    def sample_batch(
+        self, batch_size: int, rng: np.random.Generator = None
+    ) -> np.ndarray:
+        rng = self._generator(rng)
+        if self._cdf is None:
+            return rng.integers(self.num_goals, size=batch_size)
+        return np.searchsorted(self._cdf, rng.random(batch_size), side="right")
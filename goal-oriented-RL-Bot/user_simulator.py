@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, List, NamedTuple
+from typing import Dict, List
 
 from dialogue_config import (
     usersim_default_key,
@@ -13,14 +13,11 @@ from dialogue_config import (
     PLACEHOLDER,
     UNK,
 )
+from user_goal_pool import UserGoal, UserGoalPool
 from utils import reward_function
 import random, copy
 
-
-class UserGoal(NamedTuple):
-    request_slots: dict
-    diaact: str
-    inform_slots: dict
+import numpy as np
 
 
 @dataclass
@@ -33,20 +30,32 @@ class DialogState:  # TODO(tilo): is this really needed?
 
 
 class UserSimulator:
-    def __init__(self, goal_list: List[UserGoal], max_round: int):
+    def __init__(self, goal_list: List[UserGoal], max_round: int, rng=None):
 
         self.goal_list = goal_list
+        self.rng = rng if rng is not None else random
+        # Unless an env seeds it per episode, the goal stream is derived from the simulator's own stream
+        self.goal_pool = UserGoalPool(
+            goal_list, rng=np.random.default_rng(self.rng.getrandbits(64))
+        )
         self.max_round = max_round
         self.default_key = usersim_default_key
         # A list of REQUIRED to be in the first action inform keys
         self.init_informs = usersim_required_init_inform_keys
         self.no_query = no_query_keys
+        # One state whose dicts are cleared and refilled every episode
+        self.state = DialogState("", {}, {}, {}, {})
 
     def reset(self):
-        self.goal = random.choice(self.goal_list)
-        self.goal.request_slots[self.default_key] = "UNK"
-        rest_slots = {**self.goal.inform_slots, **self.goal.request_slots}
-        self.state = DialogState("", {}, {}, {}, rest_slots)
+        self.goal_index = self.goal_pool.sample_index()
+        self.goal = self.goal_pool.goals[self.goal_index]
+        state = self.state
+        state.intent = ""
+        state.history_slots.clear()
+        state.inform_slots.clear()
+        state.request_slots.clear()
+        state.rest_slots.clear()
+        state.rest_slots.update(self.goal_pool.rest_slots[self.goal_index])
         self.constraint_check = FAIL
         return self._return_init_action()
 
@@ -66,7 +75,7 @@ class UserSimulator:
                     ]
             # If nothing was added then pick a random one to add
             if not self.state.inform_slots:
-                key, value = random.choice(list(self.goal.inform_slots.items()))
+                key, value = self.rng.choice(list(self.goal.inform_slots.items()))
                 self.state.inform_slots[key] = value
                 self.state.rest_slots.pop(key)
                 self.state.history_slots[key] = value
@@ -88,7 +97,7 @@ class UserSimulator:
             k for k in self.goal.request_slots.keys() if k != self.default_key
         ]
         if len(non_default_slots) > 0:
-            req_key = random.choice(non_default_slots)
+            req_key = self.rng.choice(non_default_slots)
         else:
             req_key = self.default_key
         return req_key
@@ -228,7 +237,7 @@ class UserSimulator:
             if value != "UNK":
                 rest_informs[key] = value
         if rest_informs:
-            key_choice, value_choice = random.choice(list(rest_informs.items()))
+            key_choice, value_choice = self.rng.choice(list(rest_informs.items()))
             self.state.inform_slots[key_choice] = value_choice
             self.state.rest_slots.pop(key_choice)
             self.state.history_slots[key_choice] = value_choice
@@ -285,7 +294,7 @@ class UserSimulator:
         elif self.state.rest_slots:
             def_in = self.state.rest_slots.pop(self.default_key, False)
             if self.state.rest_slots:
-                key, value = random.choice(list(self.state.rest_slots.items()))
+                key, value = self.rng.choice(list(self.state.rest_slots.items()))
                 if value != "UNK":
                     self.state.intent = "inform"
                     self.state.inform_slots[key] = value
@@ -12,12 +12,23 @@ from Goal import Goal
 
 __author__ = "Alexandros Papangelis"
 
-from dialog_action_classes import DialogueAct, DialogueActItem, Operator
+from collections import deque
+
+from dialog_action_classes import (
+    FrozenDialogueActItem,
+    Operator,
+    act_signature,
+    make_act,
+)
 
 """
 The Agenda is a stack-like implementation of the Simulated Usr's agenda. 
 It holds DialogueActs and is able to handle complex goals (i.e. goals that 
 have sub-goals).
+
+The IndexedAgenda behaves like the Agenda, but finds acts through a hash index 
+keyed by act signature instead of comparing against every act in the stack, so 
+push, pop, remove and membership are O(1) amortised.
 """
 
 
@@ -25,17 +36,23 @@ class Agenda:
     def __init__(self):
         self.agenda = []
         self.goal: Goal = None
+        self.requests_made = {}
 
     def initialize(self, goal: Goal):
 
+        # The agenda used to work on a deep copy of the goal. It now shares
+        # the goal, but keeps what it reads later as it was at this point:
+        # the requests made (consistency_check) and, as frozen acts, the
+        # goal's items, so later updates of the goal change neither
         self.goal = goal
+        self.requests_made = dict(goal.requests_made)
         self.clear()
 
-        by_act = DialogueAct("bye", [])
+        by_act = make_act("bye")
         subgoal_acts = self.handle_subgoals()
-        request_acts = [DialogueAct("request", [req]) for req in goal.requests.values()]
+        request_acts = [make_act("request", [req]) for req in goal.requests.values()]
         inform_acts = [
-            DialogueAct("inform", [constr]) for constr in goal.constraints.values()
+            make_act("inform", [constr]) for constr in goal.constraints.values()
         ]
 
         self.push(by_act)
@@ -52,10 +69,10 @@ class Agenda:
             sg = self.goal.subgoals[i]
 
             # Acknowledge completion of subgoal
-            subgoal_acts.append(DialogueAct("ack_subgoal", []))
+            subgoal_acts.append(make_act("ack_subgoal"))
 
             for constr in sg.constraints.values():
-                subgoal_acts.append(DialogueAct("inform", [constr]))
+                subgoal_acts.append(make_act("inform", [constr]))
         return subgoal_acts
 
     def push(self, act, force=False):
@@ -103,10 +120,12 @@ class Agenda:
 
         # Remove all requests for slots that are filled in the goal
         if self.goal:
-            for slot in self.goal.requests_made:
-                if self.goal.requests_made[slot].value:
+            for slot in self.requests_made:
+                if self.requests_made[slot].value:
                     self.remove(
-                        DialogueAct("request", [DialogueActItem(slot, Operator.EQ, "")])
+                        make_act(
+                            "request", [FrozenDialogueActItem(slot, Operator.EQ, "")]
+                        )
                     )
         else:
             print(
@@ -117,3 +136,114 @@ class Agenda:
     def size(self):
 
         return len(self.agenda)
+
+
+class IndexedAgenda(Agenda):
+    # Compact the stack once it holds more tombstones than this and than
+    # live acts
+    MIN_COMPACTION_SIZE = 32
+
+    def __init__(self):
+        self.stack = []
+        self.index = {}
+        self.num_acts = 0
+        super(IndexedAgenda, self).__init__()
+
+    @property
+    def agenda(self):
+        """
+        :return: list of the acts in the agenda, bottom to top
+        """
+        return [entry[0] for entry in self.stack if entry[2]]
+
+    @agenda.setter
+    def agenda(self, acts):
+        self.stack = []
+        self.index = {}
+        self.num_acts = 0
+        for act in acts:
+            self.append(act)
+
+    def __contains__(self, act):
+        return act_signature(act) in self.index
+
+    def append(self, act):
+        # Entries are [act, signature, alive]; the index keeps the live
+        # entries of each signature in stack order
+        signature = act_signature(act)
+        entry = [act, signature, True]
+        self.stack.append(entry)
+        self.index.setdefault(signature, deque()).append(entry)
+        self.num_acts += 1
+
+    def kill(self, entry, newest):
+        """
+        Turn an entry into a tombstone and drop it from the index.
+
+        :param entry: the live entry
+        :param newest: whether it is the newest entry of its signature
+        :return: nothing
+        """
+        entries = self.index[entry[1]]
+        if newest:
+            entries.pop()
+        else:
+            entries.popleft()
+        if not entries:
+            del self.index[entry[1]]
+
+        entry[2] = False
+        self.num_acts -= 1
+
+    def push(self, act, force=False):
+
+        if not force:
+            self.remove(act)
+
+        self.append(act)
+
+    def drop_tombstones(self):
+        while self.stack and not self.stack[-1][2]:
+            self.stack.pop()
+
+    def pop(self):
+
+        self.drop_tombstones()
+        if self.stack:
+            entry = self.stack.pop()
+            self.kill(entry, newest=True)
+            return entry[0]
+        else:
+            # TODO: LOG WARNING INSTEAD OF PRINTING
+            print("Warning! Attempted to pop an empty agenda.")
+            return None
+
+    def peek(self):
+
+        self.drop_tombstones()
+        if self.stack:
+            return self.stack[-1][0]
+        else:
+            # TODO: LOG WARNING INSTEAD OF PRINTING
+            print("Warning! Attempted to peek an empty agenda.")
+            return None
+
+    def remove(self, act):
+        # Like list.remove, removes the oldest (bottom-most) matching act
+        entries = self.index.get(act_signature(act))
+        if entries:
+            self.kill(entries[0], newest=False)
+
+            num_tombstones = len(self.stack) - self.num_acts
+            if num_tombstones > max(self.num_acts, self.MIN_COMPACTION_SIZE):
+                self.stack = [entry for entry in self.stack if entry[2]]
+
+    def clear(self):
+
+        self.stack = []
+        self.index = {}
+        self.num_acts = 0
+
+    def size(self):
+
+        return self.num_acts
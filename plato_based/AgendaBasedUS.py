@@ -1,10 +1,16 @@
 import random
-from copy import deepcopy
 from typing import List
 
 import Agenda
 import Goal
-from dialog_action_classes import DialogueAct, DialogueActItem, Operator
+from dialog_action_classes import (
+    DialogueAct,
+    DialogueActItem,
+    FrozenDialogueActItem,
+    Operator,
+    make_act,
+    replace_item,
+)
 from ErrorModel import ErrorModel
 
 """
@@ -36,6 +42,7 @@ class AgendaBasedUS(object):
         error_model: ErrorModel,
         patience=3,
         pop_distribution=[1.0],
+        rng=None,
     ):
 
         super(AgendaBasedUS, self).__init__()
@@ -45,8 +52,9 @@ class AgendaBasedUS(object):
         self.pop_distribution = pop_distribution
 
         self.curr_patience = self.patience
+        self.rng = rng if rng is not None else random
 
-        self.agenda = Agenda.Agenda()
+        self.agenda = Agenda.IndexedAgenda()
         self.error_model = error_model
 
         self.goal_generator = goal_generator
@@ -60,7 +68,9 @@ class AgendaBasedUS(object):
 
         self.goal = self.goal_generator.generate()
 
-        self.agenda.initialize(deepcopy(self.goal))
+        # The agenda snapshots what it reads of the goal (see
+        # Agenda.initialize), so it can share the goal instead of a deep copy
+        self.agenda.initialize(self.goal)
 
         self.prev_system_acts = None
         self.curr_patience = self.patience
@@ -97,14 +107,16 @@ class AgendaBasedUS(object):
 
         self.alter_patience(system_acts)
 
-        self.prev_system_acts = deepcopy(system_acts)
+        # The acts themselves are not modified, neither here nor by the
+        # dialogue manager once it has output them
+        self.prev_system_acts = list(system_acts)
 
         for system_act in system_acts:
             # Update user goal (in ABUS the state is factored into the goal
             # and the agenda)
             if system_act.intent == "bye" or self.dialogue_turn > 15:
                 self.agenda.clear()
-                self.agenda.push(DialogueAct("bye", []))
+                self.agenda.push(make_act("bye"))
 
             elif system_act.intent in ["inform", "offer"]:
                 self._handle_inform_and_offer(system_act)
@@ -142,7 +154,11 @@ class AgendaBasedUS(object):
             pass
 
     def _update_goal_request_value_remove_from_agenda(self, item):
-        self.goal.requests_made[item.slot].value = item.value
+        # Acts (and their items) are frozen, so replace the item instead of
+        # updating it
+        self.goal.requests_made[item.slot] = replace_item(
+            self.goal.requests_made[item.slot], value=item.value
+        )
         # Mark the value only if the slot has been
         # requested and is in the requests
         if item.slot in self.goal.requests:
@@ -151,7 +167,7 @@ class AgendaBasedUS(object):
         # for that slot
         # TODO: Revise this for all operators
         self.agenda.remove(
-            DialogueAct("request", [DialogueActItem(item.slot, Operator.EQ, "")])
+            make_act("request", [FrozenDialogueActItem(item.slot, Operator.EQ, "")])
         )
 
     def _user_does_care(self, item, goal_constraints):
@@ -179,16 +195,7 @@ class AgendaBasedUS(object):
         # act will be pushed again and will be on top of the
         # agenda (this way we avoid adding / removing
         # twice.
-        dact = DialogueAct(
-            "inform",
-            [
-                DialogueActItem(
-                    deepcopy(item.slot),
-                    deepcopy(self.goal.constraints[item.slot].op),
-                    deepcopy(self.goal.constraints[item.slot].value),
-                )
-            ],
-        )
+        dact = make_act("inform", [self.goal.constraints[item.slot]])
         # Remove and push to make sure the act is on top -
         # if it already exists
         self.agenda.remove(dact)
@@ -205,8 +212,7 @@ class AgendaBasedUS(object):
 
     def _push_all_goal_request_to_agenda(self):
         for r in self.goal.requests:
-            req = deepcopy(self.goal.requests[r])
-            req_dact = DialogueAct("request", [req])
+            req_dact = make_act("request", [self.goal.requests[r]])
 
             # The agenda will replace the old act first
             self.agenda.push(req_dact)
@@ -217,28 +223,27 @@ class AgendaBasedUS(object):
             system_asks_for_slot_in_goal = item.slot in self.goal.constraints
 
             if system_asks_for_slot_in_goal:
-                operation = deepcopy(self.goal.constraints[item.slot].op)
-                slot_value = deepcopy(self.goal.constraints[item.slot].value)
+                operation = self.goal.constraints[item.slot].op
+                slot_value = self.goal.constraints[item.slot].value
             else:
                 operation = Operator.EQ
                 slot_value = "dontcare"
 
-            slot_name = deepcopy(item.slot)
             self.agenda.push(
-                DialogueAct(
-                    "inform", [DialogueActItem(slot_name, operation, slot_value)]
+                make_act(
+                    "inform", [FrozenDialogueActItem(item.slot, operation, slot_value)]
                 )
             )
 
     def respond(self):
 
         if self.curr_patience == 0:
-            return [DialogueAct("bye", [])]
+            return [make_act("bye")]
 
         # Sample the number of acts to pop.
         acts = []
         pops = min(
-            random.choices(
+            self.rng.choices(
                 range(1, len(self.pop_distribution) + 1), weights=self.pop_distribution
             )[0],
             self.agenda.size(),
@@ -1,15 +1,14 @@
 import DataBase
 import Goal
 import Ontology
-from dialog_action_classes import DialogueAct
+from dialog_action_classes import make_act
 
 from AgendaBasedUS import AgendaBasedUS
 from ErrorModel import ErrorModel
 import DialogueManager_simplified as DialogueManager
 from slot_filling_reward_function import SlotFillingReward
 from DialogueEpisodeRecorder import DialogueEpisodeRecorder, TurnState
-
-from copy import deepcopy
+from rng_registry import RNGRegistry
 
 import os
 import random
@@ -17,20 +16,47 @@ import random
 
 def build_domain_settings(dialogue_config):
 
-    assert os.path.isfile(dialogue_config["ontology_path"])
+    # A compiled ontology saved at ontology_index_path is loaded instead of
+    # the ontology file, unless it was compiled from a different file (or
+    # the file has changed since); then it is compiled and saved again
+    ontology_path = dialogue_config.get("ontology_path")
+    index_path = dialogue_config.get("ontology_index_path")
+    ontology = None
+    if index_path and os.path.isfile(index_path):
+        index = Ontology.OntologyIndex.load(index_path)
+        if not ontology_path or index.is_compiled_from(ontology_path):
+            ontology = Ontology.Ontology.from_index(index)
+
+    if ontology is None:
+        assert os.path.isfile(ontology_path)
+
+        ontology = Ontology.Ontology(ontology_path)
+        if index_path:
+            ontology.compile().save(index_path)
 
-    ontology = Ontology.Ontology(dialogue_config["ontology_path"])
     assert os.path.isfile(dialogue_config["db_path"])
 
-    cache_sql_results = False
+    cache_sql_results = dialogue_config.get("cache_sql_results", False)
     database = DataBase.SQLDataBase(
-        dialogue_config["db_path"], cache_sql_results
+        dialogue_config["db_path"],
+        cache_sql_results,
+        in_memory=dialogue_config.get("db_in_memory", False),
+        pool_size=dialogue_config.get("db_pool_size", 0),
+        cache_size=dialogue_config.get("sql_cache_size", 1024),
     )
+    # Indexes go into the in-memory copy; they are only written into the
+    # database file itself if db_create_indexes asks for it
+    if database.in_memory or dialogue_config.get("db_create_indexes", False):
+        database.create_indexes(
+            ontology.ontology["informable"],
+            [tuple(s) for s in dialogue_config.get("db_index_signatures", [])],
+            dialogue_config.get("db_covering_indexes", True),
+        )
     return ontology, database
 
 
 class ConversationalSingleAgent:
-    def __init__(self, configuration):
+    def __init__(self, configuration, rng_registry: RNGRegistry = None):
 
         super().__init__()
 
@@ -65,19 +91,40 @@ class ConversationalSingleAgent:
         self.prev_turnstate = TurnState()
         self.curr_state = None
 
-        self.recorder = DialogueEpisodeRecorder()
+        policy_config = configuration["AGENT_0"]["DM"]["policy"]
+        self.recorder = DialogueEpisodeRecorder(
+            size=policy_config.get("recorder_size"),
+            compact=policy_config.get("compact_recorder", False),
+            snapshot_interval=policy_config.get("snapshot_interval", 0),
+            log_path=policy_config.get("episode_log_path"),
+            # Snapshot states instead of deep-copying them on every turn
+            fast_simulation=configuration.get("GENERAL", {}).get(
+                "fast_simulation", False
+            ),
+        )
 
         # TODO: Handle this properly - get reward function type from config
         self.reward_func = SlotFillingReward()
 
+        # Without a registry all components draw from the global random module
+        self.rng_registry = rng_registry
+        if self.rng_registry is None and "seed" in configuration.get("GENERAL", {}):
+            self.rng_registry = RNGRegistry(configuration["GENERAL"]["seed"])
+        self.rng = random
+
         self.ontology, self.database = build_domain_settings(configuration["DIALOGUE"])
+        self.goal_generator = Goal.GoalGenerator(self.ontology, self.database)
+        self.setup_goal_bank(configuration["DIALOGUE"])
+        us_config = configuration["AGENT_0"].get("USER_SIMULATOR", {})
         self.user_simulator = AgendaBasedUS(
-            goal_generator=Goal.GoalGenerator(self.ontology, self.database),
+            goal_generator=self.goal_generator,
             error_model=ErrorModel(
                 self.ontology,
-                slot_confuse_prob=0.0,
-                op_confuse_prob=0.0,
-                value_confuse_prob=0.0,
+                slot_confuse_prob=us_config.get("slot_confuse_prob", 0.0),
+                op_confuse_prob=us_config.get("op_confuse_prob", 0.0),
+                value_confuse_prob=us_config.get("value_confuse_prob", 0.0),
+                slot_confusion=us_config.get("slot_confusion"),
+                value_confusion=us_config.get("value_confusion"),
             ),
         )
 
@@ -90,6 +137,56 @@ class ConversationalSingleAgent:
             configuration["AGENT_0"]["DM"]["policy"],
         )
 
+        if policy_config.get("cache_encodings", False) or self.recorder.compact:
+            policy = self.dialogue_manager.policy
+            self.recorder.set_encoders(policy.encode_state, policy.encode_action)
+
+        if self.rng_registry is not None:
+            self.rng = self.rng_registry.random("training")
+            self.dialogue_manager.policy.np_rng = self.rng_registry.generator(
+                "policy_init"
+            )
+
+    def setup_goal_bank(self, dialogue_config):
+        """
+        Load the goal bank at goal_bank_path, or build one of goal_bank_size
+        goals (and save it there, if a path is given). Without either, goals
+        are sampled from the database for every dialogue.
+
+        :param dialogue_config: the DIALOGUE section of the configuration
+        :return: nothing
+        """
+        path = dialogue_config.get("goal_bank_path")
+        if path and os.path.isfile(path):
+            self.goal_generator.load_goal_bank(path)
+
+        elif dialogue_config.get("goal_bank_size"):
+            if self.rng_registry is not None:
+                self.goal_generator.rng = self.rng_registry.random("goal_bank")
+            self.goal_generator.build_goal_bank(dialogue_config["goal_bank_size"])
+            if path:
+                self.goal_generator.save_goal_bank(path)
+
+    def seed_dialogue(self, episode):
+        """
+        Give every stochastic component the random stream of the given
+        dialogue, so that it can be replayed independently of all others.
+
+        :param episode: the dialogue number
+        :return: nothing
+        """
+        registry = self.rng_registry
+        self.user_simulator.rng = registry.random("user_simulator", episode)
+        self.user_simulator.goal_generator.rng = registry.random("goals", episode)
+        self.user_simulator.error_model.rng = registry.generator(
+            "error_model", episode
+        )
+
+        dm_rng = registry.random("dialogue_manager", episode)
+        self.dialogue_manager.rng = dm_rng
+        self.dialogue_manager.policy.rng = dm_rng
+        self.dialogue_manager.policy.warmup_policy.rng = dm_rng
+
     def initialize(self):
 
         self.dialogue_episode = 0
@@ -105,16 +202,20 @@ class ConversationalSingleAgent:
     def start_dialogue(self, args=None):
 
         self.dialogue_turn = 0
+        if self.rng_registry is not None:
+            self.seed_dialogue(self.dialogue_episode)
         self.user_simulator.initialize()
 
         self.dialogue_manager.restart({})
-        sys_response = [DialogueAct("welcomemsg", [])]
+        sys_response = [make_act("welcomemsg")]
 
         rew, success = self.process_system_action(sys_response)
 
-        curr_state = self.dialogue_manager.get_state()
-        turnstate = TurnState(curr_state, sys_response, rew, success)
-        self.recorder.record(deepcopy(curr_state), turnstate)
+        curr_state = self.recorder.capture_state(self.dialogue_manager.get_state())
+        turnstate = TurnState(
+            curr_state, self.recorder.capture_action(sys_response), rew, success
+        )
+        self.recorder.record(curr_state, turnstate)
 
         self.dialogue_turn += 1
         self.prev_turnstate = TurnState()
@@ -138,13 +239,13 @@ class ConversationalSingleAgent:
         # Keep track of prev_state, for the DialogueEpisodeRecorder
         # Store here because this is the state that the dialogue manager
         # will use to make a decision.
-        self.curr_state = deepcopy(self.dialogue_manager.get_state())
+        self.curr_state = self.recorder.capture_state(self.dialogue_manager.get_state())
 
         if self.dialogue_turn < self.MAX_TURNS:
             sys_response = self.dialogue_manager.generate_output()
 
         else:
-            sys_response = [DialogueAct("bye", [])]
+            sys_response = [make_act("bye")]
 
         rew, success = self.process_system_action(sys_response)
 
@@ -153,14 +254,24 @@ class ConversationalSingleAgent:
 
         self.dialogue_turn += 1
 
+        # curr_state is already a capture that nothing else modifies
         self.prev_turnstate = TurnState(
-            deepcopy(self.curr_state), deepcopy(sys_response), rew, success
+            self.curr_state, self.recorder.capture_action(sys_response), rew, success
         )
 
     def end_dialogue(self):
 
         self.recorder.record(self.curr_state, self.prev_turnstate)
+        self.learn_from_dialogue(self.dialogue_turn)
+
+    def learn_from_dialogue(self, dialogue_turns):
+        """
+        Count the dialogue last added to the recorder and train the policy
+        every train_interval dialogues.
 
+        :param dialogue_turns: number of turns of the dialogue
+        :return: nothing
+        """
         if (
             self.dialogue_manager.is_training()
             and self.dialogue_episode % self.train_interval == 0
@@ -171,8 +282,8 @@ class ConversationalSingleAgent:
         self.dialogue_episode += 1
         self.cumulative_rewards += self.recorder.dialogues[-1][-1].cumulative_reward
 
-        if self.dialogue_turn > 0:
-            self.total_dialogue_turns += self.dialogue_turn
+        if dialogue_turns > 0:
+            self.total_dialogue_turns += dialogue_turns
 
         if self.dialogue_episode % 10000 == 0:
             self.dialogue_manager.save()
@@ -184,10 +295,19 @@ class ConversationalSingleAgent:
 
     def train_for_n_batches(self,num_batches):
         for _ in range(num_batches):
-            minibatch = random.sample(
-                self.recorder.dialogues, self.minibatch_length
+            minibatch = self.recorder.sample_dialogues(
+                self.minibatch_length, self.rng
             )
             self.dialogue_manager.train(minibatch)
 
+    def terminate(self):
+        """
+        Release what the agent holds open at the end of training: the
+        episode log of the recorder.
+
+        :return: nothing
+        """
+        self.recorder.close()
+
     def terminated(self):
         return self.dialogue_manager.at_terminal_state()
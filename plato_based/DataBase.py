@@ -13,16 +13,34 @@ limitations under the License.
 __author__ = "Alexandros Papangelis"
 
 from abc import abstractmethod
+from collections import OrderedDict, namedtuple
+from collections.abc import Sequence
+from contextlib import contextmanager
+from queue import Queue
 
 import os.path
 import sqlite3
+import threading
+
+import numpy as np
 
 """
 DataBase is the abstract parent class for all DataBase classes and defines the 
 interface that should be followed.
 
 SQLDataBase is an implementation of a DataBase class that can interface with 
-SQL databases.
+SQL databases. It can mirror the database file into memory and hand out a pool 
+of read-only connections for concurrent lookups; in memory, each pooled 
+connection queries its own copy.
+
+DBMetadata holds the table name, column names and row count of an SQL 
+database; SQLDataBase caches it until the database changes.
+
+LRUCache is a bounded least-recently-used cache with hit / miss / eviction 
+counters, used by SQLDataBase to cache query results.
+
+LazyDBResult holds the rows returned by an SQL query as plain tuples and
+builds the dictionary of a row only when it is accessed.
 
 JSONDataBase is an implementation of a DataBase class that can interface with 
 JSON databases (i.e. databases represented
@@ -70,36 +88,204 @@ class DataBase:
         pass
 
 
+DBMetadata = namedtuple("DBMetadata", ["table_name", "column_names", "row_count"])
+
+
+class LRUCache:
+    def __init__(self, capacity=1024):
+        """
+        Bounded cache that evicts the least recently used entry once full.
+
+        :param capacity: maximum number of entries, None for no limit
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """
+        Look up an entry and mark it as most recently used.
+
+        :param key: the key
+        :param default: returned (and counted as a miss) if key is not cached
+        :return: the cached value or default
+        """
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        """
+        Insert or update an entry, evicting the least recently used one if the
+        cache is full.
+
+        :param key: the key
+        :param value: the value
+        :return: nothing
+        """
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if self.capacity is not None and len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        :return: dictionary with size, capacity, hits, misses, evictions and
+                 hit rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def quote_identifier(name):
+    """
+    Quote a table or column name so it can be used in an SQL statement.
+
+    :param name: the identifier
+    :return: the quoted identifier
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class LazyDBResult(Sequence):
+    def __init__(self, column_names, rows):
+        """
+        Sequence of database items that keeps the raw row tuples and builds
+        the slot -> value dictionary of an item on first access.
+
+        :param column_names: names of the columns, in row order
+        :param rows: list of row tuples
+        """
+        self.column_names = column_names
+        self.rows = rows
+        self._items = [None] * len(rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyDBResult(self.column_names, self.rows[index])
+
+        item = self._items[index]
+        if item is None:
+            item = dict(zip(self.column_names, self.rows[index]))
+            self._items[index] = item
+        return item
+
+    def column(self, slot):
+        """
+        Values of one slot over all items, without building the items.
+
+        :param slot: the slot (column) name
+        :return: list of values in row order
+        """
+        column_index = self.column_names.index(slot)
+        return [row[column_index] for row in self.rows]
+
+
 class SQLDataBase(DataBase):
-    def __init__(self, filename, cache_sql_results=False):
+    def __init__(
+        self,
+        filename,
+        cache_sql_results=False,
+        in_memory=False,
+        pool_size=0,
+        cache_size=1024,
+    ):
         """
         Initialize the internal structures of the SQL Data Base
         :param filename: path to load the database from
+        :param cache_sql_results: reuse the results of repeated queries
+        :param in_memory: copy the database file into memory (backup API) and
+                          query the copy
+        :param pool_size: number of extra read-only connections that threads
+                          can borrow through connection(); 0 means all
+                          queries use SQL_connection. In memory, every pooled
+                          connection gets a private copy of the database, so
+                          readers never wait on each other's table locks; the
+                          copies are snapshots, see refresh_pool
+        :param cache_size: maximum number of cached query results (LRU),
+                           None for no limit
         """
 
         super(SQLDataBase, self).__init__(filename)
 
         self.SQL_connection = None
+        self.in_memory = in_memory
+        self.db_uri = None
+        self.connection_pool = None
+        self.pool_size = pool_size
         self.db_table_name = None
         self.cache_sql_results = cache_sql_results
-        self.result_cache = {}
+        self.result_cache = LRUCache(cache_size)
+
+        # SELECT statements per signature (sorted constrained slots); the
+        # same statement text lets sqlite reuse its compiled statement
+        self.statements = {}
+        self.value_count_statements = {}
+
+        # Slot entropies per constraint set
+        self.entropy_cache = LRUCache(cache_size)
+        # Database version the cached results and entropies belong to
+        self.cache_version = None
+
+        self.metadata = None
+        self.metadata_version = None
 
         if isinstance(filename, str):
             if os.path.isfile(filename):
-                self.SQL_connection = sqlite3.connect(self.db_file_name)
-
-                # Get Table name
-                cursor = self.SQL_connection.cursor()
-                result = cursor.execute(
-                    "select * from sqlite_master " "where type = 'table';"
-                ).fetchall()
-                if result and result[0] and result[0][1]:
-                    self.db_table_name = result[0][1]
+                if self.in_memory:
+                    self.SQL_connection = sqlite3.connect(
+                        ":memory:", check_same_thread=False
+                    )
+                    source = sqlite3.connect(self.db_file_name)
+                    source.backup(self.SQL_connection)
+                    source.close()
                 else:
-                    raise ValueError(
-                        "Dialogue Manager cannot specify Table Name from "
-                        "database {0}".format(self.db_file_name)
+                    self.db_uri = "file:{0}?mode=ro".format(
+                        os.path.abspath(self.db_file_name)
                     )
+                    self.SQL_connection = sqlite3.connect(
+                        self.db_file_name, check_same_thread=False
+                    )
+
+                # Get Table name and columns
+                metadata = self.get_metadata()
+                self.db_table_name = metadata.table_name
+                self.column_names = metadata.column_names
+
+                if pool_size > 0:
+                    self.connection_pool = Queue()
+                    self.fill_pool()
 
             else:
                 raise FileNotFoundError("Database file %s not found" % filename)
@@ -108,59 +294,115 @@ class SQLDataBase(DataBase):
                 "Unacceptable value for database file name: %s " % filename
             )
 
-    def db_lookup(self, DState, MAX_DB_RESULTS=None):
+    def open_read_only_connection(self):
         """
-        Perform an SQL query
+        Open another connection to the database that refuses writes. For an
+        in-memory database it holds its own copy of SQL_connection's database
+        (backup API), a shared-cache database would serialize the readers on
+        its table locks.
 
-        :param DState: the current dialogue state
-        :param MAX_DB_RESULTS: upper limit for results to be returned
-        :return: the results of the SQL query
+        :return: an sqlite3 connection
         """
-        # Query the database
-        cursor = self.SQL_connection.cursor()
-        sql_command = " SELECT * FROM " + self.db_table_name + " "
+        if self.in_memory:
+            connection = sqlite3.connect(":memory:", check_same_thread=False)
+            self.SQL_connection.backup(connection)
+        else:
+            connection = sqlite3.connect(
+                self.db_uri, uri=True, check_same_thread=False
+            )
+        connection.execute("PRAGMA query_only = ON;")
+        return connection
 
-        args = ""
-        prev_arg = False
-        prev_query_arg = False
-        # Impose constraints
-        for slot in DState.slots_filled:
-            if DState.slots_filled[slot] and DState.slots_filled[slot] != "dontcare":
-                if prev_arg:
-                    args += " AND "
+    def fill_pool(self):
+        for _ in range(self.pool_size):
+            self.connection_pool.put(self.open_read_only_connection())
 
-                args += slot + ' = "' + DState.slots_filled[slot] + '"'
-                prev_arg = True
+    def refresh_pool(self):
+        """
+        Replace the pooled in-memory copies with fresh copies of
+        SQL_connection's database, so that they see its changes (e.g. new
+        indexes). Waits until all pooled connections have been returned.
 
-        if args:
-            sql_command += " WHERE " + args + ";"
+        :return: nothing
+        """
+        if self.connection_pool is None or not self.in_memory:
+            return
 
-        if self.cache_sql_results and sql_command in self.result_cache:
-            result = self.result_cache[sql_command]
-        else:
-            cursor.execute(sql_command)
-            db_result = cursor.fetchall()
+        for _ in range(self.pool_size):
+            self.connection_pool.get().close()
+        self.fill_pool()
 
-            result = []
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a with block. Without a pool
+        this is SQL_connection, otherwise the block waits for a free pooled
+        read-only connection.
 
-            if db_result:
-                # Get the slot names
-                slot_names = [i[0] for i in cursor.description]
-                for db_item in db_result:
-                    result.append(dict(zip(slot_names, db_item)))
-            self.result_cache[sql_command] = result
+        :return: an sqlite3 connection
+        """
+        if self.connection_pool is None:
+            yield self.SQL_connection
+            return
 
-        if MAX_DB_RESULTS:
-            return result[:MAX_DB_RESULTS]
-        else:
-            return result
+        connection = self.connection_pool.get()
+        try:
+            yield connection
+        finally:
+            self.connection_pool.put(connection)
 
-    def get_table_name(self):
+    def close(self):
         """
-        Get the SQL database's table name
+        Close all connections; an in-memory copy is discarded.
 
-        :return: the table name
+        :return: nothing
+        """
+        if self.connection_pool is not None:
+            while not self.connection_pool.empty():
+                self.connection_pool.get().close()
+        self.SQL_connection.close()
+
+    def get_db_version(self):
         """
+        Changes whenever the database is modified, through this connection
+        (total_changes) or any other one (data_version).
+
+        :return: a comparable version stamp
+        """
+        data_version = self.SQL_connection.execute("PRAGMA data_version;").fetchone()
+        return data_version[0], self.SQL_connection.total_changes
+
+    def validate_caches(self, version=None):
+        """
+        Clear the cached query results and slot entropies (and refresh the
+        pooled in-memory copies) if the database has changed since they were
+        computed.
+
+        :param version: the current version stamp, queried if None
+        :return: nothing
+        """
+        if version is None:
+            version = self.get_db_version()
+        if version != self.cache_version:
+            self.result_cache.clear()
+            self.entropy_cache.clear()
+            if self.cache_version is not None:
+                self.refresh_pool()
+            self.cache_version = version
+
+    def get_metadata(self):
+        """
+        Table name, column names and number of rows of the database. They are
+        queried once (COUNT(*), no row is fetched) and cached until the
+        database changes.
+
+        :return: a DBMetadata
+        """
+        version = self.get_db_version()
+        if self.metadata is not None and version == self.metadata_version:
+            return self.metadata
+
+        self.validate_caches(version)
 
         cursor = self.SQL_connection.cursor()
         result = cursor.execute(
@@ -168,14 +410,226 @@ class SQLDataBase(DataBase):
         ).fetchall()
 
         if result and result[0] and result[0][1]:
-            db_table_name = result[0][1]
+            table_name = result[0][1]
         else:
             raise ValueError(
-                "Dialogue State Tracker cannot specify Table Name from "
+                "SQLDataBase cannot specify Table Name from "
                 "database {0}".format(self.db_file_name)
             )
 
-        return db_table_name
+        cursor.execute("SELECT * FROM " + quote_identifier(table_name) + " LIMIT 0;")
+        column_names = [i[0] for i in cursor.description]
+        row_count = cursor.execute(
+            "SELECT COUNT(*) FROM " + quote_identifier(table_name) + ";"
+        ).fetchone()[0]
+
+        self.metadata = DBMetadata(table_name, column_names, row_count)
+        self.metadata_version = version
+        return self.metadata
+
+    def create_indexes(self, slots, signatures=(), covering=True):
+        """
+        Create indexes so that constrained lookups do not scan the whole
+        table. Every given slot that is a column gets an index led by that
+        slot, and every signature (a tuple of slots that are constrained
+        together) a composite index over its slots. If covering, the other
+        columns follow in each index, so that the rows of a lookup and the
+        value counts of get_slot_entropies are read from the index alone.
+        In memory the indexes only go into the copy; otherwise they are
+        written into the database file, which grows accordingly (read-only
+        databases are left as they are).
+
+        :param slots: the (informable) slots to index
+        :param signatures: tuples of slots to build composite indexes for
+        :param covering: append the remaining columns to each index
+        :return: nothing
+        """
+        cursor = self.SQL_connection.cursor()
+        try:
+            for signature in [(slot,) for slot in slots] + list(signatures):
+                columns = [s for s in signature if s in self.column_names]
+                if not columns:
+                    continue
+                if covering:
+                    columns += [c for c in self.column_names if c not in columns]
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS "
+                    + quote_identifier(
+                        "idx_"
+                        + self.db_table_name
+                        + "_"
+                        + "_".join(signature)
+                        + ("_covering" if covering else "")
+                    )
+                    + " ON "
+                    + quote_identifier(self.db_table_name)
+                    + " ("
+                    + ", ".join(quote_identifier(c) for c in columns)
+                    + ");"
+                )
+            self.SQL_connection.commit()
+        except sqlite3.OperationalError as e:
+            print("SQLDataBase: cannot create indexes ({0})".format(e))
+
+        self.refresh_pool()
+
+    def get_where_clause(self, signature):
+        """
+        :param signature: tuple of the constrained slots, sorted
+        :return: the WHERE clause with one parameter per slot, or ""
+        """
+        if not signature:
+            return ""
+        return " WHERE " + " AND ".join(
+            quote_identifier(slot) + " = ?" for slot in signature
+        )
+
+    def get_statement(self, signature):
+        """
+        Get the parameterized SELECT statement for a constraint signature.
+
+        :param signature: tuple of the constrained slots, sorted
+        :return: the SQL statement, values are bound as parameters
+        """
+        if signature not in self.statements:
+            sql_command = "SELECT * FROM " + quote_identifier(self.db_table_name)
+            sql_command += self.get_where_clause(signature)
+            # Keep the order of a full table scan, whichever index is used
+            sql_command += " ORDER BY rowid;"
+            self.statements[signature] = sql_command
+
+        return self.statements[signature]
+
+    def get_value_count_statement(self, signature, slots):
+        """
+        Get the statement that counts the values of every given slot among the
+        rows that match the constraints, as (slot index, count) rows.
+
+        :param signature: tuple of the constrained slots, sorted
+        :param slots: tuple of the slots to count
+        :return: the SQL statement, the constraint values are bound once per
+                 slot
+        """
+        key = (signature, slots)
+        if key not in self.value_count_statements:
+            table = quote_identifier(self.db_table_name)
+            where_clause = self.get_where_clause(signature)
+            self.value_count_statements[key] = (
+                " UNION ALL ".join(
+                    "SELECT {0}, COUNT(*) FROM {1}{2} GROUP BY {3}".format(
+                        i, table, where_clause, quote_identifier(slot)
+                    )
+                    for i, slot in enumerate(slots)
+                )
+                + ";"
+            )
+
+        return self.value_count_statements[key]
+
+    def get_constraints(self, DState):
+        """
+        The constraints of a dialogue state as sorted (slot, value) pairs, so
+        that the order in which slots were filled does not matter.
+
+        :param DState: the current dialogue state
+        :return: tuple of (slot, value) pairs
+        """
+        return tuple(
+            sorted(
+                (slot, value)
+                for slot, value in DState.slots_filled.items()
+                if value and value != "dontcare"
+            )
+        )
+
+    def get_slot_entropies(self, DState, slots):
+        """
+        Entropy of the value distribution of each slot among the items that
+        match the constraints of the dialogue state. The values are counted
+        by sqlite (GROUP BY) in one statement and the entropies are memoized
+        per constraint set until the database changes.
+
+        :param DState: the current dialogue state
+        :param slots: the slots, e.g. the system requestable ones
+        :return: dictionary slot -> entropy
+        """
+        constraints = self.get_constraints(DState)
+        slots = tuple(slots)
+        cache_key = (constraints, slots)
+
+        self.validate_caches()
+        entropies = self.entropy_cache.get(cache_key)
+        if entropies is not None:
+            return dict(entropies)
+
+        signature = tuple(slot for slot, _ in constraints)
+        values = tuple(value for _, value in constraints)
+        with self.connection() as connection:
+            counts = connection.execute(
+                self.get_value_count_statement(signature, slots),
+                values * len(slots),
+            ).fetchall()
+
+        entropies = dict.fromkeys(slots, 0.0)
+        if counts:
+            slot_index, counts = np.array(counts, dtype=np.float64).T
+            slot_index = slot_index.astype(np.int64)
+            totals = np.bincount(slot_index, weights=counts, minlength=len(slots))
+            probabilities = counts / totals[slot_index]
+            slot_entropies = -np.bincount(
+                slot_index,
+                weights=probabilities * np.log(probabilities),
+                minlength=len(slots),
+            )
+            entropies = dict(zip(slots, slot_entropies.tolist()))
+
+        self.entropy_cache.put(cache_key, entropies)
+        return dict(entropies)
+
+    def db_lookup(self, DState, MAX_DB_RESULTS=None):
+        """
+        Perform an SQL query
+
+        :param DState: the current dialogue state
+        :param MAX_DB_RESULTS: upper limit for results to be returned
+        :return: the results of the SQL query as a LazyDBResult
+        """
+        # Impose constraints
+        constraints = self.get_constraints(DState)
+        # The sorted (slot, value) pairs are the cache key
+        cache_key = constraints
+
+        result = None
+        if self.cache_sql_results:
+            self.validate_caches()
+            result = self.result_cache.get(cache_key)
+
+        if result is None:
+            signature = tuple(slot for slot, _ in constraints)
+            values = tuple(value for _, value in constraints)
+
+            # Query the database
+            with self.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(self.get_statement(signature), values)
+                result = LazyDBResult(self.column_names, cursor.fetchall())
+
+            if self.cache_sql_results:
+                self.result_cache.put(cache_key, result)
+
+        if MAX_DB_RESULTS:
+            return result[:MAX_DB_RESULTS]
+        else:
+            return result
+
+    def get_table_name(self):
+        """
+        Get the SQL database's table name
+
+        :return: the table name
+        """
+
+        return self.get_metadata().table_name
 
 
 class JSONDataBase(DataBase):
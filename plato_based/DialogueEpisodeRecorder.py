@@ -8,24 +8,42 @@ You may obtain a copy of the License at the root directory of this project.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
+from collections.abc import Sequence
 from dataclasses import dataclass
 from typing import List
 
-from dialog_action_classes import DialogueAct
+from dialog_action_classes import DialogueAct, copy_acts
 from State import SlotFillingDialogueState
 
 __author__ = "Alexandros Papangelis"
 
 from copy import deepcopy
 
+import numpy as np
 import pickle
 import os
 import datetime
+import random
+import struct
 
 """
 The DialogueEpisodeRecorder is responsible for keeping track of the dialogue 
 experience. It has some standard fields and provides a custom field for any 
 other information we may want to keep track of.
+
+In compact mode the recorder keeps only what training needs: every dialogue is 
+a CompactDialogue with one array per field (state encoding, action encoding, 
+reward, cumulative reward). States are captured as StateCapture (encoding, 
+terminal flag and an optional, sampled full snapshot) instead of deep copies.
+
+If the recorder has a size, dialogues are kept in a DialogueRingBuffer that 
+evicts the oldest dialogue in O(1) and can also be sampled by turns.
+
+Episode logs are an append-only alternative to the single pickle of save(): 
+every finished dialogue is written as a length-prefixed pickle frame and its 
+offset is appended to a .idx sidecar file. EpisodeLogReader streams the 
+dialogues back or reads any of them by index, so logs can be larger than 
+memory.
 """
 
 
@@ -48,22 +66,525 @@ class Experience:
     input_utterance: str = None
     output_utterance: str = None
     custom: str = None
+    # Policy encodings, stored at record time if the recorder has encoders
+    state_encoding: List[int] = None
+    action_encoding: int = None
+
+
+@dataclass
+class StateCapture:
+    encoding: np.ndarray
+    terminal: bool
+    snapshot: SlotFillingDialogueState = None
+
+    def is_terminal(self):
+        return self.terminal
+
+
+class ExperienceView:
+    def __init__(self, dialogue, turn):
+        """
+        Experience-like access to one turn of a CompactDialogue, so that
+        training code can treat compact and full dialogues alike.
+
+        :param dialogue: the CompactDialogue
+        :param turn: index of the turn
+        """
+        self.dialogue = dialogue
+        self.turn = turn
+
+    @property
+    def state(self):
+        # Only available for sampled snapshots
+        return self.dialogue.snapshots.get(self.turn)
+
+    @property
+    def action(self):
+        return None
+
+    @property
+    def state_encoding(self):
+        return self.dialogue.state_encodings[self.turn]
+
+    @property
+    def action_encoding(self):
+        return int(self.dialogue.action_encodings[self.turn])
+
+    @property
+    def reward(self):
+        return float(self.dialogue.rewards[self.turn])
+
+    @reward.setter
+    def reward(self, value):
+        self.dialogue.rewards[self.turn] = value
+
+    @property
+    def cumulative_reward(self):
+        return float(self.dialogue.cumulative_rewards[self.turn])
+
+    @property
+    def success(self):
+        if self.turn == len(self.dialogue) - 1:
+            return self.dialogue.success
+        return ""
+
+
+class CompactDialogue:
+    def __init__(self, num_state_features, capacity=16):
+        """
+        Struct-of-arrays record of one dialogue. The arrays are preallocated,
+        grow by doubling and are trimmed when the dialogue ends.
+
+        :param num_state_features: length of the state encoding
+        :param capacity: initial number of turns
+        """
+        self.length = 0
+        self.state_encodings = np.zeros((capacity, num_state_features), np.int8)
+        self.action_encodings = np.zeros(capacity, np.int32)
+        self.rewards = np.zeros(capacity, np.float64)
+        self.cumulative_rewards = np.zeros(capacity, np.float64)
+        self.success = ""
+        self.snapshots = {}
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("CompactDialogue index out of range")
+        return ExperienceView(self, index)
+
+    def __iter__(self):
+        for turn in range(self.length):
+            yield ExperienceView(self, turn)
+
+    def append(self, capture, action_encoding, reward, cumulative_reward):
+        if self.length == len(self.rewards):
+            self.resize(2 * self.length)
+
+        turn = self.length
+        self.state_encodings[turn] = capture.encoding
+        self.action_encodings[turn] = action_encoding
+        self.rewards[turn] = reward
+        self.cumulative_rewards[turn] = cumulative_reward
+        if capture.snapshot is not None:
+            self.snapshots[turn] = capture.snapshot
+        self.length += 1
+
+    def resize(self, capacity):
+        self.state_encodings = np.resize(
+            self.state_encodings, (capacity, self.state_encodings.shape[1])
+        )
+        self.action_encodings = np.resize(self.action_encodings, capacity)
+        self.rewards = np.resize(self.rewards, capacity)
+        self.cumulative_rewards = np.resize(self.cumulative_rewards, capacity)
+
+    def trim(self):
+        self.resize(self.length)
+
+
+class DialogueRingBuffer(Sequence):
+    def __init__(self, capacity, dialogues=()):
+        """
+        Fixed-capacity store of dialogues; once full, appending overwrites
+        the oldest dialogue. Index 0 is always the oldest dialogue kept.
+
+        :param capacity: maximum number of dialogues
+        :param dialogues: optional dialogues to start with
+        """
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.lengths = np.zeros(capacity, dtype=np.int64)
+        self.start = 0
+        self.count = 0
+        self.num_turns = 0
+
+        # Cumulative number of turns in logical order, for the turn view
+        self.turn_offsets = None
+
+        for dialogue in dialogues:
+            self.append(dialogue)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.count))]
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("DialogueRingBuffer index out of range")
+        return self.slots[(self.start + index) % self.capacity]
+
+    def append(self, dialogue):
+        if self.count == self.capacity:
+            # Evict the oldest dialogue
+            self.num_turns -= self.lengths[self.start]
+            self.start = (self.start + 1) % self.capacity
+            self.count -= 1
+
+        slot = (self.start + self.count) % self.capacity
+        self.slots[slot] = dialogue
+        self.lengths[slot] = len(dialogue)
+        self.num_turns += len(dialogue)
+        self.count += 1
+        self.turn_offsets = None
+
+    def sample(self, k, rng=random):
+        """
+        Draw k distinct dialogues, O(k) apart from the random module's own
+        bookkeeping.
+
+        :param k: number of dialogues
+        :param rng: the random stream
+        :return: list of dialogues
+        """
+        return [self[i] for i in rng.sample(range(self.count), k)]
+
+    def get_turn(self, index):
+        """
+        Flat per-turn view: the index-th turn over all dialogues, oldest first.
+
+        :param index: turn index, 0 <= index < num_turns
+        :return: the experience of that turn
+        """
+        if self.turn_offsets is None:
+            order = (self.start + np.arange(self.count)) % self.capacity
+            self.turn_offsets = np.cumsum(self.lengths[order])
+
+        dialogue_index = int(np.searchsorted(self.turn_offsets, index, side="right"))
+        first_turn = self.turn_offsets[dialogue_index - 1] if dialogue_index else 0
+        return self[dialogue_index][int(index - first_turn)]
+
+    def sample_turns(self, k, rng=random):
+        """
+        Draw k distinct turns uniformly over all turns kept.
+
+        :param k: number of turns
+        :param rng: the random stream
+        :return: list of experiences
+        """
+        return [self.get_turn(i) for i in rng.sample(range(int(self.num_turns)), k)]
+
+
+EPISODE_LOG_MAGIC = b"PLATO-EPISODE-LOG-1\n"
+FRAME_HEADER = struct.Struct("<Q")
+
+
+def is_episode_log(path):
+    """
+    :param path: path to a dialogue file
+    :return: True if the file is an episode log (and not a single pickle)
+    """
+    with open(path, "rb") as file:
+        return file.read(len(EPISODE_LOG_MAGIC)) == EPISODE_LOG_MAGIC
+
+
+def scan_frames(file, size):
+    """
+    Walk the frame headers of an episode log.
+
+    :param file: the log, opened for binary reading
+    :param size: size of the log in bytes
+    :return: tuple (offsets of the complete frames, end of the last one)
+    """
+    offsets = []
+    offset = len(EPISODE_LOG_MAGIC)
+    while offset + FRAME_HEADER.size <= size:
+        file.seek(offset)
+        (length,) = FRAME_HEADER.unpack(file.read(FRAME_HEADER.size))
+        if offset + FRAME_HEADER.size + length > size:
+            # Truncated last frame (e.g. the run was killed while writing)
+            break
+        offsets.append(offset)
+        offset += FRAME_HEADER.size + length
+    return np.asarray(offsets, dtype=np.uint64), offset
+
+
+class EpisodeLogWriter:
+    def __init__(self, path):
+        """
+        Append-only writer of an episode log. An existing log is continued
+        after its last complete frame: a partial frame left by a crash is
+        cut off and the index is rewritten to match the frames.
+
+        :param path: path to the log, the index goes to path + '.idx'
+        """
+        self.path = path
+        self.index_path = path + ".idx"
+
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            if not is_episode_log(path):
+                raise ValueError("%s is not an episode log" % path)
+            self.file = open(path, "r+b")
+            offsets, end = scan_frames(self.file, os.path.getsize(path))
+            self.file.truncate(end)
+            self.file.seek(end)
+            offsets.astype("<u8").tofile(self.index_path)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(EPISODE_LOG_MAGIC)
+            open(self.index_path, "wb").close()
+
+        self.index_file = open(self.index_path, "ab")
+
+    def write(self, dialogue):
+        """
+        Append one dialogue and flush it to disk.
+
+        :param dialogue: the dialogue (list of Experience or CompactDialogue)
+        :return: nothing
+        """
+        data = pickle.dumps(dialogue, pickle.HIGHEST_PROTOCOL)
+        offset = self.file.tell()
+        self.file.write(FRAME_HEADER.pack(len(data)))
+        self.file.write(data)
+        self.file.flush()
+
+        self.index_file.write(FRAME_HEADER.pack(offset))
+        self.index_file.flush()
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+
+class EpisodeLogReader(Sequence):
+    def __init__(self, path):
+        """
+        Lazy, random-access view of an episode log. Offsets come from the
+        .idx sidecar, or from one scan over the frame headers if it is
+        missing or incomplete.
+
+        :param path: path to the log
+        """
+        if not is_episode_log(path):
+            raise ValueError("%s is not an episode log" % path)
+
+        self.path = path
+        self.file = open(path, "rb")
+
+        index_path = path + ".idx"
+        offsets = None
+        if os.path.isfile(index_path):
+            offsets = np.fromfile(index_path, dtype="<u8")
+            if len(offsets) and not self.is_frame_end(int(offsets[-1])):
+                offsets = None
+
+        self.offsets = offsets if offsets is not None else self.scan_offsets()
+
+    def is_frame_end(self, offset):
+        # The last indexed frame must end exactly at the end of the log
+        self.file.seek(offset)
+        header = self.file.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return False
+        (length,) = FRAME_HEADER.unpack(header)
+        return offset + FRAME_HEADER.size + length == os.path.getsize(self.path)
+
+    def scan_offsets(self):
+        return scan_frames(self.file, os.path.getsize(self.path))[0]
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("EpisodeLogReader index out of range")
+
+        self.file.seek(int(self.offsets[index]))
+        (length,) = FRAME_HEADER.unpack(self.file.read(FRAME_HEADER.size))
+        return pickle.loads(self.file.read(length))
+
+    def __iter__(self):
+        # Sequential read, one dialogue in memory at a time
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        self.file.close()
 
 
 class DialogueEpisodeRecorder:
-    def __init__(self, size=None, path=None):
+    def __init__(
+        self,
+        size=None,
+        path=None,
+        compact=False,
+        snapshot_interval=0,
+        log_path=None,
+        fast_simulation=False,
+    ):
+        """
+        :param size: maximum number of dialogues kept
+        :param path: path to load dialogues from
+        :param compact: record CompactDialogues (requires set_encoders)
+        :param snapshot_interval: in compact mode, keep a full copy of every
+                                  n-th captured state, 0 for none
+        :param log_path: episode log that every finished dialogue is
+                         appended to
+        :param fast_simulation: capture states as structural snapshots
+                                (see DialogueState.snapshot) instead of deep
+                                copies, and record captures without copying
+                                them again
+        """
         self.dialogues: List[List[Experience]] = []
+        if size:
+            self.dialogues = DialogueRingBuffer(size)
         self.size = size
         self.current_dialogue: List[Experience] = None
         self.cumulative_reward = 0
         self.path = path
 
+        self.state_encoder = None
+        self.action_encoder = None
+
+        self.compact = compact
+        self.snapshot_interval = snapshot_interval
+        self.num_captures = 0
+
+        self.fast_simulation = fast_simulation
+
+        self.log_writer = None
+        if log_path:
+            self.log_writer = EpisodeLogWriter(log_path)
+
         if path:
             self.load(path)
 
     def set_path(self, path):
         self.path = path
 
+    def set_encoders(self, state_encoder, action_encoder):
+        """
+        Encode the state and action of every recorded experience once, so
+        that training does not have to re-encode them on every pass.
+
+        :param state_encoder: function state -> state encoding
+        :param action_encoder: function actions -> action index
+        :return: nothing
+        """
+        self.state_encoder = state_encoder
+        self.action_encoder = action_encoder
+
+    def sample_dialogues(self, k, rng=random):
+        """
+        Draw k distinct dialogues by index.
+
+        :param k: number of dialogues
+        :param rng: the random stream
+        :return: list of dialogues
+        """
+        if isinstance(self.dialogues, DialogueRingBuffer):
+            return self.dialogues.sample(k, rng)
+        return [self.dialogues[i] for i in rng.sample(range(len(self.dialogues)), k)]
+
+    def sample_turns(self, k, rng=random):
+        """
+        Draw k distinct turns over all recorded dialogues.
+
+        :param k: number of turns
+        :param rng: the random stream
+        :return: list of experiences
+        """
+        if isinstance(self.dialogues, DialogueRingBuffer):
+            return self.dialogues.sample_turns(k, rng)
+
+        turn_offsets = np.cumsum([len(dialogue) for dialogue in self.dialogues])
+        turns = []
+        for index in rng.sample(range(int(turn_offsets[-1])), k):
+            dialogue_index = int(np.searchsorted(turn_offsets, index, side="right"))
+            first_turn = turn_offsets[dialogue_index - 1] if dialogue_index else 0
+            turns.append(self.dialogues[dialogue_index][int(index - first_turn)])
+        return turns
+
+    def copy_state(self, state):
+        if self.fast_simulation:
+            return state.snapshot()
+        return deepcopy(state)
+
+    def capture_state(self, state):
+        """
+        Keep the state as it is now, since the dialogue manager keeps
+        updating the same state object. In compact mode this is its encoding
+        (plus a sampled snapshot), otherwise a copy.
+
+        :param state: the current dialogue state
+        :return: StateCapture in compact mode, else a copy of the state
+        """
+        if not self.compact:
+            return self.copy_state(state)
+
+        snapshot = None
+        if self.snapshot_interval and self.num_captures % self.snapshot_interval == 0:
+            snapshot = self.copy_state(state)
+        self.num_captures += 1
+
+        return StateCapture(
+            np.asarray(self.state_encoder(state), dtype=np.int8),
+            state.is_terminal(),
+            snapshot,
+        )
+
+    def capture_action(self, actions):
+        """
+        :param actions: the system's dialogue acts
+        :return: the action encoding in compact mode, else a copy of the acts
+        """
+        if not self.compact:
+            return copy_acts(actions)
+        return self.action_encoder(actions)
+
+    def record_compact(self, turnstate: TurnState, force_terminate=False):
+        """
+        Append a turn whose state is a StateCapture and whose action is
+        already encoded (see capture_state and capture_action).
+        """
+        self.cumulative_reward += turnstate.reward
+
+        if not self.current_dialogue:
+            self.current_dialogue = CompactDialogue(len(turnstate.state.encoding))
+
+        self.current_dialogue.append(
+            turnstate.state,
+            turnstate.action,
+            turnstate.reward,
+            self.cumulative_reward,
+        )
+
+        if turnstate.state.is_terminal() or force_terminate:
+            if turnstate.success is not None:
+                self.current_dialogue.success = turnstate.success
+            self.current_dialogue.trim()
+            self.finish_dialogue()
+
+    def finish_dialogue(self):
+        self.add_dialogue(self.current_dialogue)
+        self.current_dialogue = []
+        self.cumulative_reward = 0
+
+    def add_dialogue(self, dialogue):
+        """
+        Add a complete dialogue, e.g. one recorded by another process.
+
+        :param dialogue: list of Experiences or CompactDialogue
+        :return: nothing
+        """
+        if self.log_writer is not None:
+            self.log_writer.write(dialogue)
+
+        # With a size the ring buffer evicts the oldest dialogue itself
+        self.dialogues.append(dialogue)
+
     def record(
         self,
         new_state,
@@ -73,6 +594,10 @@ class DialogueEpisodeRecorder:
         force_terminate=False,
         custom=None,
     ):
+        if self.compact:
+            self.record_compact(turnstate, force_terminate)
+            return
+
         # TODO: what does len(actions)==0 mean ??
         self.cumulative_reward += turnstate.reward
 
@@ -80,17 +605,32 @@ class DialogueEpisodeRecorder:
         if self.current_dialogue is None:
             self.current_dialogue = []
 
+        state_encoding = None
+        if self.state_encoder is not None:
+            state_encoding = self.state_encoder(turnstate.state)
+
+        action_encoding = None
+        if self.action_encoder is not None:
+            action_encoding = self.action_encoder(turnstate.action)
+
+        # Captures from capture_state are already private copies
+        state = turnstate.state
+        if not self.fast_simulation:
+            state, new_state = deepcopy(state), deepcopy(new_state)
+
         self.current_dialogue.append(
             Experience(
-                state=deepcopy(turnstate.state),
-                new_state=deepcopy(new_state),
-                action=deepcopy(turnstate.action),
+                state=state,
+                new_state=new_state,
+                action=copy_acts(turnstate.action),
                 reward=deepcopy(turnstate.reward),
                 input_utterance=deepcopy(input_utterance) if input_utterance else "",
                 output_utterance=deepcopy(output_utterance) if output_utterance else "",
                 success="",
                 cumulative_reward=deepcopy(self.cumulative_reward),
                 custom=deepcopy(custom) if custom else "",
+                state_encoding=state_encoding,
+                action_encoding=action_encoding,
             )
         )
 
@@ -98,13 +638,18 @@ class DialogueEpisodeRecorder:
             if turnstate.success is not None:
                 self.current_dialogue[-1].success = turnstate.success
 
-            # Check if maximum size has been reached
-            if self.size and len(self.dialogues) >= self.size:
-                self.dialogues = self.dialogues[(len(self.dialogues) - self.size + 1) :]
+            self.finish_dialogue()
 
-            self.dialogues.append(self.current_dialogue)
-            self.current_dialogue = []
-            self.cumulative_reward = 0
+    def close(self):
+        """
+        Close the episode log, if there is one. Dialogues recorded afterwards
+        are only kept in memory.
+
+        :return: nothing
+        """
+        if self.log_writer is not None:
+            self.log_writer.close()
+            self.log_writer = None
 
     def save(self, path=None):
 
@@ -115,7 +660,7 @@ class DialogueEpisodeRecorder:
             path = f"Logs/Dialogues{datetime.datetime.now().isoformat()}.pkl"
             print("No Log file name provided. Using default: {0}".format(path))
 
-        obj = {"dialogues": self.dialogues}
+        obj = {"dialogues": list(self.dialogues)}
 
         try:
             with open(path, "wb") as file:
@@ -126,6 +671,18 @@ class DialogueEpisodeRecorder:
                 "Dialogue Episode Recorder I/O Error when " "attempting to save!"
             )
 
+    def save_log(self, path):
+        """
+        Append all dialogues kept in memory to an episode log.
+
+        :param path: path to the log
+        :return: nothing
+        """
+        writer = EpisodeLogWriter(path)
+        for dialogue in self.dialogues:
+            writer.write(dialogue)
+        writer.close()
+
     def load(self, path):
 
         if not path:
@@ -144,11 +701,28 @@ class DialogueEpisodeRecorder:
             if os.path.isfile(path):
                 print(f"Dialogue Episode Recorder loading dialogues from " f"{path}...")
 
+                if is_episode_log(path):
+                    # Streams the log; with a size only the newest dialogues
+                    # stay in memory
+                    reader = EpisodeLogReader(path)
+                    if self.size:
+                        self.dialogues = DialogueRingBuffer(self.size, reader)
+                    else:
+                        self.dialogues = list(reader)
+                    reader.close()
+
+                    print("Dialogue Episode Recorder loaded from {0}.".format(path))
+                    return
+
                 with open(path, "rb") as file:
                     obj = pickle.load(file)
 
                     if "dialogues" in obj:
                         self.dialogues = obj["dialogues"]
+                        if self.size:
+                            self.dialogues = DialogueRingBuffer(
+                                self.size, self.dialogues
+                            )
 
                     print("Dialogue Episode Recorder loaded from {0}.".format(path))
 
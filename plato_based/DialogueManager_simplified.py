@@ -1,19 +1,17 @@
 from typing import List
 
-from dialog_action_classes import DialogueAct, DialogueActItem, Operator
+from dialog_action_classes import DialogueAct, DialogueActItem, Operator, freeze_act
 from DialogueEpisodeRecorder import Experience
 from dummy_dialog_state_tracker import DummyStateTracker
 from ReinforcePolicy import ReinforcePolicy
+from parameter_backends import make_backend
 
 from Ontology import Ontology
 from DataBase import SQLDataBase
 
-from copy import deepcopy
-
 from ConversationalModule import ConversationalModule
 
 import random
-import math
 
 """
 The DialogueManager consists of a DialogueStateTracker and a DialoguePolicy. 
@@ -25,11 +23,7 @@ querying its DialoguePolicy.
 
 
 def get_num_db_items(database: SQLDataBase):
-    cursor = database.SQL_connection.cursor()
-    cursor.execute("SELECT * FROM " + database.get_table_name())
-    tmp = cursor.fetchall()
-    num_db_items = len(tmp)
-    return num_db_items
+    return database.get_metadata().row_count
 
 
 class DialogueManager(ConversationalModule):
@@ -41,6 +35,7 @@ class DialogueManager(ConversationalModule):
         agent_id: int,
         agent_role: str,
         policy_args: dict,
+        rng=None,
     ):
         """
         Parses the arguments in the dictionary and initializes the appropriate
@@ -67,6 +62,7 @@ class DialogueManager(ConversationalModule):
         self.dialogue_counter = 0
         self.CALCULATE_SLOT_ENTROPIES = True
         self.ontology = ontology
+        self.rng = rng if rng is not None else random
 
         assert policy_args["type"] == "reinforce"
         alpha, alpha_decay, epsilon, epsilon_decay, gamma = self.get_RL_params(
@@ -82,6 +78,14 @@ class DialogueManager(ConversationalModule):
             gamma=gamma,
             alpha_decay=alpha_decay,
             epsilon_decay=epsilon_decay,
+            rng=self.rng,
+            batch_training=bool(policy_args.get("batch_training", False)),
+            lean_inference=bool(policy_args.get("lean_inference", False)),
+            backend=make_backend(
+                policy_args.get("weights_backend", "numpy"),
+                policy_args.get("weights_dtype"),
+                policy_args.get("weights_num_threads"),
+            ),
         )
 
         if "train" in policy_args:
@@ -140,9 +144,9 @@ class DialogueManager(ConversationalModule):
         d_state = self.DSTracker.get_state()
 
         sys_acts = self.policy.next_action(d_state)
-        # Copy the sys_acts to be able to iterate over all sys_acts while also
-        # replacing some acts
-        sys_acts_copy = deepcopy(sys_acts)
+        # Copy the list of sys_acts to be able to iterate over all sys_acts
+        # while also replacing some acts (the acts themselves are not modified)
+        sys_acts_copy = list(sys_acts)
         new_sys_acts = []
 
         # Safeguards to support policies that make decisions on intents only
@@ -150,7 +154,7 @@ class DialogueManager(ConversationalModule):
         for sys_act in sys_acts:
             if not sys_act.params:
                 handle_empty_params(
-                    d_state, new_sys_acts, sys_act, sys_acts, sys_acts_copy
+                    d_state, new_sys_acts, sys_act, sys_acts, sys_acts_copy, self.rng
                 )
 
         # Append unique new sys acts
@@ -158,6 +162,9 @@ class DialogueManager(ConversationalModule):
             if sa not in sys_acts_copy:
                 sys_acts_copy.append(sa)
 
+        # Frozen acts can be shared by the state, the recorder and the user
+        # simulator without copies
+        sys_acts_copy = [freeze_act(sys_act) for sys_act in sys_acts_copy]
         self.DSTracker.update_state_sysact(sys_acts_copy)
 
         return sys_acts_copy
@@ -171,7 +178,7 @@ class DialogueManager(ConversationalModule):
         if db_result:
             # Calculate entropy of requestable slot values in results -
             # if the flag is off this will be empty
-            entropies = self.get_slot_entropies(db_result)
+            entropies = self.get_slot_entropies(d_state)
 
             return db_result[: self.MAX_DB_RESULTS], entropies
         else:
@@ -181,38 +188,13 @@ class DialogueManager(ConversationalModule):
             # print('Warning! Database call retrieved zero results.')
             return ["empty"], {}
 
-    def get_slot_entropies(self, db_result):
-        entropies = dict.fromkeys(self.ontology.ontology["system_requestable"])
-        if self.CALCULATE_SLOT_ENTROPIES:
-            value_probabilities = {}
-
-            # Count the values
-            for req_slot in self.ontology.ontology["system_requestable"]:
-                value_probabilities[req_slot] = {}
-
-                for db_item in db_result:
-                    if db_item[req_slot] not in value_probabilities[req_slot]:
-                        value_probabilities[req_slot][db_item[req_slot]] = 1
-                    else:
-                        value_probabilities[req_slot][db_item[req_slot]] += 1
-
-            # Calculate probabilities
-            for slot in value_probabilities:
-                for value in value_probabilities[slot]:
-                    value_probabilities[slot][value] /= len(db_result)
-
-            # Calculate entropies
-            for slot in entropies:
-                entropies[slot] = 0
-
-                if slot in value_probabilities:
-                    for value in value_probabilities[slot]:
-                        entropies[slot] += value_probabilities[slot][value] * math.log(
-                            value_probabilities[slot][value]
-                        )
+    def get_slot_entropies(self, d_state):
+        if not self.CALCULATE_SLOT_ENTROPIES:
+            return dict.fromkeys(self.ontology.ontology["system_requestable"])
 
-                entropies[slot] = -entropies[slot]
-        return entropies
+        return self.database.get_slot_entropies(
+            d_state, self.ontology.ontology["system_requestable"]
+        )
 
     def restart(self, args):
         num_db_items = get_num_db_items(self.database)
@@ -270,23 +252,29 @@ class DialogueManager(ConversationalModule):
 #######################################################################################
 
 
-def handle_empty_params(d_state, new_sys_acts, sys_act, sys_acts, sys_acts_copy):
+def handle_empty_params(
+    d_state, new_sys_acts, sys_act, sys_acts, sys_acts_copy, rng=random
+):
     if sys_act.intent == "canthelp":
-        cant_help(d_state, new_sys_acts, sys_act, sys_acts_copy)
+        cant_help(d_state, new_sys_acts, sys_act, sys_acts_copy, rng)
 
     elif sys_act.intent == "offer":
         sys_offer(d_state, new_sys_acts, sys_act, sys_acts, sys_acts_copy)
 
     elif sys_act.intent == "inform" and not sys_act.params[0].value:
 
-        sys_inform(d_state, new_sys_acts, sys_act)
+        sys_inform(d_state, new_sys_acts, sys_act, rng)
         sys_acts_copy.remove(sys_act)
 
     elif sys_act.intent == "request":
-        handle_empty_request_action(d_state, new_sys_acts, sys_act, sys_acts_copy)
+        handle_empty_request_action(
+            d_state, new_sys_acts, sys_act, sys_acts_copy, rng
+        )
 
 
-def handle_empty_request_action(d_state, new_sys_acts, sys_act, sys_acts_copy):
+def handle_empty_request_action(
+    d_state, new_sys_acts, sys_act, sys_acts_copy, rng=random
+):
     def get_unfilled_slot(d_state):
         for slot in d_state.slots_filled:
             if not d_state.slots_filled[slot]:
@@ -304,7 +292,7 @@ def handle_empty_request_action(d_state, new_sys_acts, sys_act, sys_acts_copy):
             "request",
             [
                 DialogueActItem(
-                    random.choice(list(d_state.slots_filled.keys())[:-1]),
+                    rng.choice(list(d_state.slots_filled.keys())[:-1]),
                     Operator.EQ,
                     "",
                 )
@@ -320,13 +308,13 @@ def handle_empty_request_action(d_state, new_sys_acts, sys_act, sys_acts_copy):
     sys_acts_copy.remove(sys_act)
 
 
-def sys_inform(d_state, new_sys_acts, sys_act):
+def sys_inform(d_state, new_sys_acts, sys_act, rng=random):
     if sys_act.params:
         slot = sys_act.params[0].slot
     else:
         slot = d_state.requested_slot
     if not slot:
-        slot = random.choice(list(d_state.slots_filled.keys()))
+        slot = rng.choice(list(d_state.slots_filled.keys()))
     if d_state.item_in_focus:
         if slot not in d_state.item_in_focus or not d_state.item_in_focus[slot]:
             new_sys_acts.append(
@@ -397,10 +385,10 @@ def sys_offer(d_state, new_sys_acts, sys_act, sys_acts, sys_acts_copy):
                     )
 
 
-def cant_help(d_state, new_sys_acts, sys_act, sys_acts_copy):
+def cant_help(d_state, new_sys_acts, sys_act, sys_acts_copy, rng=random):
     slots = [s for s in d_state.slots_filled if d_state.slots_filled[s]]
     if slots:
-        slot = random.choice(slots)
+        slot = rng.choice(slots)
 
         # Remove the empty canthelp
         sys_acts_copy.remove(sys_act)
@@ -12,34 +12,78 @@ limitations under the License.
 __author__ = "Alexandros Papangelis"
 
 from Ontology import Ontology
-from dialog_action_classes import Operator
-import random
+from dialog_action_classes import Operator, replace_item, replace_params
+import numpy as np
 
 """
 The ErrorModel simulates ASR or NLU errors when the Simulated Usr emits 
 actions.
+
+Slots, values and operators come from the compiled ontology, and all random
+decisions for an act are drawn with a single numpy call. By default a slot or
+value is confused with any other one uniformly at random; per-slot confusion
+weights make some confusions more likely than others.
 """
 
 
+def confusion_cdfs(labels, confusion):
+    """
+    Cumulative confusion matrix over labels. Row i is the distribution of the
+    label that labels[i] is confused with.
+
+    :param labels: list of labels
+    :param confusion: dict label -> dict (confused label -> weight); labels
+                      without weights are confused uniformly
+    :return: numpy array of shape (len(labels), len(labels)), or None if
+             there are no weights at all
+    """
+    if not confusion:
+        return None
+
+    index = {label: i for i, label in enumerate(labels)}
+    matrix = np.ones((len(labels), len(labels)))
+    for label, weights in confusion.items():
+        if label in index:
+            matrix[index[label]] = 0.0
+            for other, weight in weights.items():
+                if other in index:
+                    matrix[index[label], index[other]] = weight
+
+    cdfs = np.cumsum(matrix / matrix.sum(axis=1, keepdims=True), axis=1)
+    cdfs[:, -1] = 1.0
+    return cdfs
+
+
 # Class modeling semantic and other errors
 class ErrorModel:
     def __init__(
-        self, ontology, slot_confuse_prob, op_confuse_prob, value_confuse_prob
+        self,
+        ontology,
+        slot_confuse_prob,
+        op_confuse_prob,
+        value_confuse_prob,
+        rng=None,
+        slot_confusion=None,
+        value_confusion=None,
     ):
         """
         Initialize the internal structures of the Error Model
 
         :param ontology: the domain Domain
-        :param slot_confuse_prob: a list of probabilities by which slots will
-                                  be confused
-        :param op_confuse_prob: a list of probabilities by which operators will
-                                be confused
-        :param value_confuse_prob: a list of probabilities by which values will
-                                   be confused
+        :param slot_confuse_prob: probability by which slots will be confused
+        :param op_confuse_prob: probability by which operators will be
+                                confused
+        :param value_confuse_prob: probability by which values will be
+                                   confused
+        :param rng: numpy random Generator, defaults to numpy's global stream
+        :param slot_confusion: dict slot -> dict (confused slot -> weight)
+        :param value_confusion: dict slot -> dict value -> dict (confused
+                                value -> weight)
         """
         self.slot_confuse_prob = slot_confuse_prob
         self.op_confuse_prob = op_confuse_prob
         self.value_confuse_prob = value_confuse_prob
+        self.rng = rng if rng is not None else np.random
 
         self.ontology = None
         if isinstance(ontology, Ontology):
@@ -47,52 +91,156 @@ class ErrorModel:
         else:
             raise ValueError("Unacceptable ontology type %s " % ontology)
 
+        index = self.ontology.compile()
+        self.informable_slots = index.categories["informable"]
+        self.informable_index = index.positions["informable"]
+        self.requestable_slots = index.categories["requestable"]
+        self.requestable_index = index.positions["requestable"]
+        self.operators = list(Operator)
+
+        self.values = index.values
+        self.value_index = index.value_ids
+
+        self.informable_cdfs = confusion_cdfs(self.informable_slots, slot_confusion)
+        self.requestable_cdfs = confusion_cdfs(self.requestable_slots, slot_confusion)
+        value_confusion = value_confusion or {}
+        self.value_cdfs = {
+            slot: confusion_cdfs(self.values[slot], value_confusion.get(slot))
+            for slot in self.informable_slots
+        }
+
+    def is_noisy(self):
+        return (
+            self.slot_confuse_prob > 0
+            or self.op_confuse_prob > 0
+            or self.value_confuse_prob > 0
+        )
+
+    @staticmethod
+    def draw(labels, cdfs, row, u):
+        """
+        :param labels: list of labels
+        :param cdfs: cumulative confusion matrix over labels, or None
+        :param row: index of the label to confuse, None if unknown
+        :param u: uniform random number in [0, 1)
+        :return: the label it is confused with
+        """
+        if cdfs is None or row is None:
+            return labels[int(u * len(labels))]
+        return labels[int(np.searchsorted(cdfs[row], u, side="right"))]
+
     def semantic_noise(self, act):
         """
         Simulates semantic noise. It receives an act and introduces errors
-        given the Error Model's probabilities.
+        given the Error Model's probabilities. The act is not modified
+        (copy-on-write): if anything is confused a new act is returned.
 
         :param act: the act to be confused
         :return: the confused act
         """
-        if act.intent == "inform":
-            for item in act.params:
-                if item.slot in self.ontology.ontology["informable"]:
-                    if random.random() < self.slot_confuse_prob and item.slot:
-                        item.slot = random.choice(
-                            list(self.ontology.ontology["informable"].keys())
-                        )
-                        item.value = random.choice(
-                            self.ontology.ontology["informable"][item.slot]
-                        )
-
-                    if random.random() < self.op_confuse_prob:
-                        item.op = random.choice(Operator)
-
-                    if random.random() < self.value_confuse_prob:
-                        item.value = random.choice(
-                            self.ontology.ontology["informable"][item.slot]
-                        )
-                else:
-                    # We're not raising errors here because the simulated user
-                    # may be following a statistical policy
-                    print(
-                        "Warning! ErrorModel: Slot {0} not in informable "
-                        "slots!".format(item.slot)
-                    )
+        if not act.params or not self.is_noisy():
+            return act
 
+        if act.intent == "inform":
+            params = self.confuse_inform_items(act.params)
         elif act.intent == "request":
-            for item in act.params:
-                if random.random() < self.slot_confuse_prob:
-                    if item.slot in self.ontology.ontology["requestable"]:
-                        item.slot = random.choice(self.ontology.ontology["requestable"])
-                        item.value = ""
-                    else:
-                        # We're not raising an error here because the simulated
-                        # user may be following a statistical policy
-                        print(
-                            "Warning! ErrorModel: Slot {0} not in "
-                            "requestable slots!".format(item.slot)
-                        )
-
-        return act
+            params = self.confuse_request_items(act.params)
+        else:
+            return act
+
+        if all(new is old for new, old in zip(params, act.params)):
+            return act
+        return replace_params(act, params)
+
+    def confuse_inform_items(self, items):
+        """
+        Seven uniforms are drawn per item, whether or not the item is
+        confused and even if only one of the probabilities is non-zero, so
+        that seeded traces do not depend on the confusion probabilities.
+
+        :param items: the DialogueActItems of an inform act
+        :return: list of the items, confused ones replaced by copies
+        """
+        # Per item: confuse slot?, new slot, its value, confuse op?, new op,
+        # confuse value?, new value
+        u = self.rng.random((len(items), 7))
+        confuse_slot = u[:, 0] < self.slot_confuse_prob
+        confuse_op = u[:, 3] < self.op_confuse_prob
+        confuse_value = u[:, 5] < self.value_confuse_prob
+
+        params = []
+        for i, item in enumerate(items):
+            if item.slot not in self.informable_index:
+                # We're not raising errors here because the simulated user
+                # may be following a statistical policy
+                print(
+                    "Warning! ErrorModel: Slot {0} not in informable "
+                    "slots!".format(item.slot)
+                )
+                params.append(item)
+                continue
+
+            if not (confuse_slot[i] or confuse_op[i] or confuse_value[i]):
+                params.append(item)
+                continue
+
+            slot, value = item.slot, item.value
+            changes = {}
+            if confuse_slot[i] and slot:
+                slot = changes["slot"] = self.draw(
+                    self.informable_slots,
+                    self.informable_cdfs,
+                    self.informable_index[slot],
+                    u[i, 1],
+                )
+                value = changes["value"] = self.values[slot][
+                    int(u[i, 2] * len(self.values[slot]))
+                ]
+
+            if confuse_op[i]:
+                changes["op"] = self.operators[int(u[i, 4] * len(self.operators))]
+
+            if confuse_value[i]:
+                changes["value"] = self.draw(
+                    self.values[slot],
+                    self.value_cdfs[slot],
+                    self.value_index[slot].get(value),
+                    u[i, 6],
+                )
+
+            params.append(replace_item(item, **changes) if changes else item)
+
+        return params
+
+    def confuse_request_items(self, items):
+        """
+        Like confuse_inform_items, a fixed two uniforms are drawn per item.
+
+        :param items: the DialogueActItems of a request act
+        :return: list of the items, confused ones replaced by copies
+        """
+        u = self.rng.random((len(items), 2))
+        confuse_slot = u[:, 0] < self.slot_confuse_prob
+
+        params = []
+        for i, item in enumerate(items):
+            if not confuse_slot[i]:
+                params.append(item)
+            elif item.slot in self.requestable_index:
+                slot = self.draw(
+                    self.requestable_slots,
+                    self.requestable_cdfs,
+                    self.requestable_index[item.slot],
+                    u[i, 1],
+                )
+                params.append(replace_item(item, slot=slot, value=""))
+            else:
+                # We're not raising an error here because the simulated
+                # user may be following a statistical policy
+                print(
+                    "Warning! ErrorModel: Slot {0} not in "
+                    "requestable slots!".format(item.slot)
+                )
+                params.append(item)
+
+        return params
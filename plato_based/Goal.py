@@ -25,6 +25,10 @@ from DataBase import DataBase, SQLDataBase, JSONDataBase
 The Goal represents Simulated Usr goals, that are composed of a set of 
 constraints and a set of requests. Goals can be simple or complex, depending 
 on whether they have subgoals or not.
+
+The GoalBank is a pregenerated pool of simple goals, stored compactly as 
+tuples, from which the GoalGenerator can draw a fresh Goal in O(1). A saved 
+bank gives identical goal sets across benchmarking and evaluation runs.
 """
 
 
@@ -74,8 +78,72 @@ class Goal:
         return ret
 
 
+class GoalBank:
+    def __init__(self, entries=None):
+        """
+        :param entries: list of (constraints, requests) tuples, where
+                        constraints is a tuple of (slot, value) pairs and
+                        requests is a tuple of slots
+        """
+        self.entries = entries if entries is not None else []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, goal):
+        """
+        Store a (simple) goal in compact form.
+
+        :param goal: the Goal
+        :return: nothing
+        """
+        self.entries.append(
+            (
+                tuple((slot, item.value) for slot, item in goal.constraints.items()),
+                tuple(goal.requests),
+            )
+        )
+
+    def get_goal(self, index):
+        """
+        Materialize the goal at index. Every call builds a new Goal, as the
+        user simulator modifies its goal during the dialogue.
+
+        :param index: position of the goal in the bank
+        :return: a Goal
+        """
+        constraints, requests = self.entries[index]
+
+        goal = Goal()
+        for slot, value in constraints:
+            goal.constraints[slot] = DialogueActItem(slot, Operator.EQ, value)
+        for slot in requests:
+            goal.requests[slot] = DialogueActItem(slot, Operator.EQ, [])
+
+        return goal
+
+    def draw(self, rng=random):
+        """
+        :param rng: the random stream to draw with
+        :return: a new Goal built from a uniformly drawn entry
+        """
+        return self.get_goal(rng.randrange(len(self.entries)))
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            pickle.dump(self.entries, file, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.isfile(path):
+            raise FileNotFoundError("Goal bank file %s not found" % path)
+
+        with open(path, "rb") as file:
+            return cls(pickle.load(file))
+
+
 class GoalGenerator:
-    def __init__(self, ontology, database):
+    def __init__(self, ontology, database, rng=None):
         self.ontology = None
         if isinstance(ontology, Ontology.Ontology):
             self.ontology = ontology
@@ -96,49 +164,70 @@ class GoalGenerator:
         else:
             raise ValueError("Unacceptable database type %s " % database)
 
-        self.goals = None
+        self.goal_bank = None
+        self.rng = rng if rng is not None else random
 
-        cursor = self.database.SQL_connection.cursor()
+        metadata = self.database.get_metadata()
+        self.db_table_name = metadata.table_name
+        self.slot_names = metadata.column_names
+        self.db_row_count = metadata.row_count
 
-        result = cursor.execute(
-            "select * from sqlite_master where type = 'table';"
-        ).fetchall()
-        if result and result[0] and result[0][1]:
-            self.db_table_name = result[0][1]
-        else:
-            raise ValueError(
-                "Goal Generator cannot specify Table Name from "
-                "database {0}".format(self.database.db_file_name)
-            )
+    def get_db_item(self, rowid):
+        """
+        Fetch one row of the database table.
+
+        :param rowid: the row's ROWID
+        :return: the row tuple or None
+        """
+        with self.database.connection() as connection:
+            return connection.execute(
+                "SELECT * FROM " + self.db_table_name + " WHERE ROWID == (?);",
+                (rowid,),
+            ).fetchone()
+
+    def build_goal_bank(self, num_goals):
+        """
+        Sample num_goals goals from the database and keep them as the bank
+        that generate() draws from.
+
+        :param num_goals: size of the bank
+        :return: the GoalBank
+        """
+        self.goal_bank = None
+        goal_bank = GoalBank()
+        for _ in range(num_goals):
+            goal_bank.add(self.generate())
+
+        self.goal_bank = goal_bank
+        return goal_bank
 
-        # Dummy SQL command
-        sql_command = "SELECT * FROM " + self.db_table_name + " LIMIT 1;"
+    def load_goal_bank(self, path):
+        """
+        Load a saved bank that generate() will draw from.
 
-        cursor.execute(sql_command)
-        self.slot_names = [i[0] for i in cursor.description]
+        :param path: path to the goal bank file
+        :return: the GoalBank
+        """
+        self.goal_bank = GoalBank.load(path)
+        return self.goal_bank
 
-        self.db_row_count = cursor.execute(
-            "SELECT COUNT(*) FROM " + self.db_table_name + ";"
-        ).fetchall()[0][0]
+    def save_goal_bank(self, path):
+        """
+        :param path: path to save the current goal bank to
+        :return: nothing
+        """
+        if not self.goal_bank:
+            raise ValueError("GoalGenerator: no goal bank to save")
+
+        self.goal_bank.save(path)
 
     def generate(self):
 
-        if self.goals:
-            return random.choice(self.goals)
+        if self.goal_bank:
+            return self.goal_bank.draw(self.rng)
 
         # Randomly pick an item from the database
-        cursor = self.database.SQL_connection.cursor()
-
-        sql_command = (
-            "SELECT * FROM "
-            + self.db_table_name
-            + " WHERE ROWID == ("
-            + str(random.randint(1, self.db_row_count))
-            + ");"
-        )
-
-        cursor.execute(sql_command)
-        db_result = cursor.fetchone()
+        db_result = self.get_db_item(self.rng.randint(1, self.db_row_count))
 
         attempt = 0
         while attempt < 3 and not db_result:
@@ -147,16 +236,7 @@ class GoalGenerator:
             )
             print(f"Trying again (attempt {attempt} out of 3)...")
 
-            sql_command = (
-                "SELECT * FROM "
-                + self.db_table_name
-                + " WHERE ROWID == ("
-                + str(random.randint(1, self.db_row_count))
-                + ");"
-            )
-
-            cursor.execute(sql_command)
-            db_result = cursor.fetchone()
+            db_result = self.get_db_item(self.rng.randint(1, self.db_row_count))
 
             attempt += 1
 
@@ -174,15 +254,14 @@ class GoalGenerator:
         # TODO: Sample from all available operators, not just '='
         # (where applicable)
 
-        inf_slots = random.sample(
-            list(self.ontology.ontology["informable"].keys()),
-            random.randint(2, len(self.ontology.ontology["informable"])),
+        slots = self.ontology.compile().categories
+        inf_slots = self.rng.sample(
+            slots["informable"], self.rng.randint(2, len(slots["informable"]))
         )
 
         # Sample requests from requestable slots
-        req_slots = random.sample(
-            self.ontology.ontology["requestable"],
-            random.randint(0, len(self.ontology.ontology["requestable"])),
+        req_slots = self.rng.sample(
+            slots["requestable"], self.rng.randint(0, len(slots["requestable"]))
         )
 
         # Remove slots for which the user places constraints
@@ -199,8 +278,8 @@ class GoalGenerator:
 
         # Shuffle informable and requestable slots to create some variety
         # when pushing into the agenda.
-        random.shuffle(inf_slots)
-        random.shuffle(req_slots)
+        self.rng.shuffle(inf_slots)
+        self.rng.shuffle(req_slots)
 
         for slot in inf_slots:
             # Check that the slot has a value in the retrieved item
@@ -34,8 +34,8 @@ def build_inform_act(dialogue_state: SlotFillingDialogueState):
     return dact
 
 
-def make_request(unfilled_slots):
-    slot = random.choice(unfilled_slots)
+def make_request(unfilled_slots, rng=random):
+    slot = rng.choice(unfilled_slots)
     dacts = [DialogueAct("request", [DialogueActItem(slot, Operator.EQ, "")])]
     return dacts
 
@@ -62,9 +62,10 @@ def build_inform(slot, ds: SlotFillingDialogueState):
 
 
 class HandcraftedPolicy:
-    def __init__(self, ontology: Ontology.Ontology):
+    def __init__(self, ontology: Ontology.Ontology, rng=None):
         super(HandcraftedPolicy, self).__init__()
         self.ontology = ontology
+        self.rng = rng if rng is not None else random
 
     def next_action(self, ds: SlotFillingDialogueState):
         if ds.is_terminal_state:
@@ -78,11 +79,11 @@ class HandcraftedPolicy:
     def request_slots_or_make_offer(self, ds: SlotFillingDialogueState):
         unfilled_slots = [
             s
-            for s in self.ontology.ontology["system_requestable"]
+            for s in self.ontology.compile().categories["system_requestable"]
             if ds.slots_filled[s] is None
         ]
         if len(unfilled_slots) > 0:
-            dacts = make_request(unfilled_slots)
+            dacts = make_request(unfilled_slots, self.rng)
         elif ds.item_in_focus:
             dacts = make_offer(ds)
         else:
@@ -1,12 +1,228 @@
+import hashlib
 import json
+import pickle
+
+import numpy as np
+
+"""
+An OntologyIndex is the compiled form of an Ontology: stable integer ids for
+slots, values (per slot) and intents with O(1) lookups in both directions, and
+per slot category (informable, requestable, system_requestable) the ordered
+slot list, the slots' positions in it, their ids and a boolean mask over all
+slot ids. Encoders and noise models build on it instead of turning the raw
+ontology's dicts into lists and searching them.
+
+An index compiled from an ontology file records the file's path and a hash of
+its content, so that a saved index can be checked against the file.
+"""
+
+SLOT_CATEGORIES = ["informable", "requestable", "system_requestable"]
+
+# Intents used when the ontology does not list its own
+DEFAULT_INTENTS = [
+    "inform",
+    "offer",
+    "request",
+    "canthelp",
+    "affirm",
+    "negate",
+    "deny",
+    "ack",
+    "thankyou",
+    "bye",
+    "reqmore",
+    "hello",
+    "welcomemsg",
+    "expl-conf",
+    "select",
+    "repeat",
+    "reqalts",
+    "confirm-domain",
+    "confirm",
+    "restart",
+    "ack_subgoal",
+]
+
+
+def file_hash(path):
+    """
+    :param path: path to a file
+    :return: hex SHA-256 digest of the file's content
+    """
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+class OntologyIndex:
+    def __init__(
+        self, categories, values, intents, source_path=None, source_hash=None
+    ):
+        """
+        :param categories: dict category -> list of slots, in ontology order
+        :param values: dict slot -> list of its values
+        :param intents: list of intents
+        :param source_path: the ontology file the index is compiled from
+        :param source_hash: hash of that file's content (see file_hash)
+        """
+        self.source_path = source_path
+        self.source_hash = source_hash
+        self.categories = {c: list(categories.get(c, [])) for c in SLOT_CATEGORIES}
+
+        self.slots = []
+        for category in SLOT_CATEGORIES:
+            for slot in self.categories[category]:
+                if slot not in self.slots:
+                    self.slots.append(slot)
+        self.slot_ids = {slot: i for i, slot in enumerate(self.slots)}
+
+        self.values = {slot: list(values.get(slot, [])) for slot in self.slots}
+        self.value_ids = {
+            slot: {value: i for i, value in enumerate(slot_values)}
+            for slot, slot_values in self.values.items()
+        }
+
+        self.intents = list(intents)
+        self.intent_ids = {intent: i for i, intent in enumerate(self.intents)}
+
+        # Position of each slot within its category's list
+        self.positions = {
+            category: {slot: i for i, slot in enumerate(slots)}
+            for category, slots in self.categories.items()
+        }
+        self.ids = {
+            category: np.array([self.slot_ids[s] for s in slots], dtype=np.int64)
+            for category, slots in self.categories.items()
+        }
+        self.masks = {}
+        for category, ids in self.ids.items():
+            mask = np.zeros(len(self.slots), dtype=np.bool_)
+            mask[ids] = True
+            self.masks[category] = mask
+
+    @classmethod
+    def from_ontology(cls, ontology, source_path=None, source_hash=None):
+        """
+        :param ontology: the raw ontology dict
+        :param source_path: the file the ontology was loaded from
+        :param source_hash: hash of that file's content
+        :return: an OntologyIndex
+        """
+        return cls(
+            {c: list(ontology.get(c, [])) for c in SLOT_CATEGORIES},
+            ontology.get("informable", {}),
+            ontology.get("intents", DEFAULT_INTENTS),
+            source_path,
+            source_hash,
+        )
+
+    def is_compiled_from(self, path):
+        """
+        :param path: path to an ontology file
+        :return: True if the index was compiled from a file with the same
+                 content
+        """
+        return self.source_hash is not None and self.source_hash == file_hash(path)
+
+    def slot_id(self, slot):
+        return self.slot_ids[slot]
+
+    def value_id(self, slot, value):
+        """
+        :return: id of value among the values of slot, None if unknown
+        """
+        return self.value_ids[slot].get(value)
+
+    def intent_id(self, intent):
+        return self.intent_ids[intent]
+
+    def position(self, category, slot):
+        """
+        :return: index of slot in the list of the category's slots
+        """
+        return self.positions[category][slot]
+
+    def save(self, path):
+        """
+        Pickle the built index - maps, id arrays and masks included - so that
+        load does not have to rebuild anything.
+
+        :param path: path to save the index to
+        :return: nothing
+        """
+        with open(path, "wb") as file:
+            pickle.dump(self.__dict__, file, pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: path of an index saved with save
+        :return: the OntologyIndex
+        """
+        with open(path, "rb") as file:
+            state = pickle.load(file)
+        index = cls.__new__(cls)
+        # Indexes saved without a source are never taken as up to date
+        index.source_path = None
+        index.source_hash = None
+        index.__dict__.update(state)
+        return index
 
 
 class Ontology:
     def __init__(self, filename):
         self.ontology_file_name = filename
+        self.index = None
         self.load_ontology()
 
+    @classmethod
+    def from_index(cls, index, ontology_path=None):
+        """
+        Start from a saved OntologyIndex instead of the ontology file. The
+        ontology dict is rebuilt from the index's slot lists and values.
+
+        :param index: an OntologyIndex, or the path of one saved with
+                      OntologyIndex.save
+        :param ontology_path: if given, the ontology file the index must have
+                              been compiled from (same content)
+        :return: an Ontology, already compiled
+        """
+        if not isinstance(index, OntologyIndex):
+            index = OntologyIndex.load(index)
+        if ontology_path is not None and not index.is_compiled_from(ontology_path):
+            raise ValueError(
+                "Ontology index is not compiled from %s (compiled from %s)"
+                % (ontology_path, index.source_path)
+            )
+
+        ontology = cls.__new__(cls)
+        ontology.ontology_file_name = index.source_path
+        ontology.ontology_hash = index.source_hash
+        ontology.ontology = {
+            "informable": {
+                slot: list(index.values[slot])
+                for slot in index.categories["informable"]
+            },
+            "requestable": list(index.categories["requestable"]),
+            "system_requestable": list(index.categories["system_requestable"]),
+            "intents": list(index.intents),
+        }
+        ontology.index = index
+        return ontology
+
     def load_ontology(self):
-        with open(self.ontology_file_name) as ont_file:
-            self.ontology = json.load(ont_file)
+        with open(self.ontology_file_name, "rb") as ont_file:
+            content = ont_file.read()
+            self.ontology = json.loads(content)
             self.ontology['system_requestable'] = list(self.ontology['informable'].keys())
+        self.ontology_hash = hashlib.sha256(content).hexdigest()
+        self.index = None
+
+    def compile(self):
+        """
+        :return: the OntologyIndex of this ontology, built on first use
+        """
+        if self.index is None:
+            self.index = OntologyIndex.from_ontology(
+                self.ontology, self.ontology_file_name, self.ontology_hash
+            )
+        return self.index
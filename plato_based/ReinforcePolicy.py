@@ -1,11 +1,11 @@
 from typing import List
 
 import DialoguePolicy
-from DialogueEpisodeRecorder import Experience
+from DialogueEpisodeRecorder import Experience, CompactDialogue
 from HandcraftedPolicy import HandcraftedPolicy
-from dialog_action_classes import DialogueAct, DialogueActItem, Operator
+from dialog_action_classes import DialogueAct, DialogueActItem, Operator, make_act
 from State import SlotFillingDialogueState
-from copy import deepcopy
+from parameter_backends import NumpyBackend
 
 import numpy as np
 import random
@@ -29,6 +29,11 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
         gamma=0.95,
         alpha_decay=0.995,
         epsilon_decay=0.9995,
+        rng=None,
+        np_rng=None,
+        batch_training=False,
+        lean_inference=False,
+        backend=None,
     ):
         domain = "CamRest"  # TODO(tilo): ???
         super(ReinforcePolicy, self).__init__()
@@ -44,6 +49,8 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
 
         self.policy_path = None
 
+        # Holds the weights and does the linear algebra on them
+        self.backend = backend if backend is not None else NumpyBackend()
         self.weights = None
         self.sess = None
 
@@ -53,23 +60,36 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
         self.alpha_decay_rate = alpha_decay
         self.exploration_decay_rate = epsilon_decay
 
+        # Train on the whole minibatch with a single weight update
+        self.batch_training = batch_training
+
+        # Pick actions with next_action_lean (see there)
+        self.lean_inference = lean_inference
+        self.logits = None
+
+        # Random streams for exploration and weight initialization
+        self.rng = rng if rng is not None else random
+        self.np_rng = np_rng if np_rng is not None else np.random
+
         # System and user expert policies (optional)
         self.warmup_policy = None
         self.warmup_simulator = None
 
-        self.warmup_policy = HandcraftedPolicy(self.ontology)
+        self.warmup_policy = HandcraftedPolicy(self.ontology, self.rng)
 
         # Default value
         self.is_training = True
 
         # Extract lists of slots that are frequently used
-        self.informable_slots = deepcopy(
-            list(self.ontology.ontology["informable"].keys())
-        )
-        self.requestable_slots = deepcopy(self.ontology.ontology["requestable"])
-        self.system_requestable_slots = deepcopy(
-            self.ontology.ontology["system_requestable"]
-        )
+        self.ontology_index = self.ontology.compile()
+        slots = self.ontology_index.categories
+        self.informable_slots = slots["informable"]
+        self.requestable_slots = slots["requestable"]
+        self.system_requestable_slots = slots["system_requestable"]
+        self.system_requestable_slots_index = self.ontology_index.positions[
+            "system_requestable"
+        ]
+        self.requestable_slots_index = self.ontology_index.positions["requestable"]
 
         if not domain:
             # Default to CamRest dimensions
@@ -169,6 +189,16 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
             na, noa = self.number_actions()
 
         self.NActions, self.NOtherActions = na, noa
+
+        # Index maps for encode_action
+        self.dstc2_acts_sys_index = {
+            intent: i for i, intent in enumerate(self.dstc2_acts_sys)
+        }
+
+        # Decoded actions, the acts are frozen and can be shared
+        self.action_templates = [
+            tuple(self.build_action(i)) for i in range(self.NActions)
+        ]
         print(
             "Reinforce {0} DialoguePolicy Number of Actions: {1}".format(
                 'system', self.NActions
@@ -215,14 +245,28 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
             self.exploration_decay_rate = kwargs["exploration_decay_rate"]
 
         if self.weights is None:
-            self.weights = np.random.rand(self.NStateFeatures, self.NActions)
+            self.weights = self.np_rng.random((self.NStateFeatures, self.NActions))
+
+    @property
+    def weights(self):
+        """
+        :return: numpy array of the weights (shares memory with the backend)
+        """
+        return self.backend.get_weights()
+
+    @weights.setter
+    def weights(self, weights):
+        self.backend.set_weights(weights)
 
     def restart(self, args):
         pass
 
     def next_action(self, state: SlotFillingDialogueState):
 
-        if self.is_training and random.random() < self.epsilon:
+        if self.lean_inference:
+            return self.next_action_lean(state)
+
+        if self.is_training and self.rng.random() < self.epsilon:
             return self.warmup_policy.next_action(state)
 
         # Probabilistic policy: Sample from action wrt probabilities
@@ -233,7 +277,7 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
                 "WARNING! NAN detected in action probabilities! Selecting "
                 "random action."
             )
-            return self.decode_action(random.choice(range(0, self.NActions)))
+            return self.decode_action(self.rng.choice(range(0, self.NActions)))
 
         if self.IS_GREEDY:
             # Get greedy action
@@ -242,20 +286,78 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
 
             # Break ties randomly
             if maxima:
-                sys_acts = self.decode_action(random.choice(maxima))
+                sys_acts = self.decode_action(self.rng.choice(maxima))
             else:
                 print(
                     f"--- {'system'}: Warning! No maximum value "
                     f"identified for policy. Selecting random action."
                 )
-                return self.decode_action(random.choice(range(0, self.NActions)))
+                return self.decode_action(self.rng.choice(range(0, self.NActions)))
         else:
             # Pick from top 3 actions
             top_3 = np.argsort(-probs)[0:2]
-            sys_acts = self.decode_action(random.choices(top_3, probs[top_3])[0])
+            sys_acts = self.decode_action(self.rng.choices(top_3, probs[top_3])[0])
 
         return sys_acts
 
+    def next_action_lean(self, state: SlotFillingDialogueState):
+        """
+        Same decision rule as next_action, with a numerically stable
+        log-softmax into a preallocated vector (so there are no NaNs to check
+        for) and argpartition instead of a full sort for the top actions.
+        Up to rounding, it picks actions with the same probabilities.
+
+        :param state: the dialogue state
+        :return: list of dialogue acts
+        """
+        if self.is_training and self.rng.random() < self.epsilon:
+            return self.warmup_policy.next_action(state)
+
+        if self.logits is None or self.logits.dtype != self.weights.dtype:
+            self.logits = np.empty(self.NActions, dtype=self.weights.dtype)
+        log_probs = self.log_policy(self.encode_state(state), self.logits)
+
+        return self.decode_action(self.select_action(log_probs))
+
+    def next_action_batch(self, states: List[SlotFillingDialogueState]):
+        """
+        Evaluation only: pick the actions for many states at once, without
+        exploration.
+
+        :param states: list of dialogue states
+        :return: list with a list of dialogue acts per state
+        """
+        log_probs = self.log_policy(self.encode_states(states, self.weights.dtype))
+        return [self.decode_action(self.select_action(row)) for row in log_probs]
+
+    def log_policy(self, encodings, out=None):
+        """
+        Numerically stable log-softmax of the action scores.
+
+        :param encodings: a state encoding, or a matrix with one per row
+        :param out: array to write the result into, optional
+        :return: the log probabilities of all actions, per row
+        """
+        logits = self.backend.scores(encodings, out)
+        logits -= logits.max(axis=-1, keepdims=True)
+        logits -= np.log(np.exp(logits).sum(axis=-1, keepdims=True))
+        return logits
+
+    def select_action(self, log_probs, k=2):
+        """
+        :param log_probs: log probabilities of all actions
+        :param k: number of top actions to sample from
+        :return: the greedy action (ties broken randomly), or one of the k
+                 most likely actions sampled by their probabilities
+        """
+        if self.IS_GREEDY:
+            return self.rng.choice(np.flatnonzero(log_probs == log_probs.max()))
+
+        k = min(k, len(log_probs))
+        top = np.argpartition(-log_probs, k - 1)[:k]
+        top = top[np.argsort(-log_probs[top], kind="stable")]
+        return self.rng.choices(top, np.exp(log_probs[top]))[0]
+
     @staticmethod
     def softmax(x):
         e_x = np.exp(x - np.max(x))
@@ -269,13 +371,17 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
         return np.diagflat(x_reshaped) - np.dot(x_reshaped, x_reshaped.T)
 
     def calculate_policy(self, state):
-        dot_prod = np.dot(state, self.weights)
+        dot_prod = self.backend.scores(state)
         exp_dot_prod = np.exp(dot_prod)
         return exp_dot_prod / np.sum(exp_dot_prod)
 
     def train(self, dialogues: List[List[Experience]]):
         assert self.is_training
 
+        if self.batch_training:
+            self.train_batch(dialogues)
+            return
+
         for dialogue in dialogues:
             discount = self.gamma
 
@@ -286,11 +392,11 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
             norm_rewards = (rewards - np.mean(rewards)) / (np.std(rewards) + 0.000001)
 
             for (t, turn) in enumerate(dialogue):
-                act_enc = self.encode_action(turn.action)
+                act_enc = self.get_action_encoding(turn)
                 if act_enc < 0:
                     continue
 
-                state_enc = self.encode_state(turn.state)
+                state_enc = self.get_state_encoding(turn)
 
                 if len(state_enc) != self.NStateFeatures:
                     raise ValueError(
@@ -317,11 +423,102 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
                 gradient = np.clip(gradient, -1.0, 1.0)
 
                 # Train policy
-                self.weights += self.alpha * gradient * norm_rewards[t] * discount
-                self.weights = np.clip(self.weights, -1, 1)
+                self.backend.add(
+                    self.alpha * gradient * norm_rewards[t] * discount, clip=1.0
+                )
+
+                discount *= self.gamma
+
+        self.decay_learning_parameters()
+
+    def train_batch(self, dialogues: List[List[Experience]]):
+        """
+        REINFORCE update over all turns of the minibatch at once. The states
+        are encoded into one matrix and the log-softmax gradient of the
+        taken actions, (one_hot(action) - policy), is weighted by the
+        normalized, discounted returns and applied in a single update.
+
+        :param dialogues: the minibatch of dialogues
+        :return: nothing
+        """
+        assert self.is_training
+
+        states = []
+        actions = []
+        coefficients = []
+        for dialogue in dialogues:
+            if isinstance(dialogue, CompactDialogue):
+                self.add_compact_dialogue(dialogue, states, actions, coefficients)
+                continue
+
+            discount = self.gamma
+
+            if len(dialogue) > 1:
+                dialogue[-2].reward = dialogue[-1].reward
+
+            rewards = [t.reward for t in dialogue]
+            norm_rewards = (rewards - np.mean(rewards)) / (np.std(rewards) + 0.000001)
+
+            turns = []
+            for (t, turn) in enumerate(dialogue):
+                act_enc = self.get_action_encoding(turn)
+                if act_enc < 0:
+                    continue
+
+                turns.append(turn)
+                actions.append(act_enc)
+                coefficients.append(norm_rewards[t] * discount)
 
                 discount *= self.gamma
 
+            if turns:
+                states.append(self.get_state_encodings(turns))
+
+        if states:
+            states = np.vstack(states).astype(self.weights.dtype)
+            if states.shape[1] != self.NStateFeatures:
+                raise ValueError(
+                    f"Reinforce DialoguePolicy "
+                    f"{'system'} mismatch in state"
+                    f"dimensions: State Features: "
+                    f"{self.NStateFeatures} != State "
+                    f"Encoding Length: {states.shape[1]}"
+                )
+
+            logits = self.backend.scores(states)
+            logits -= logits.max(axis=1, keepdims=True)
+            probabilities = np.exp(logits)
+            probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+            # d log pi(a|s) / d logits = one_hot(a) - pi(.|s)
+            log_policy_grad = -probabilities
+            log_policy_grad[np.arange(len(actions)), actions] += 1.0
+            log_policy_grad *= np.asarray(coefficients)[:, None]
+
+            self.backend.accumulate_gradient(states, log_policy_grad)
+            self.backend.apply_gradient(self.alpha, clip=1.0)
+
+        self.decay_learning_parameters()
+
+    def add_compact_dialogue(self, dialogue, states, actions, coefficients):
+        """
+        Array version of the per-turn loop in train_batch for a
+        CompactDialogue.
+        """
+        if len(dialogue) > 1:
+            dialogue.rewards[len(dialogue) - 2] = dialogue.rewards[len(dialogue) - 1]
+
+        rewards = dialogue.rewards[: len(dialogue)]
+        norm_rewards = (rewards - np.mean(rewards)) / (np.std(rewards) + 0.000001)
+
+        valid = dialogue.action_encodings[: len(dialogue)] >= 0
+        discounts = self.gamma ** np.arange(1, valid.sum() + 1)
+
+        states.append(dialogue.state_encodings[: len(dialogue)][valid])
+        actions.extend(dialogue.action_encodings[: len(dialogue)][valid])
+        coefficients.extend(norm_rewards[valid] * discounts)
+
+    def decay_learning_parameters(self):
         if self.alpha > 0.01:
             self.alpha *= self.alpha_decay_rate
 
@@ -330,17 +527,70 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
 
         # print(f'REINFORCE train, alpha: {self.alpha}, epsilon: {self.epsilon}')
 
-    def encode_state(self, state):
+    def get_state_encoding(self, experience: Experience):
+        """
+        :param experience: a recorded experience
+        :return: the encoding stored at record time, or a fresh one
+        """
+        if experience.state_encoding is not None:
+            return experience.state_encoding
+        return self.encode_state(experience.state)
+
+    def get_state_encodings(self, experiences: List[Experience]):
+        """
+        :param experiences: recorded experiences
+        :return: matrix of their state encodings, one row per experience
+        """
+        if all(e.state_encoding is not None for e in experiences):
+            return np.vstack([e.state_encoding for e in experiences])
+        return self.encode_states([e.state for e in experiences])
+
+    def get_action_encoding(self, experience: Experience):
+        """
+        :param experience: a recorded experience
+        :return: the encoding stored at record time, or a fresh one
+        """
+        if experience.action_encoding is not None:
+            return experience.action_encoding
+        return self.encode_action(experience.action)
+
+    def encode_state(self, state, out=None):
+        """
+        Binary state features: terminal, offer made, one per slot (filled or
+        not) and the requested slot one-hot over the requestable slots.
+
+        :param state: the dialogue state
+        :param out: vector to write the encoding into, e.g. a row of the
+                    matrix of encode_states; a new int8 vector if None
+        :return: the encoding
+        """
+        num_slots = len(state.slots_filled)
+        if out is None:
+            out = np.zeros(2 + num_slots + len(self.requestable_slots), np.int8)
+        else:
+            out[:] = 0
+
+        out[0] = state.is_terminal_state
+        out[1] = state.system_made_offer
+        # This contains the requested slot
+        out[2 : 2 + num_slots] = [bool(v) for v in state.slots_filled.values()]
 
-        temp = [int(state.is_terminal_state), int(state.system_made_offer)]
-        for value in state.slots_filled.values():
-            # This contains the requested slot
-            temp.append(1) if value else temp.append(0)
+        requested = self.requestable_slots_index.get(state.requested_slot)
+        if requested is not None:
+            out[2 + num_slots + requested] = 1
 
-        for r in self.requestable_slots:
-            temp.append(1) if r == state.requested_slot else temp.append(0)
+        return out
 
-        return temp
+    def encode_states(self, states, dtype=np.int8):
+        """
+        :param states: list of dialogue states
+        :param dtype: type of the matrix, e.g. np.float32
+        :return: matrix of their encodings, one row per state
+        """
+        encodings = np.zeros((len(states), self.NStateFeatures), dtype=dtype)
+        for state, row in zip(states, encodings):
+            self.encode_state(state, row)
+        return encodings
 
     def encode_action(self, actions: List[DialogueAct]):
 
@@ -353,19 +603,20 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
 
         action = actions[0]
 
-        if self.dstc2_acts_sys and action.intent in self.dstc2_acts_sys:
-            return self.dstc2_acts_sys.index(action.intent)
+        if action.intent in self.dstc2_acts_sys_index:
+            return self.dstc2_acts_sys_index[action.intent]
 
         if action.intent == "request":
-            return len(self.dstc2_acts_sys) + self.system_requestable_slots.index(
-                action.params[0].slot
+            return (
+                len(self.dstc2_acts_sys)
+                + self.system_requestable_slots_index[action.params[0].slot]
             )
 
         if action.intent == "inform":
             return (
                 len(self.dstc2_acts_sys)
                 + len(self.system_requestable_slots)
-                + self.requestable_slots.index(action.params[0].slot)
+                + self.requestable_slots_index[action.params[0].slot]
             )
 
         # Default fall-back action
@@ -376,13 +627,23 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
         return -1
 
     def decode_action(self, action_enc):
+        """
+        :param action_enc: index of the action
+        :return: list of (frozen) dialogue acts, from the table of decoded
+                 actions
+        """
+        if 0 <= action_enc < len(self.action_templates):
+            return list(self.action_templates[action_enc])
+        return self.build_action(action_enc)
+
+    def build_action(self, action_enc):
 
         if action_enc < len(self.dstc2_acts_sys):
-            return [DialogueAct(self.dstc2_acts_sys[action_enc], [])]
+            return [make_act(self.dstc2_acts_sys[action_enc])]
 
         if action_enc < len(self.dstc2_acts_sys) + len(self.system_requestable_slots):
             return [
-                DialogueAct(
+                make_act(
                     "request",
                     [
                         DialogueActItem(
@@ -405,7 +666,7 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
                 - len(self.system_requestable_slots)
             )
             return [
-                DialogueAct(
+                make_act(
                     "inform",
                     [DialogueActItem(self.requestable_slots[index], Operator.EQ, "")],
                 )
@@ -416,7 +677,7 @@ class ReinforcePolicy(DialoguePolicy.DialoguePolicy):
             "Reinforce DialoguePolicy ({0}) policy action decoder warning: "
             "Selecting default action (index: {1})!".format('system', action_enc)
         )
-        return [DialogueAct("bye", [])]
+        return [make_act("bye")]
 
     def save(self, path=None):
 
@@ -12,7 +12,7 @@ limitations under the License.
 __author__ = "Alexandros Papangelis"
 
 from abc import ABC, abstractmethod
-from copy import deepcopy
+from copy import copy, deepcopy
 
 """
 State models the internal state of a Conversational Agent. It is the abstract 
@@ -53,6 +53,19 @@ class DialogueState:
 
         return self.is_terminal_state
 
+    def snapshot(self):
+        """
+        Structural copy of the state: a new state that shares all values with
+        this one except for the containers the dialogue state tracker updates
+        in place. Everything else is only ever replaced, so the snapshot does
+        not change when this state is updated.
+
+        :return: a snapshot of this state
+        """
+        snapshot = copy(self)
+        snapshot.intents = list(self.intents)
+        return snapshot
+
 
 class SlotFillingDialogueState(DialogueState):
     def __init__(self, args):
@@ -150,6 +163,18 @@ class SlotFillingDialogueState(DialogueState):
 
         return self.is_terminal_state
 
+    def snapshot(self):
+        """
+        Structural copy of the state (see DialogueState.snapshot). The
+        tracker fills slots_filled in place; db results, entropies and acts
+        are replaced on every update.
+
+        :return: a snapshot of this state
+        """
+        snapshot = super(SlotFillingDialogueState, self).snapshot()
+        snapshot.slots_filled = dict(self.slots_filled)
+        return snapshot
+
 
 class Context:
     """
@@ -8,11 +8,12 @@ You may obtain a copy of the License at the root directory of this project.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-from dataclasses import dataclass
-from typing import List, Any
+from dataclasses import dataclass, replace
+from typing import List, Any, Iterable
 
 __author__ = "Alexandros Papangelis"
 
+from copy import deepcopy
 from enum import Enum
 
 
@@ -75,7 +76,10 @@ class DialogueActItem:
         return (
             self.slot == other.slot
             and self.op == other.op
-            and self.value == other.value
+            and (
+                self.value == other.value
+                or hashable_value(self.value) == hashable_value(other.value)
+            )
         )
 
     def __str__(self):
@@ -152,6 +156,253 @@ class DialogueAct(Action):
             return "None (DialogueAct)"
 
 
+def hashable_value(value):
+    """
+    Make a slot value usable in a dictionary key. Lists become tuples (so a
+    list value and its frozen counterpart agree), dicts become tagged tuples.
+    An empty list stays different from an empty string.
+
+    :param value: the value of a DialogueActItem
+    :return: a hashable equivalent of value
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(hashable_value(v) for v in value)
+    if isinstance(value, dict):
+        return dict, tuple((k, hashable_value(v)) for k, v in value.items())
+    return value
+
+
+def act_signature(act: DialogueAct):
+    """
+    Canonical, hashable signature of a dialogue act. Two acts have the same
+    signature exactly when they have the same set of params (and the same
+    intent, name and funcName), i.e. when they are equal both ways under
+    DialogueAct.__eq__. Acts with at most one param, like all agenda acts,
+    compare equal exactly when their signatures do.
+
+    :param act: the dialogue act
+    :return: a hashable tuple
+    """
+    if isinstance(act, FrozenDialogueAct):
+        return act.signature
+
+    return (
+        act.funcName,
+        act.intent,
+        act.name,
+        frozenset(
+            (item.slot, item.op, hashable_value(item.value)) for item in act.params
+        ),
+    )
+
+
+class FrozenDialogueActItem:
+    """
+    Immutable, hashable counterpart of DialogueActItem. List values are
+    stored as tuples. It compares equal to a DialogueActItem with the same
+    slot, operator and value.
+    """
+
+    __slots__ = ("slot", "op", "value", "_hash")
+
+    def __init__(self, slot: str, op: Operator, value: Any):
+        value = hashable_value(value)
+        object.__setattr__(self, "slot", slot)
+        object.__setattr__(self, "op", op)
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "_hash", hash((slot, op, value)))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenDialogueActItem):
+            return (
+                self._hash == other._hash
+                and self.slot == other.slot
+                and self.op == other.op
+                and self.value == other.value
+            )
+        if isinstance(other, DialogueActItem):
+            return (
+                self.slot == other.slot
+                and self.op == other.op
+                and self.value == hashable_value(other.value)
+            )
+        return NotImplemented
+
+    def __hash__(self):
+        return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenDialogueActItem, (self.slot, self.op, self.value)
+
+    __str__ = DialogueActItem.__str__
+
+    def __repr__(self):
+        return (
+            f"FrozenDialogueActItem(slot={self.slot!r}, op={self.op!r}, "
+            f"value={self.value!r})"
+        )
+
+
+def freeze_item(item):
+    """
+    :param item: a DialogueActItem or FrozenDialogueActItem
+    :return: the item as a FrozenDialogueActItem
+    """
+    if isinstance(item, FrozenDialogueActItem):
+        return item
+    return FrozenDialogueActItem(item.slot, item.op, item.value)
+
+
+class FrozenDialogueAct:
+    """
+    Immutable, hashable counterpart of DialogueAct, with a tuple of
+    FrozenDialogueActItem params. Frozen acts are equal when their signatures
+    are (see act_signature), which for acts with at most one param is the
+    same as DialogueAct.__eq__. Since they cannot change, frozen acts can be
+    shared instead of copied; use make_act to get interned instances and
+    replace_item / replace_params to derive modified ones.
+    """
+
+    __slots__ = ("intent", "params", "signature", "_hash")
+
+    name = "dialogue_act"
+    funcName = None
+
+    def __init__(self, intent: str, params: Iterable = ()):
+        params = tuple(freeze_item(item) for item in params)
+        signature = (
+            self.funcName,
+            intent,
+            self.name,
+            frozenset((item.slot, item.op, item.value) for item in params),
+        )
+        object.__setattr__(self, "intent", intent)
+        object.__setattr__(self, "params", params)
+        object.__setattr__(self, "signature", signature)
+        object.__setattr__(self, "_hash", hash(signature))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, FrozenDialogueAct):
+            return self._hash == other._hash and self.signature == other.signature
+        if isinstance(other, DialogueAct):
+            return self.signature == act_signature(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return self._hash
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return FrozenDialogueAct, (self.intent, self.params)
+
+    __str__ = DialogueAct.__str__
+
+    def __repr__(self):
+        return f"FrozenDialogueAct(intent={self.intent!r}, params={self.params!r})"
+
+
+# Frequent acts (requests and informs of the ontology's slots, bye, ...) are
+# built once and shared. The table stops growing at MAX_INTERNED_ACTS, e.g.
+# when an error model keeps producing new values.
+MAX_INTERNED_ACTS = 100000
+_interned_acts = {}
+
+
+def make_act(intent: str, params: Iterable = ()):
+    """
+    Get the interned FrozenDialogueAct with the given intent and params.
+
+    :param intent: the intent of the act
+    :param params: DialogueActItems or FrozenDialogueActItems
+    :return: a FrozenDialogueAct
+    """
+    act = FrozenDialogueAct(intent, params)
+    interned = _interned_acts.get(act.signature)
+    if interned is not None:
+        return interned
+    if len(_interned_acts) < MAX_INTERNED_ACTS:
+        _interned_acts[act.signature] = act
+    return act
+
+
+def freeze_act(act):
+    """
+    :param act: a DialogueAct or FrozenDialogueAct
+    :return: the interned FrozenDialogueAct equal to act
+    """
+    if isinstance(act, FrozenDialogueAct):
+        return act
+    return make_act(act.intent, act.params)
+
+
+def copy_acts(acts):
+    """
+    Copy a list of dialogue acts, sharing the frozen ones instead of
+    deep-copying them.
+
+    :param acts: list of DialogueActs and FrozenDialogueActs (or None)
+    :return: a new list
+    """
+    if acts is None:
+        return None
+    return [
+        act if isinstance(act, FrozenDialogueAct) else deepcopy(act) for act in acts
+    ]
+
+
+def replace_item(item, **changes):
+    """
+    Copy-on-write update of a dialogue act item.
+
+    :param item: a DialogueActItem or FrozenDialogueActItem
+    :param changes: new values for slot, op and / or value
+    :return: a new item of the same type, item itself is not modified
+    """
+    if isinstance(item, FrozenDialogueActItem):
+        return FrozenDialogueActItem(
+            changes.get("slot", item.slot),
+            changes.get("op", item.op),
+            changes.get("value", item.value),
+        )
+    return replace(item, **changes)
+
+
+def replace_params(act, params: Iterable):
+    """
+    Copy-on-write update of the params of a dialogue act.
+
+    :param act: a DialogueAct or FrozenDialogueAct
+    :param params: the new params
+    :return: a new act of the same type, act itself is not modified
+    """
+    if isinstance(act, FrozenDialogueAct):
+        return make_act(act.intent, params)
+
+    new_act = DialogueAct(act.intent, list(params))
+    new_act.name = act.name
+    new_act.funcName = act.funcName
+    return new_act
+
+
 """
 The Expression class models complex expressions and defines how to compute 
 them.
@@ -4,9 +4,8 @@ from State import SlotFillingDialogueState
 from abc import ABC, abstractmethod
 
 from Ontology import Ontology
-from copy import deepcopy
 
-from dialog_action_classes import DialogueAct
+from dialog_action_classes import DialogueAct, copy_acts
 
 
 class DummyStateTracker(object):
@@ -52,7 +51,7 @@ class DummyStateTracker(object):
 
         # TODO: These rules will create a field in the dialogue state slots
         # filled dictionary if one doesn't exist.
-        self.DState.user_acts = deepcopy(dacts)
+        self.DState.user_acts = copy_acts(dacts)
 
         # Reset past request
         self.DState.requested_slot = ""
@@ -126,7 +125,8 @@ class DummyStateTracker(object):
                 self.DState.item_in_focus = db_result[0]
 
             if sys_req_slot_entropies:
-                self.DState.system_requestable_slot_entropies = deepcopy(
+                # Entropies are floats, but the dict may be a cached one
+                self.DState.system_requestable_slot_entropies = dict(
                     sys_req_slot_entropies
                 )
 
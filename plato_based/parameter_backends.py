@@ -0,0 +1,168 @@
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+"""
+Parameter backends hold the weight matrix of a linear policy and do the
+linear algebra on it: scoring state encodings, and in-place (clipped) weight
+updates. Gradients of a whole batch are accumulated into one buffer and applied
+with fused in-place operations, so a training step allocates no new weight
+matrices.
+
+get_weights always gives a numpy array (for the torch backend one that shares
+the tensor's memory), which is what policies save, load and broadcast.
+"""
+
+
+class NumpyBackend:
+    def __init__(self, dtype=np.float64):
+        """
+        :param dtype: type of the weights, e.g. np.float32 to halve memory
+                      and bandwidth
+        """
+        self.dtype = np.dtype(dtype)
+        self.weights = None
+        self.gradient = None
+
+    def get_weights(self):
+        return self.weights
+
+    def set_weights(self, weights):
+        """
+        :param weights: matrix of weights (copied), or None
+        :return: nothing
+        """
+        self.gradient = None
+        if weights is None:
+            self.weights = None
+        else:
+            self.weights = np.array(weights, dtype=self.dtype)
+
+    def scores(self, encodings, out=None):
+        """
+        :param encodings: a state encoding, or a matrix with one per row
+        :param out: array to write the scores into, optional
+        :return: numpy array of the action scores
+        """
+        return np.dot(encodings, self.weights, out=out)
+
+    def add(self, update, clip=None):
+        """
+        weights += update, then clip to [-clip, clip], in place.
+        """
+        self.weights += update
+        if clip is not None:
+            np.clip(self.weights, -clip, clip, out=self.weights)
+
+    def accumulate_gradient(self, states, output_gradient):
+        """
+        Add the gradient of a batch, states^T . output_gradient, to the
+        gradient buffer.
+
+        :param states: matrix of state encodings, one per row
+        :param output_gradient: matrix of gradients w.r.t. the action
+                                scores, one per row
+        :return: nothing
+        """
+        gradient = np.dot(states.T, output_gradient)
+        if self.gradient is None:
+            self.gradient = gradient.astype(self.dtype, copy=False)
+        else:
+            self.gradient += gradient
+
+    def apply_gradient(self, learning_rate, clip=None):
+        """
+        weights += learning_rate * gradient (then clipped), in place, and
+        reset the gradient buffer.
+        """
+        if self.gradient is None:
+            return
+
+        self.gradient *= learning_rate
+        self.add(self.gradient, clip)
+        self.gradient = None
+
+
+class TorchBackend:
+    def __init__(self, dtype=None, num_threads=None):
+        """
+        :param dtype: torch type of the weights, torch.float32 by default
+        :param num_threads: number of CPU threads torch may use
+        """
+        if torch is None:
+            raise ImportError("TorchBackend requires torch")
+
+        self.dtype = dtype if dtype is not None else torch.float32
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.weights = None
+        self.gradient = None
+
+    def as_tensor(self, array):
+        return torch.as_tensor(np.asarray(array), dtype=self.dtype)
+
+    def get_weights(self):
+        if self.weights is None:
+            return None
+        # Shares memory with the tensor
+        return self.weights.numpy()
+
+    def set_weights(self, weights):
+        self.gradient = None
+        if weights is None:
+            self.weights = None
+        else:
+            self.weights = self.as_tensor(weights).clone()
+
+    def scores(self, encodings, out=None):
+        with torch.no_grad():
+            scores = torch.matmul(self.as_tensor(encodings), self.weights).numpy()
+        if out is None:
+            return scores
+        out[...] = scores
+        return out
+
+    def add(self, update, clip=None):
+        with torch.no_grad():
+            self.weights.add_(self.as_tensor(update))
+            if clip is not None:
+                self.weights.clamp_(-clip, clip)
+
+    def accumulate_gradient(self, states, output_gradient):
+        with torch.no_grad():
+            states = self.as_tensor(states)
+            output_gradient = self.as_tensor(output_gradient)
+            if self.gradient is None:
+                self.gradient = torch.zeros_like(self.weights)
+            self.gradient.addmm_(states.T, output_gradient)
+
+    def apply_gradient(self, learning_rate, clip=None):
+        if self.gradient is None:
+            return
+
+        with torch.no_grad():
+            self.weights.add_(self.gradient, alpha=learning_rate)
+            if clip is not None:
+                self.weights.clamp_(-clip, clip)
+        self.gradient = None
+
+
+def make_backend(name="numpy", dtype=None, num_threads=None):
+    """
+    :param name: "numpy" or "torch"
+    :param dtype: name of the weights' type, e.g. "float32"; float64 for
+                  numpy and float32 for torch by default
+    :param num_threads: number of CPU threads torch may use; numpy uses
+                        the threads of its BLAS library
+    :return: a parameter backend
+    """
+    if name == "numpy":
+        return NumpyBackend(np.dtype(dtype or "float64"))
+    if name == "torch":
+        return TorchBackend(
+            getattr(torch, dtype) if dtype and torch else None, num_threads
+        )
+    raise ValueError("Unknown parameter backend %s" % name)
@@ -0,0 +1,59 @@
+import random
+import zlib
+
+import numpy as np
+
+"""
+The RNGRegistry hands out independent random streams, one per
+(worker, component, dialogue). Streams are derived from a root seed with numpy
+SeedSequence spawn keys, so a stream only depends on its key and never on how
+many other streams were requested before it. This makes every simulated
+dialogue replayable and parallel runs reproducible.
+"""
+
+
+class RNGRegistry:
+    def __init__(self, seed=None, worker_id=0):
+        """
+        :param seed: root seed, fresh OS entropy if None
+        :param worker_id: id of the agent / worker this registry belongs to
+        """
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.worker_id = worker_id
+
+    def spawn(self, worker_id):
+        """
+        Create the registry of another worker, sharing the root seed.
+
+        :param worker_id: id of the worker
+        :return: an RNGRegistry
+        """
+        return RNGRegistry(self.seed, worker_id)
+
+    def seed_sequence(self, name, episode=None):
+        spawn_key = (self.worker_id, zlib.crc32(name.encode()))
+        if episode is not None:
+            spawn_key += (episode,)
+        return np.random.SeedSequence(self.seed, spawn_key=spawn_key)
+
+    def generator(self, name, episode=None):
+        """
+        Counter-based (Philox) numpy stream for the given component
+
+        :param name: name of the component
+        :param episode: optional dialogue number
+        :return: a numpy Generator
+        """
+        return np.random.Generator(np.random.Philox(self.seed_sequence(name, episode)))
+
+    def random(self, name, episode=None):
+        """
+        Stream with the interface of the random module, for the components
+        that sample with choice / sample / shuffle.
+
+        :param name: name of the component
+        :param episode: optional dialogue number
+        :return: a random.Random
+        """
+        state = self.seed_sequence(name, episode).generate_state(4)
+        return random.Random(int.from_bytes(state.tobytes(), "little"))
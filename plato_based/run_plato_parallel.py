@@ -0,0 +1,167 @@
+from copy import deepcopy
+from multiprocessing import Pool, cpu_count
+from pprint import pprint
+from tqdm import tqdm
+
+from ConversationalSingleAgentSimplified import ConversationalSingleAgent
+from rng_registry import RNGRegistry
+from run_plato_simplified import collect_statistics, update_progress_bar
+
+import sys
+import yaml
+import numpy as np
+
+"""
+Parallel version of run_plato_simplified.run_single_agent. Worker processes
+each hold their own ConversationalSingleAgent (and with it their own SQLite
+connection) and simulate dialogues under the current policy weights. They send
+the recorded dialogues back as CompactDialogues to a central learner, which
+trains the policy exactly like ConversationalSingleAgent.end_dialogue does and
+broadcasts the new weights every sync_interval dialogues (per worker).
+
+All agents share one RNGRegistry and every dialogue draws from the streams of
+its own (global) dialogue number, so a run only depends on the seed, the
+number of workers and the sync interval - not on which process simulates
+which dialogue. With one worker and a sync interval of 1 it is the same run as
+run_single_agent.
+"""
+
+# The agent of this worker process, see init_worker
+agent: ConversationalSingleAgent = None
+
+
+def worker_config(config):
+    """
+    :param config: the configuration of the learner
+    :return: the configuration of the worker agents, which record compact
+             dialogues for the learner and keep nothing themselves
+    """
+    config = deepcopy(config)
+    policy_config = config["AGENT_0"]["DM"]["policy"]
+    policy_config["compact_recorder"] = True
+    policy_config["snapshot_interval"] = 0
+    policy_config["recorder_size"] = None
+    policy_config["episode_log_path"] = None
+    return config
+
+
+def init_worker(config, seed):
+    global agent
+    agent = ConversationalSingleAgent(worker_config(config), RNGRegistry(seed))
+    agent.initialize()
+
+
+def simulate_dialogues(args):
+    """
+    Simulate dialogues first_episode, ..., first_episode + num_dialogues - 1
+    with the given policy parameters.
+
+    :param args: tuple (first_episode, num_dialogues, weights, epsilon)
+    :return: tuple (list of CompactDialogues, list of their numbers of turns)
+    """
+    first_episode, num_dialogues, weights, epsilon = args
+    agent.dialogue_manager.policy.weights = weights
+    agent.dialogue_manager.policy.epsilon = epsilon
+
+    turns = []
+    for episode in range(first_episode, first_episode + num_dialogues):
+        agent.dialogue_episode = episode
+        agent.start_dialogue()
+        while not agent.terminated():
+            agent.continue_dialogue()
+
+        # Training, statistics and saving are left to the learner
+        agent.recorder.record(agent.curr_state, agent.prev_turnstate)
+        turns.append(agent.dialogue_turn)
+
+    dialogues = list(agent.recorder.dialogues)
+    agent.recorder.dialogues = []
+    return dialogues, turns
+
+
+def schedule(num_dialogues, num_workers, sync_interval):
+    """
+    Split the dialogues into rounds of up to sync_interval dialogues for
+    each worker.
+
+    :return: list of rounds, each a list of (first_episode, num_dialogues)
+    """
+    rounds = []
+    for start in range(0, num_dialogues, num_workers * sync_interval):
+        end = min(start + num_workers * sync_interval, num_dialogues)
+        rounds.append(
+            [
+                (first, min(sync_interval, end - first))
+                for first in range(start, end, sync_interval)
+            ]
+        )
+    return rounds
+
+
+def run_parallel_agent(config, num_dialogues, num_workers=None, sync_interval=10):
+    """
+    :param config: the configuration, as for run_single_agent
+    :param num_dialogues: total number of dialogues to simulate
+    :param num_workers: number of worker processes, defaults to the number
+                        of CPUs
+    :param sync_interval: number of dialogues each worker simulates before
+                          it receives new weights
+    :return: the statistics over all dialogues
+    """
+    num_workers = num_workers or cpu_count()
+
+    registry = RNGRegistry(config.get("GENERAL", {}).get("seed"))
+    learner = ConversationalSingleAgent(config, registry)
+    learner.initialize()
+    policy = learner.dialogue_manager.policy
+
+    params_to_monitor = {"dialogue": 0, "success-rate": 0.0, "reward": 0.0}
+    running_factor = np.exp(np.log(0.05) / 100)  # after 100 steps sunk to 0.05
+    with Pool(
+        num_workers, initializer=init_worker, initargs=(config, registry.seed)
+    ) as pool, tqdm(postfix=[params_to_monitor]) as pbar:
+
+        for tasks in schedule(num_dialogues, num_workers, sync_interval):
+            # The learner updates its weights in place while the tasks of
+            # this round are still being sent
+            weights = policy.weights.copy()
+            args = [(first, n, weights, policy.epsilon) for first, n in tasks]
+            # Results arrive in order of their dialogue numbers
+            for dialogues, turns in pool.imap(simulate_dialogues, args):
+                for dialogue, dialogue_turns in zip(dialogues, turns):
+                    learner.recorder.add_dialogue(dialogue)
+                    learner.learn_from_dialogue(dialogue_turns)
+
+                    update_progress_bar(
+                        learner, learner.dialogue_episode - 1, pbar, running_factor
+                    )
+
+    learner.terminate()
+    statistics = collect_statistics(learner, num_dialogues)
+
+    print(
+        "\n\nDialogue Success Rate: {0}\nAverage Cumulative Reward: {1}"
+        "\nAverage Turns: {2}".format(
+            statistics["AGENT_0"]["dialogue_success_percentage"],
+            statistics["AGENT_0"]["avg_cumulative_rewards"],
+            statistics["AGENT_0"]["avg_turns"],
+        )
+    )
+
+    return statistics
+
+
+if __name__ == "__main__":
+    # Usage: run_plato_parallel.py config.yaml num_dialogues [num_workers]
+    #        [sync_interval]
+    with open(sys.argv[1]) as file:
+        config = yaml.safe_load(file)
+
+    statistics = run_parallel_agent(
+        config,
+        int(sys.argv[2]),
+        int(sys.argv[3]) if len(sys.argv) > 3 else None,
+        int(sys.argv[4]) if len(sys.argv) > 4 else 10,
+    )
+
+    pprint(f"Results:\n{statistics}")
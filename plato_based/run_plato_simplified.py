@@ -26,6 +26,7 @@ def run_single_agent(config, num_dialogues):
 
             update_progress_bar(ca, dialogue, pbar, running_factor)
 
+    ca.terminate()
     statistics = collect_statistics(ca, num_dialogues)
 
     print(
@@ -101,6 +102,8 @@ if __name__ == "__main__":
             #     "slot_confuse_prob": 0.0,
             #     "op_confuse_prob": 0.0,
             #     "value_confuse_prob": 0.0,
+            #     "slot_confusion": {"area": {"pricerange": 2.0}},
+            #     "value_confusion": {"area": {"north": {"south": 3.0}}},
             # },
             "DM": {
                 "policy": {
@@ -10,7 +10,7 @@ def user_does_care(act_item):
 
 
 def request_was_not_done(value):
-    return isinstance(value, list) and len(value) == 0
+    return isinstance(value, (list, tuple)) and len(value) == 0
 
 
 def all_requests_done(act_items: List[DialogueActItem]):
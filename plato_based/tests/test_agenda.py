@@ -0,0 +1,154 @@
+import copy
+import random
+
+import pytest
+
+from Agenda import Agenda, IndexedAgenda
+from Goal import Goal
+from dialog_action_classes import (
+    DialogueAct,
+    DialogueActItem,
+    FrozenDialogueActItem,
+    Operator,
+    make_act,
+    replace_item,
+)
+
+SLOTS = ["area", "food", "pricerange", "name"]
+
+
+def random_act(rng):
+    """
+    A random act from a small set, so that pushes often hit acts that are
+    already in the agenda. Mutable and frozen acts are mixed.
+    """
+    intent = rng.choice(["request", "inform", "bye"])
+    if intent == "bye":
+        return make_act("bye")
+
+    slot = rng.choice(SLOTS)
+    value = "" if intent == "request" else rng.choice(["a", "b"])
+    if rng.random() < 0.5:
+        return DialogueAct(intent, [DialogueActItem(slot, Operator.EQ, value)])
+    return make_act(intent, [FrozenDialogueActItem(slot, Operator.EQ, value)])
+
+
+def assert_same(agenda, indexed):
+    assert indexed.agenda == agenda.agenda
+    assert indexed.size() == agenda.size()
+    # Every live act is indexed exactly once
+    assert sum(len(entries) for entries in indexed.index.values()) == agenda.size()
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("min_compaction_size", [0, 4, 32])
+def test_indexed_agenda_matches_agenda(seed, min_compaction_size, monkeypatch):
+    monkeypatch.setattr(IndexedAgenda, "MIN_COMPACTION_SIZE", min_compaction_size)
+    rng = random.Random(seed)
+    agenda = Agenda()
+    indexed = IndexedAgenda()
+
+    for _ in range(500):
+        op = rng.random()
+        if op < 0.45:
+            act = random_act(rng)
+            force = rng.random() < 0.3
+            agenda.push(act, force=force)
+            indexed.push(act, force=force)
+        elif op < 0.65:
+            assert indexed.pop() == agenda.pop()
+        elif op < 0.85:
+            act = random_act(rng)
+            agenda.remove(act)
+            indexed.remove(act)
+        elif op < 0.95:
+            act = random_act(rng)
+            assert (act in indexed) == (act in agenda.agenda)
+            assert indexed.peek() == agenda.peek()
+        else:
+            agenda.clear()
+            indexed.clear()
+
+        assert_same(agenda, indexed)
+
+
+def test_remove_drops_the_oldest_duplicate():
+    bye = make_act("bye")
+    request = make_act("request", [FrozenDialogueActItem("food", Operator.EQ, "")])
+    indexed = IndexedAgenda()
+    for act in [bye, request, bye]:
+        indexed.push(act, force=True)
+
+    indexed.remove(bye)
+    assert indexed.agenda == [request, bye]
+    assert indexed.pop() == bye
+    assert indexed.pop() == request
+    assert indexed.pop() is None
+
+
+def test_removals_compact_the_stack(monkeypatch):
+    monkeypatch.setattr(IndexedAgenda, "MIN_COMPACTION_SIZE", 4)
+    acts = [
+        make_act("inform", [FrozenDialogueActItem("name", Operator.EQ, str(i))])
+        for i in range(100)
+    ]
+    indexed = IndexedAgenda()
+    for act in acts:
+        indexed.push(act)
+
+    for act in acts[:90]:
+        indexed.remove(act)
+        tombstones = len(indexed.stack) - indexed.num_acts
+        assert tombstones <= max(indexed.num_acts, IndexedAgenda.MIN_COMPACTION_SIZE)
+
+    assert indexed.agenda == acts[90:]
+    assert len(indexed.stack) < 2 * len(acts[90:]) + 4
+
+
+def test_agenda_setter_rebuilds_the_index():
+    acts = [make_act("bye"), make_act("ack_subgoal"), make_act("bye")]
+    indexed = IndexedAgenda()
+    indexed.agenda = acts
+
+    assert indexed.agenda == acts
+    assert indexed.size() == 3
+    assert make_act("ack_subgoal") in indexed
+    indexed.remove(make_act("ack_subgoal"))
+    assert make_act("ack_subgoal") not in indexed
+
+
+def make_goal():
+    goal = Goal()
+    goal.constraints = {
+        "area": DialogueActItem("area", Operator.EQ, "north"),
+        "food": DialogueActItem("food", Operator.EQ, "thai"),
+    }
+    goal.requests = {
+        "phone": DialogueActItem("phone", Operator.EQ, ""),
+        "addr": DialogueActItem("addr", Operator.EQ, ""),
+    }
+    goal.requests_made = {"addr": DialogueActItem("addr", Operator.EQ, "")}
+    return goal
+
+
+@pytest.mark.parametrize("agenda_class", [Agenda, IndexedAgenda])
+def test_goal_updates_do_not_change_the_agenda(agenda_class):
+    # The agenda used to be initialized with a deep copy of the goal
+    goal = make_goal()
+    shared = agenda_class()
+    shared.initialize(goal)
+    copied = agenda_class()
+    copied.initialize(copy.deepcopy(goal))
+
+    # Updates of the user simulator during the dialogue
+    goal.requests["phone"].value = "01223"
+    goal.constraints["area"].value = "south"
+    goal.requests_made["phone"] = FrozenDialogueActItem("phone", Operator.EQ, "x")
+    goal.requests_made["addr"] = replace_item(goal.requests_made["addr"], value="y")
+
+    for agenda in [shared, copied]:
+        agenda.consistency_check()
+    assert shared.agenda == copied.agenda
+    assert make_act(
+        "inform", [FrozenDialogueActItem("area", Operator.EQ, "north")]
+    ) in list(shared.agenda)
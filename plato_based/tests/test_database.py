@@ -0,0 +1,64 @@
+import json
+import sqlite3
+
+import pytest
+
+from ConversationalSingleAgentSimplified import build_domain_settings
+
+
+@pytest.fixture
+def dialogue_config(tmp_path):
+    ontology_path = tmp_path / "ontology.json"
+    ontology_path.write_text(
+        json.dumps(
+            {
+                "informable": {"area": ["north", "south"], "food": ["thai", "greek"]},
+                "requestable": ["area", "food", "phone"],
+            }
+        )
+    )
+
+    db_path = tmp_path / "restaurants.db"
+    connection = sqlite3.connect(str(db_path))
+    connection.execute("CREATE TABLE restaurants (area text, food text, phone text)")
+    connection.executemany(
+        "INSERT INTO restaurants VALUES (?, ?, ?)",
+        [("north", "thai", "1"), ("south", "greek", "2"), ("north", "greek", "3")],
+    )
+    connection.commit()
+    connection.close()
+
+    return {"ontology_path": str(ontology_path), "db_path": str(db_path)}
+
+
+def count_indexes(connection):
+    return connection.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'index';"
+    ).fetchone()[0]
+
+
+@pytest.mark.parametrize("in_memory", [False, True])
+def test_the_database_file_is_left_unchanged(dialogue_config, in_memory):
+    with open(dialogue_config["db_path"], "rb") as file:
+        original = file.read()
+
+    dialogue_config["db_in_memory"] = in_memory
+    dialogue_config["db_pool_size"] = 2
+    _, database = build_domain_settings(dialogue_config)
+
+    with database.connection() as connection:
+        assert count_indexes(connection) == (2 if in_memory else 0)
+    database.close()
+
+    with open(dialogue_config["db_path"], "rb") as file:
+        assert file.read() == original
+
+
+def test_indexes_are_written_to_the_file_on_request(dialogue_config):
+    dialogue_config["db_create_indexes"] = True
+    _, database = build_domain_settings(dialogue_config)
+    database.close()
+
+    connection = sqlite3.connect(dialogue_config["db_path"])
+    assert count_indexes(connection) == 2
+    connection.close()
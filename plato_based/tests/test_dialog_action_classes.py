@@ -0,0 +1,104 @@
+import copy
+import pickle
+
+import pytest
+
+from dialog_action_classes import (
+    DialogueAct,
+    DialogueActItem,
+    FrozenDialogueActItem,
+    Operator,
+    copy_acts,
+    freeze_act,
+    make_act,
+    replace_item,
+    replace_params,
+)
+
+
+def test_make_act_interns_equal_acts():
+    item = DialogueActItem("food", Operator.EQ, "thai")
+    act = make_act("inform", [item])
+
+    assert (
+        make_act("inform", [FrozenDialogueActItem("food", Operator.EQ, "thai")]) is act
+    )
+    assert make_act("inform", (item,)) is act
+    assert make_act("inform", [item]) is not make_act("request", [item])
+    assert make_act("bye") is make_act("bye", [])
+
+
+def test_frozen_act_equals_mutable_act():
+    item = DialogueActItem("food", Operator.EQ, "thai")
+    act = make_act("inform", [item])
+    mutable = DialogueAct("inform", [DialogueActItem("food", Operator.EQ, "thai")])
+
+    assert act == mutable
+    assert mutable == act
+    assert freeze_act(mutable) is act
+    assert str(act) == str(mutable)
+    assert act != DialogueAct("inform", [DialogueActItem("food", Operator.EQ, "x")])
+
+
+def test_frozen_acts_are_immutable_and_shared():
+    act = make_act("request", [DialogueActItem("area", Operator.EQ, "")])
+
+    with pytest.raises(AttributeError):
+        act.intent = "inform"
+    with pytest.raises(AttributeError):
+        act.params[0].value = "north"
+
+    assert copy.copy(act) is act
+    assert copy.deepcopy(act) is act
+    assert pickle.loads(pickle.dumps(act)) == act
+
+
+def test_list_values_are_hashable():
+    item = FrozenDialogueActItem("food", Operator.EQ, ["thai", "greek"])
+
+    assert item.value == ("thai", "greek")
+    assert item == DialogueActItem("food", Operator.EQ, ["thai", "greek"])
+    assert hash(make_act("inform", [item])) == hash(make_act("inform", [item]))
+
+
+def test_replace_item_copies_on_write():
+    frozen = FrozenDialogueActItem("food", Operator.EQ, "")
+    replaced = replace_item(frozen, value="thai")
+    assert isinstance(replaced, FrozenDialogueActItem)
+    assert (replaced.slot, replaced.op, replaced.value) == ("food", Operator.EQ, "thai")
+    assert frozen.value == ""
+
+    mutable = DialogueActItem("food", Operator.EQ, "")
+    replaced = replace_item(mutable, slot="area", op=Operator.NE)
+    assert isinstance(replaced, DialogueActItem)
+    assert (replaced.slot, replaced.op, replaced.value) == ("area", Operator.NE, "")
+    assert (mutable.slot, mutable.op) == ("food", Operator.EQ)
+
+
+def test_replace_params_copies_on_write():
+    old_item = DialogueActItem("food", Operator.EQ, "thai")
+    new_item = DialogueActItem("food", Operator.EQ, "greek")
+
+    act = make_act("inform", [old_item])
+    replaced = replace_params(act, [new_item])
+    assert replaced is make_act("inform", [new_item])
+    assert act.params == (FrozenDialogueActItem("food", Operator.EQ, "thai"),)
+
+    mutable = DialogueAct("inform", [old_item])
+    mutable.name = "custom"
+    replaced = replace_params(mutable, [new_item])
+    assert isinstance(replaced, DialogueAct)
+    assert replaced.params == [new_item]
+    assert replaced.name == "custom"
+    assert mutable.params == [old_item]
+
+
+def test_copy_acts_shares_frozen_acts_only():
+    frozen = make_act("bye")
+    mutable = DialogueAct("inform", [DialogueActItem("food", Operator.EQ, "thai")])
+
+    copied = copy_acts([frozen, mutable])
+    assert copied[0] is frozen
+    assert copied[1] == mutable and copied[1] is not mutable
+    assert copied[1].params[0] is not mutable.params[0]
+    assert copy_acts(None) is None
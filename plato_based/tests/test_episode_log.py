@@ -0,0 +1,157 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from DialogueEpisodeRecorder import (
+    CompactDialogue,
+    DialogueEpisodeRecorder,
+    EpisodeLogReader,
+    EpisodeLogWriter,
+    FRAME_HEADER,
+    StateCapture,
+    is_episode_log,
+)
+
+
+def make_dialogue(i, num_turns=3):
+    dialogue = CompactDialogue(num_state_features=4, capacity=1)
+    for turn in range(num_turns):
+        capture = StateCapture(np.full(4, i + turn, np.int8), turn == num_turns - 1)
+        dialogue.append(capture, action_encoding=i, reward=-1.0, cumulative_reward=0.0)
+    dialogue.trim()
+    dialogue.success = i % 2 == 0
+    return dialogue
+
+
+def assert_same_dialogue(a, b):
+    assert len(a) == len(b)
+    np.testing.assert_array_equal(a.state_encodings, b.state_encodings)
+    np.testing.assert_array_equal(a.action_encodings, b.action_encodings)
+    np.testing.assert_array_equal(a.rewards, b.rewards)
+    assert a.success == b.success
+
+
+def write_log(path, dialogues):
+    writer = EpisodeLogWriter(path)
+    for dialogue in dialogues:
+        writer.write(dialogue)
+    writer.close()
+
+
+def test_roundtrip_and_random_access(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    dialogues = [make_dialogue(i) for i in range(10)]
+    write_log(path, dialogues)
+
+    assert is_episode_log(path)
+    reader = EpisodeLogReader(path)
+    assert len(reader) == 10
+    for original, loaded in zip(dialogues, reader):
+        assert_same_dialogue(original, loaded)
+    assert_same_dialogue(reader[-1], dialogues[-1])
+    assert_same_dialogue(reader[3], dialogues[3])
+    assert [d.success for d in reader[2:5]] == [d.success for d in dialogues[2:5]]
+    with pytest.raises(IndexError):
+        reader[10]
+    reader.close()
+
+
+def test_writer_continues_an_existing_log(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    write_log(path, [make_dialogue(i) for i in range(3)])
+    write_log(path, [make_dialogue(i) for i in range(3, 5)])
+
+    reader = EpisodeLogReader(path)
+    assert [int(d.action_encodings[0]) for d in reader] == [0, 1, 2, 3, 4]
+    reader.close()
+
+
+def test_reader_scans_without_the_index(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    write_log(path, [make_dialogue(i) for i in range(4)])
+    os.remove(path + ".idx")
+
+    reader = EpisodeLogReader(path)
+    assert len(reader) == 4
+    assert_same_dialogue(reader[2], make_dialogue(2))
+    reader.close()
+
+
+def test_reader_skips_a_truncated_last_frame(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    write_log(path, [make_dialogue(i) for i in range(4)])
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 5)
+
+    # The index points at the broken frame, so the reader falls back to a scan
+    reader = EpisodeLogReader(path)
+    assert len(reader) == 3
+    assert_same_dialogue(reader[-1], make_dialogue(2))
+    reader.close()
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = str(tmp_path / "dialogues.pkl")
+    with open(path, "wb") as file:
+        pickle.dump({"dialogues": []}, file)
+
+    assert not is_episode_log(path)
+    with pytest.raises(ValueError):
+        EpisodeLogReader(path)
+    with pytest.raises(ValueError):
+        EpisodeLogWriter(path)
+
+
+def test_recorder_loads_a_log_into_its_ring_buffer(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    write_log(path, [make_dialogue(i) for i in range(6)])
+
+    recorder = DialogueEpisodeRecorder(size=4, path=path)
+    assert len(recorder.dialogues) == 4
+    assert [int(d.action_encodings[0]) for d in recorder.dialogues] == [2, 3, 4, 5]
+
+
+def test_writer_cuts_off_a_partial_frame_before_continuing(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    write_log(path, [make_dialogue(i) for i in range(3)])
+    # A crash in the middle of writing the fourth frame
+    with open(path, "ab") as file:
+        data = pickle.dumps(make_dialogue(3), pickle.HIGHEST_PROTOCOL)
+        file.write(FRAME_HEADER.pack(len(data)) + data[:10])
+
+    write_log(path, [make_dialogue(i) for i in range(4, 6)])
+
+    reader = EpisodeLogReader(path)
+    assert [int(d.action_encodings[0]) for d in reader] == [0, 1, 2, 4, 5]
+    assert len(np.fromfile(path + ".idx", dtype="<u8")) == 5
+    # The index is consistent with the log, so no rescan is needed
+    np.testing.assert_array_equal(reader.offsets, reader.scan_offsets())
+    reader.close()
+
+
+def test_writer_rewrites_a_short_index(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    write_log(path, [make_dialogue(i) for i in range(3)])
+    with open(path + ".idx", "r+b") as file:
+        file.truncate(FRAME_HEADER.size)
+
+    write_log(path, [make_dialogue(3)])
+
+    assert len(np.fromfile(path + ".idx", dtype="<u8")) == 4
+    reader = EpisodeLogReader(path)
+    assert_same_dialogue(reader[3], make_dialogue(3))
+    reader.close()
+
+
+def test_recorder_close_closes_the_log(tmp_path):
+    path = str(tmp_path / "episodes.log")
+    recorder = DialogueEpisodeRecorder(log_path=path)
+    recorder.add_dialogue(make_dialogue(0))
+    writer = recorder.log_writer
+
+    recorder.close()
+    assert writer.file.closed and writer.index_file.closed
+    assert recorder.log_writer is None
+    assert len(EpisodeLogReader(path)) == 1
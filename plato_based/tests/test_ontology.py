@@ -0,0 +1,69 @@
+import json
+import sqlite3
+
+import numpy as np
+import pytest
+
+from ConversationalSingleAgentSimplified import build_domain_settings
+from Ontology import Ontology, OntologyIndex
+
+ONTOLOGY = {
+    "informable": {"area": ["north", "south"], "food": ["thai", "greek"]},
+    "requestable": ["area", "food", "phone"],
+}
+
+
+@pytest.fixture
+def ontology_path(tmp_path):
+    path = tmp_path / "ontology.json"
+    path.write_text(json.dumps(ONTOLOGY))
+    return str(path)
+
+
+def test_saved_index_loads_without_rebuilding(ontology_path, tmp_path, monkeypatch):
+    index = Ontology(ontology_path).compile()
+    index.save(str(tmp_path / "index.pkl"))
+
+    monkeypatch.setattr(
+        OntologyIndex, "__init__", lambda *args: pytest.fail("index rebuilt")
+    )
+    loaded = Ontology.from_index(str(tmp_path / "index.pkl"), ontology_path)
+
+    assert loaded.index.slots == index.slots
+    assert loaded.index.value_ids == index.value_ids
+    for category, mask in index.masks.items():
+        np.testing.assert_array_equal(loaded.index.masks[category], mask)
+    assert loaded.ontology["informable"] == ONTOLOGY["informable"]
+    assert loaded.ontology["system_requestable"] == ["area", "food"]
+
+
+def test_from_index_rejects_an_index_of_another_ontology(ontology_path, tmp_path):
+    Ontology(ontology_path).compile().save(str(tmp_path / "index.pkl"))
+
+    other_path = tmp_path / "other.json"
+    other_path.write_text(json.dumps({"informable": {"area": ["east"]}}))
+    with pytest.raises(ValueError):
+        Ontology.from_index(str(tmp_path / "index.pkl"), str(other_path))
+
+
+def test_build_domain_settings_recompiles_a_stale_index(ontology_path, tmp_path):
+    db_path = str(tmp_path / "restaurants.db")
+    connection = sqlite3.connect(db_path)
+    connection.execute("CREATE TABLE restaurants (area text, food text, phone text)")
+    connection.close()
+    config = {
+        "ontology_path": ontology_path,
+        "db_path": db_path,
+        "ontology_index_path": str(tmp_path / "index.pkl"),
+    }
+
+    ontology, _ = build_domain_settings(config)
+    assert ontology.index.values["area"] == ["north", "south"]
+
+    edited = dict(ONTOLOGY, informable=dict(ONTOLOGY["informable"], area=["east"]))
+    with open(ontology_path, "w") as file:
+        json.dump(edited, file)
+
+    ontology, _ = build_domain_settings(config)
+    assert ontology.index.values["area"] == ["east"]
+    assert OntologyIndex.load(config["ontology_index_path"]).values["area"] == ["east"]
@@ -0,0 +1,125 @@
+import json
+import random
+import sqlite3
+
+import pytest
+
+from run_plato_parallel import run_parallel_agent, schedule
+from run_plato_simplified import run_single_agent
+
+
+@pytest.mark.parametrize(
+    "num_dialogues, num_workers, sync_interval",
+    [(1, 1, 1), (10, 1, 1), (10, 3, 1), (10, 2, 3), (25, 4, 5), (7, 8, 2)],
+)
+def test_schedule_covers_every_dialogue_once(num_dialogues, num_workers, sync_interval):
+    rounds = schedule(num_dialogues, num_workers, sync_interval)
+
+    episodes = [
+        episode
+        for tasks in rounds
+        for first, n in tasks
+        for episode in range(first, first + n)
+    ]
+    assert episodes == list(range(num_dialogues))
+    for tasks in rounds:
+        assert len(tasks) <= num_workers
+        assert all(1 <= n <= sync_interval for _, n in tasks)
+    # Only the last round may be short
+    for tasks in rounds[:-1]:
+        assert sum(n for _, n in tasks) == num_workers * sync_interval
+
+
+def test_schedule_examples():
+    assert schedule(5, 2, 2) == [[(0, 2), (2, 2)], [(4, 1)]]
+    assert schedule(3, 1, 1) == [[(0, 1)], [(1, 1)], [(2, 1)]]
+    assert schedule(0, 2, 2) == []
+
+
+@pytest.fixture
+def domain(tmp_path):
+    """
+    A small restaurant domain: ontology file and SQLite database.
+    """
+    rng = random.Random(0)
+    areas = ["north", "south", "east", "west", "centre"]
+    foods = ["italian", "chinese", "indian", "thai", "french", "greek"]
+    prices = ["cheap", "moderate", "expensive"]
+    rows = [
+        (
+            "rest%d" % i,
+            rng.choice(areas),
+            rng.choice(foods),
+            rng.choice(prices),
+            "%d street" % i,
+            "01223%05d" % i,
+            "cb%d" % (i % 20),
+        )
+        for i in range(100)
+    ]
+
+    ontology = {
+        "informable": {
+            "area": areas,
+            "food": foods,
+            "pricerange": prices,
+            "name": [row[0] for row in rows],
+        },
+        "requestable": [
+            "addr",
+            "area",
+            "food",
+            "phone",
+            "pricerange",
+            "postcode",
+            "name",
+        ],
+    }
+    ontology_path = tmp_path / "ontology.json"
+    ontology_path.write_text(json.dumps(ontology))
+
+    db_path = tmp_path / "restaurants.db"
+    connection = sqlite3.connect(str(db_path))
+    connection.execute(
+        "CREATE TABLE CamRestaurants (name text, area text, food text, "
+        "pricerange text, addr text, phone text, postcode text)"
+    )
+    connection.executemany(
+        "INSERT INTO CamRestaurants VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+    )
+    connection.commit()
+    connection.close()
+
+    return tmp_path, str(ontology_path), str(db_path)
+
+
+def make_config(domain, name):
+    tmp_path, ontology_path, db_path = domain
+    return {
+        "GENERAL": {"seed": 3},
+        "DIALOGUE": {"ontology_path": ontology_path, "db_path": db_path},
+        "AGENT_0": {
+            "DM": {
+                "policy": {
+                    "type": "reinforce",
+                    "train": True,
+                    "learning_rate": 0.25,
+                    "exploration_rate": 0.3,
+                    "discount_factor": 0.95,
+                    "learning_decay_rate": 0.95,
+                    "exploration_decay_rate": 1.0,
+                    # Every run starts from fresh weights
+                    "policy_path": str(tmp_path / ("%s.pkl" % name)),
+                }
+            }
+        },
+    }
+
+
+def test_one_worker_with_sync_interval_1_is_the_single_agent_run(domain):
+    # Long enough for the policy to be trained (from dialogue 50 on) while
+    # the workers simulate
+    single = run_single_agent(make_config(domain, "single"), 120)
+    parallel = run_parallel_agent(make_config(domain, "parallel"), 120, 1, 1)
+
+    assert parallel == single